@@ -33,24 +33,41 @@ import os.path
 import numpy as np
 from scipy.sparse import csr_matrix
 from ..common.utils.dataobj import restore_data_object
+from ..common.utils.dataobj import restore_data_object_stream
 from ..common.utils.pickling import save_object
 from ..common.utils.pickling import restore_object
+from ..common.utils.parallel import set_num_threads
 from .core.emitting import EmittingAnalysis
 from .core.absorbing import AbsorbingAnalysis
 from .core.nchannel import NormChannelAnalysis
 from .core.laplacian import FullGraphLaplacian
+from .core.greens import precompute_greens_function
+from .core.greens import load_greens_laplacian
+from .core.greens import greens_params
+from .core.greens import matches_greens_params
+from .core.landmarks import LandmarkCache
 from .core.script import ScriptContext
+from .core.sweep import DampingSweep
+from .core.sweep import is_sweep_file
+from .core.sweep import sweep_dfs
+from .core.sweep import extract_sweep_slice
+from .core.bundle import is_bundle_file
+from .core.bundle import bundle_labels
+from .core.bundle import bundle_messages
+from .core.bundle import extract_bundle_slice
 from .core.script import connect_main_db
 from .output import formatted_table
 from .output import print_table_funcs
 from ..common.graphics.itm_graphics import make_layout
-from ..common.graphics.itm_graphics import render_one_color
-from ..common.graphics.itm_graphics import render_mixed_color
+from ..common.graphics.itm_graphics import DEFAULT_LAYOUT_ENGINE
+from ..common.graphics.itm_graphics import one_color_attrs
+from ..common.graphics.itm_graphics import mixed_color_attrs
 from ..common.graphics.itm_graphics import discretize_log_upper
 from ..common.graphics.itm_graphics import discretize_linear
 from ..common.graphics.itm_graphics import discretize_sqrt
 from ..common.graphics import image_processors as imp
 from ..common.graph.csrgraph import CSRDirectedGraph
+from ..common.graph.csrgraph import read_binary_graph
 
 
 model_classes = {'emitting': EmittingAnalysis,
@@ -60,16 +77,25 @@ model_classes = {'emitting': EmittingAnalysis,
 
 def graph_from_kwargs(kwargs, json_filename=None):
     """
-    Constructs a graph in CSR format either by loading from file or by using
-    supplied arguments.
+    Constructs a graph in CSR format either by loading from file (pickled or
+    binary - see DirectedGraph.tobinary()) or by using supplied arguments.
+    A graph already loaded by the caller can be passed as kwargs['G'].
     """
 
-    if 'graph_path' in kwargs:
+    if 'G' in kwargs:
+        G = kwargs['G']
+
+    elif 'graph_path' in kwargs:
         graph_path = kwargs.pop('graph_path')
         with open(graph_path, 'rb') as fp:
             G = CSRDirectedGraph(fp)
             G.filename = graph_path
 
+    elif 'graph_bin_path' in kwargs:
+        graph_path = kwargs.pop('graph_bin_path')
+        G = read_binary_graph(graph_path)
+        G.filename = graph_path
+
     elif 'graph' in kwargs:
         _gv = kwargs.pop('graph')
         nodes = _gv['nodes']
@@ -91,18 +117,101 @@ def graph_from_kwargs(kwargs, json_filename=None):
     kwargs['G'] = G
 
 
-def run(output_file, input_json_file):
+def greens_from_kwargs(kwargs):
+    """
+    If a precomputed Green's function is specified (as greens_path), opens it
+    for the graph kwargs['G'] and sets context_laplacian, df and
+    antisink_map accordingly. If kwargs specify a damping factor or
+    antisinks different from those of the Green's function, or a dissipation
+    target (da, ap or dr) without a damping factor, it is not used and the
+    model is solved directly.
+    """
+
+    if 'greens_path' in kwargs:
+        greens_path = kwargs.pop('greens_path')
+        params = greens_params(greens_path)
+        targets = [kwargs.get(name) for name in ('da', 'ap', 'dr')]
+        if not matches_greens_params(kwargs['G'], params, kwargs.get('df'),
+                                     kwargs.get('antisink_map'), targets):
+            return
+        SPL, df = load_greens_laplacian(kwargs['G'], greens_path)
+        kwargs['context_laplacian'] = SPL
+        kwargs['df'] = df
+        kwargs['antisink_map'] = params['antisink_map']
+
+
+def set_threads_from_kwargs(kwargs, num_threads=None):
+    """
+    Set the number of threads used by the solvers of this process to
+    num_threads or, if it is None, to kwargs['num_threads'] (if given). The
+    num_threads entry is removed from kwargs. The setting is process-wide, so
+    this is done once at start-up, before any model is evaluated.
+    """
+
+    input_threads = kwargs.pop('num_threads', None)
+    if num_threads is None:
+        num_threads = input_threads
+    if num_threads is not None:
+        set_num_threads(num_threads)
+
+
+def run(output_file, input_json_file, num_threads=None):
 
     kwargs = restore_data_object(input_json_file)
+    set_threads_from_kwargs(kwargs, num_threads)
 
     model_name = kwargs.pop('model')
     model_class = model_classes[model_name]
     graph_from_kwargs(kwargs, input_json_file)
+    greens_from_kwargs(kwargs)
 
     model = model_class(**kwargs)
     model.save(output_file)
 
 
+def greens(output_file, input_json_file, dtype='float32'):
+
+    kwargs = restore_data_object(input_json_file)
+    graph_from_kwargs(kwargs, input_json_file)
+    precompute_greens_function(kwargs['G'],
+                               kwargs['df'],
+                               kwargs.get('antisink_map'),
+                               output_file,
+                               kwargs.get('dtype', dtype))
+
+
+def export_graph(output_file, graph_file):
+    """
+    Write the graph from graph_file (a pickled graph, a binary graph or an
+    input in JSON format specifying the graph) in the binary format read by
+    read_binary_graph().
+    """
+
+    if graph_file.endswith('.json'):
+        kwargs = restore_data_object(graph_file)
+    elif graph_file.endswith('.bin'):
+        kwargs = {'graph_bin_path': graph_file}
+    else:
+        kwargs = {'graph_path': graph_file}
+    graph_from_kwargs(kwargs, graph_file)
+    kwargs['G'].tobinary(output_file)
+
+
+def sweep(output_file, input_json_file, num_threads=None):
+
+    kwargs = restore_data_object(input_json_file)
+    set_threads_from_kwargs(kwargs, num_threads)
+
+    model_name = kwargs.pop('model')
+    model_class = model_classes[model_name]
+    dfs = kwargs.pop('dfs')
+    graph_from_kwargs(kwargs, input_json_file)
+
+    G = kwargs.pop('G')
+    model_sweep = DampingSweep(model_class, G, dfs, **kwargs)
+    model_sweep.save(output_file)
+
+
 def table(script, databases, out_format='txt'):
 
     tbl_params = ['data', 'column_headers', 'column_formats', 'title']
@@ -151,6 +260,21 @@ def report_tables(databases, show_input_params=True, show_summary=True,
                   order_by='total_content', use_participation_ratio=True,
                   cutoff_value=None):
 
+    return list(iter_report_tables(databases, show_input_params,
+                                   show_summary, show_nodes,
+                                   show_excluded_nodes, max_rows, order_by,
+                                   use_participation_ratio, cutoff_value))
+
+
+def iter_report_tables(databases, show_input_params=True, show_summary=True,
+                       show_nodes=True, show_excluded_nodes=False,
+                       max_rows=40, order_by='total_content',
+                       use_participation_ratio=True, cutoff_value=None):
+    """
+    Generate the report tables (as report_tables()) one at a time, each as
+    soon as it is produced.
+    """
+
     tbl_params = ['data', 'column_headers', 'column_formats', 'title']
 
     script_vars = get_script_vars(max_rows, order_by, use_participation_ratio,
@@ -163,50 +287,64 @@ def report_tables(databases, show_input_params=True, show_summary=True,
 
     with ScriptContext(tbl_params, databases) as cntx:
         props = cntx.get_properties()
-        tables = []
 
         for key, do_it in script_params:
             if do_it:
                 script = load_default_script(props['base_default_script'],
                                              props[key])
                 kwargs = cntx.execute(script, script_vars)
-                tbl = formatted_table(**kwargs)
+                yield formatted_table(**kwargs)
             else:
-                tbl = None
-            tables.append(tbl)
+                yield None
         if show_excluded_nodes:
             script = load_default_script(None, 'excluded_nodes_default')
             kwargs = cntx.execute(script, script_vars)
-            tables.append(formatted_table(**kwargs))
-
-    return tables
+            yield formatted_table(**kwargs)
 
 
 def report(ITM_file, out_format='txt', show_input_params=True,
            show_summary=True, show_nodes=True, max_rows=40,
            order_by='total_content', use_participation_ratio=True,
-           cutoff_value=None):
+           cutoff_value=None, df=None, network=None, fp=None):
 
+    print_table = print_table_funcs[out_format]
 
-    databases = [ITM_file]
-    tables = report_tables(databases,
-                           show_input_params=show_input_params,
-                           show_summary=show_summary,
-                           show_nodes=show_nodes,
-                           max_rows=max_rows,
-                           order_by=order_by,
-                           use_participation_ratio=use_participation_ratio,
-                           cutoff_value=cutoff_value)
+    # Damping factor sweeps are reported one damping factor at a time - only
+    # for df if it is given. Similarly, multi-network bundles are reported
+    # one network at a time, preceded by the messages for all networks.
+    if is_sweep_file(ITM_file):
+        dfs = sweep_dfs(ITM_file) if df is None else [df]
+        database_list = [[extract_sweep_slice(ITM_file, x)] for x in dfs]
+    elif is_bundle_file(ITM_file):
+        labels = bundle_labels(ITM_file) if network is None else [network]
+        database_list = [[extract_bundle_slice(ITM_file, x)] for x in labels]
+        messages = [[label, msg] for label, msg in bundle_messages(ITM_file)
+                    if network is None or label == network]
+        if show_input_params and len(messages):
+            print_table('Network messages', ['Network', 'Message'], messages,
+                        fp=fp)
+    else:
+        database_list = [[ITM_file]]
 
-    print_table = print_table_funcs[out_format]
-    for tbl in tables:
-        if tbl is not None:
-            title, column_headers, body, _ = tbl
-            print_table(title, column_headers, body)
+    for databases in database_list:
+        tables = report_tables(databases,
+                               show_input_params=show_input_params,
+                               show_summary=show_summary,
+                               show_nodes=show_nodes,
+                               max_rows=max_rows,
+                               order_by=order_by,
+                               use_participation_ratio=use_participation_ratio,
+                               cutoff_value=cutoff_value)
+
+        for tbl in tables:
+            if tbl is not None:
+                title, column_headers, body, _ = tbl
+                print_table(title, column_headers, body, fp=fp)
 
 
 def custom_layout(output_file, script, databases, neato_executable='neato',
-                  neato_seed=None, script_vars=None):
+                  neato_seed=None, script_vars=None, layout_store=None,
+                  layout_engine=DEFAULT_LAYOUT_ENGINE, G=None):
 
     layout_params= ['shown_nodes', 'sources', 'sinks']
 
@@ -218,32 +356,49 @@ def custom_layout(output_file, script, databases, neato_executable='neato',
         kwargs = cntx.execute(script, script_vars)
 
 
-    graph_file_ext = os.path.splitext(props['graph_filename'])[1]
-    if graph_file_ext == '.json':
-        graph_kwargs = restore_data_object(props['graph_filename'])
-    elif graph_file_ext == '.pkl':
-        graph_kwargs = {'graph_path': props['graph_filename']}
-    else:
-        raise RuntimeError("Invalid graph filename extension")
-    graph_from_kwargs(graph_kwargs)
-    G = graph_kwargs['G']
+    # The graph is loaded from the file recorded in the databases unless an
+    # already loaded graph is supplied
+    if G is None:
+        graph_file_ext = os.path.splitext(props['graph_filename'])[1]
+        if graph_file_ext == '.json':
+            graph_kwargs = restore_data_object(props['graph_filename'])
+        elif graph_file_ext == '.pkl':
+            graph_kwargs = {'graph_path': props['graph_filename']}
+        elif graph_file_ext == '.bin':
+            graph_kwargs = {'graph_bin_path': props['graph_filename']}
+        else:
+            raise RuntimeError("Invalid graph filename extension")
+        graph_from_kwargs(graph_kwargs)
+        G = graph_kwargs['G']
 
     shown_nodes = [row[0] for row in kwargs['shown_nodes']]
     sources = [row[0] for row in kwargs['sources']]
     sinks = [row[0] for row in kwargs['sinks']]
+    if layout_store is not None:
+        # Shared store - return the layout id for later retrieval
+        layout_id, layout = make_layout(G, shown_nodes, sources, sinks,
+                                        neato_executable, neato_seed,
+                                        layout_store, layout_engine)
+        if output_file is not None:
+            save_object(layout, '', output_file, '')
+        return layout_id
+
     layout = make_layout(G, shown_nodes, sources, sinks,
-                         neato_executable, neato_seed)
+                         neato_executable, neato_seed,
+                         layout_engine=layout_engine)
     save_object(layout, '', output_file, '')
 
 
 def layout(output_file, databases, neato_executable='neato',
            neato_seed=None, max_rows=40, order_by='total_content',
-           use_participation_ratio=True, cutoff_value=None):
+           use_participation_ratio=True, cutoff_value=None,
+           layout_store=None, layout_engine=DEFAULT_LAYOUT_ENGINE, G=None):
 
     script_vars = get_script_vars(max_rows, order_by, use_participation_ratio,
                                   cutoff_value)
-    custom_layout(output_file, None, databases, neato_executable, neato_seed,
-                  script_vars)
+    return custom_layout(output_file, None, databases, neato_executable,
+                         neato_seed, script_vars, layout_store, layout_engine,
+                         G)
 
 
 def custom_image(output_file, layout_file, script, databases,
@@ -285,24 +440,35 @@ def custom_image(output_file, layout_file, script, databases,
                 for j in xrange(num_cols):
                     node_values[i, j] = row[j+1]
 
-        neato_out, legend_items = render_mixed_color(layout,
-                                                     img_proc.neato_option,
-                                                     node_values, bins)
+        nodes_attr, default_attr, legend_items = \
+            mixed_color_attrs(layout, node_values, bins)
     else: # one color only
         node_values = np.zeros(len(layout.shown_nodes), dtype='d')
         for row in kwargs['node_values']:
             node = row[0]
             if node in node2index:
                 node_values[node2index[node]] = row[1]
-        neato_out, legend_items = render_one_color(layout,
-                                                   img_proc.neato_option,
-                                                   node_values, bins, colormap)
+        nodes_attr, default_attr, legend_items = \
+            one_color_attrs(layout, node_values, bins, colormap)
+
+    def _write_image(fp):
+        # SVG images are written directly from the layout; other formats
+        # are rendered by neato
+        if img_proc.direct_svg:
+            img_proc.write_layout(layout, nodes_attr, default_attr, fp,
+                                  legend_items)
+        else:
+            neato_out = layout.render_colored(img_proc.neato_option,
+                                              nodes_attr, default_attr)
+            img_proc.process_stream(neato_out, fp, legend_items)
 
     if output_file == '-':
-        img_proc.process_stream(neato_out, sys.stdout, legend_items)
+        _write_image(sys.stdout)
+    elif hasattr(output_file, 'write'):
+        _write_image(output_file)
     else:
         with open(output_file, 'wb') as fp:
-            img_proc.process_stream(neato_out, fp, legend_items)
+            _write_image(fp)
 
 
 def image(output_file, layout_file, databases, colormap='Blues8',
@@ -360,20 +526,43 @@ def weights(databases, value_col):
     print_table(None, None, body)
 
 
-def standalone_run(input_json_file, out_fp=sys.stdout):
-
-    conn = connect_main_db(':memory:')
+def standalone_model(input_json_file, num_threads=None, G=None):
+    """
+    Run the model for the input with the full graph (read incrementally) and
+    return the in-memory database with the solution. The graph can also be
+    supplied separately as G (e.g. read by read_binary_graph()), in which
+    case the input need not contain it.
+    """
 
-    kwargs = restore_data_object(input_json_file)
+    kwargs = restore_data_object_stream(input_json_file,
+                                        ('data', 'indices', 'indptr'))
+    if G is not None:
+        kwargs['G'] = G
+    # The input may not change the settings of the process (which may be a
+    # server), so only the num_threads argument is used.
+    kwargs.pop('num_threads', None)
+    if num_threads is not None:
+        set_num_threads(num_threads)
     model_name = kwargs.pop('model')
     model_class = model_classes[model_name]
     graph_from_kwargs(kwargs, None)
+    greens_from_kwargs(kwargs)
 
     model = model_class(**kwargs)
+    conn = connect_main_db(':memory:')
     model.save(conn)
+    return conn
 
-    tables = report_tables([conn], max_rows=-1, use_participation_ratio=False,
-                           show_excluded_nodes=True)
+
+def standalone_report(conn, out_fp=None):
+    """ Write the full report for standalone_model() results to out_fp. """
+
+    if out_fp is None:
+        out_fp = sys.stdout
+
+    tables = iter_report_tables([conn], max_rows=-1,
+                                use_participation_ratio=False,
+                                show_excluded_nodes=True)
 
     print_table = print_table_funcs['tab']
     for tbl in tables:
@@ -381,29 +570,53 @@ def standalone_run(input_json_file, out_fp=sys.stdout):
             title, column_headers, body, _ = tbl
             print_table(title, column_headers, body, fp=out_fp)
 
-    conn.close()
 
+def standalone_run(input_json_file, out_fp=None, num_threads=None):
+
+    conn = standalone_model(input_json_file, num_threads)
+    try:
+        standalone_report(conn, out_fp)
+    finally:
+        conn.close()
 
-def batch_run(input_json_file):
+
+def batch_run(input_json_file, num_threads=None):
 
     # global_params - used to construct full graph laplacian
-    #   - graph, df, antisink_map
+    #   - graph, df, antisink_map (or greens_path)
+    #   - optionally landmarks_path (a LandmarkCache database) and
+    #     populate_landmarks (number of popular nodes to precompute)
+    #   - optionally num_threads (overridden by the num_threads argument)
     # Each query must specify output filename
 
     kwargs = restore_data_object(input_json_file)
 
-    # Construct a full graph laplacian from global parameters
+    # Construct a full graph laplacian from global parameters (or open a
+    # precomputed Green's function if given)
     global_params = kwargs['global_params']
-    df = global_params['df']
-    antisink_map = global_params['antisink_map']
+    set_threads_from_kwargs(global_params, num_threads)
     graph_from_kwargs(global_params)
     G = global_params['G']
-
-    W = G.weighted_adjacency_matrix()
-    alpha_out_map = dict( (G.node2index[p], antisink_map[p]) \
-                          for p in antisink_map if G.has_node(p) )
-    df_mask = W.get_df_mask(df, alpha_out_map, 1.0, None)
-    SPL = FullGraphLaplacian(W, df_mask)
+    greens_from_kwargs(global_params)
+    df = global_params.get('df')
+    if df is None:
+        raise RuntimeError('Batch runs require a fixed damping factor (df '
+                           'or a precomputed Green\'s function).')
+
+    landmarks = None
+    if 'context_laplacian' in global_params:
+        SPL = global_params['context_laplacian']
+    else:
+        antisink_map = global_params['antisink_map']
+        W = G.weighted_adjacency_matrix()
+        alpha_out_map = dict( (G.node2index[p], antisink_map[p]) \
+                              for p in antisink_map if G.has_node(p) )
+        df_mask = W.get_df_mask(df, alpha_out_map, 1.0, None)
+        if 'landmarks_path' in global_params:
+            landmarks = LandmarkCache(global_params['landmarks_path'])
+        SPL = FullGraphLaplacian(W, df_mask, landmarks)
+        if 'populate_landmarks' in global_params and landmarks is not None:
+            SPL.populate_landmarks(global_params['populate_landmarks'])
 
     for job_data in kwargs['jobs']:
 
@@ -411,10 +624,19 @@ def batch_run(input_json_file):
         output_file = job_data.pop('output_file')
         model_name = job_data.pop('model')
         job_kwargs.update(job_data)
+        if any(job_kwargs.get(name) is not None for name in ('da', 'ap', 'dr')):
+            raise RuntimeError('Dissipation targets (da, ap, dr) are not '
+                               'supported in batch runs, which share a '
+                               'fixed damping factor.')
         job_kwargs['G'] = G
         job_kwargs['df'] = df
+        # Threads are set once for the whole batch
+        job_kwargs.pop('num_threads', None)
 
         model_class = model_classes[model_name]
         model = model_class(**job_kwargs)
         model.save(output_file)
 
+    if landmarks is not None:
+        landmarks.close()
+
@@ -29,8 +29,14 @@
 
 import os
 import sqlite3
+import numpy as np
 from ... import version
 from ...common.utils.filesys import check_file_exists
+from ...common.utils.newton import rootfind_illinois
+from ...common.utils.newton import RootHistory
+from ...common.utils.parallel import get_num_threads
+from ...common.utils.parallel import solver_stats
+from .landmarks import laplacian_key
 
 db_schema = \
 """
@@ -88,6 +94,103 @@ CREATE TABLE H(
 );
 """
 
+# Results in single precision are saved as ordinary floats. SQLite stores
+# all REAL values in 8 bytes, so single precision does not reduce the size
+# of ITM files, only the memory held by the models.
+sqlite3.register_adapter(np.float32, float)
+
+# Damping factors found by previous searches. Used to warm-start the
+# searches for similar contexts. By default, the history is kept within the
+# process only (see set_df_history).
+df_history = RootHistory()
+
+# Function receiving the progress of model evaluation (see report_progress)
+_progress_callback = None
+
+
+def set_progress_callback(func):
+    """
+    Set the function called as func(stage, **info) to report the progress
+    of model evaluation, where stage is a short description and info gives
+    the details (e.g. the iteration of a damping factor search). If func is
+    None, the progress is not reported.
+    """
+
+    global _progress_callback
+    _progress_callback = func
+
+
+def set_df_history(history):
+    """
+    Set the history of damping factor searches (a RootHistory). Short-lived
+    processes, such as CGI requests and job runners, should use a history
+    stored on disk (SQLiteRootHistory) to benefit from the earlier searches.
+    """
+
+    global df_history
+    df_history = history
+
+
+def report_progress(stage, **info):
+
+    if _progress_callback is not None:
+        _progress_callback(stage, **info)
+
+
+def damping_search_key(mode, W, alpha_out_map):
+    """
+    Key identifying the network in df_history: a checksum of the adjacency
+    matrix W (structure and weights) together with the antisinks.
+    """
+
+    return (mode, laplacian_key(W._adjacency_matrix),
+            tuple(sorted(alpha_out_map.iteritems())))
+
+
+def find_damping_factor(root_func, network_key, context_key, target, x0=0.8,
+                        maxiter=50, tol=1.0e-11, x_max=1.0):
+    """
+    Find the damping factor in [0, 1] such that root_func(df)[0] == 0. The
+    function root_func must be increasing and return the pair (fval, args).
+
+    The search starts from the damping factor estimated from df_history for
+    the given network (see damping_search_key()), context and target. If the
+    context has not been seen before, the estimate for any context on the
+    same network is used and if there is no history at all, the search
+    starts from x0. A damping factor larger than x_max is rejected with a
+    RuntimeError. Otherwise, the result is recorded in df_history. Unless a
+    persistent history is set by set_df_history(), only the searches within
+    the current process are used.
+
+    Returns the damping factor and the args returned by root_func for it.
+    """
+
+    keys = [(network_key, context_key), (network_key,)]
+    for key in keys:
+        x_est = df_history.estimate(key, target)
+        if x_est is not None:
+            x, step = x_est, 1e-3
+            break
+    else:
+        x, step = x0, 0.05
+
+    num_iter = [0]
+    def _root_func(df):
+        num_iter[0] += 1
+        report_progress('Damping factor search', iteration=num_iter[0],
+                        df=df)
+        return root_func(df)
+
+    x, _, _, args = rootfind_illinois(_root_func, x, 0.0, 1.0, maxiter, tol,
+                                      step)
+    if x > x_max:
+        raise RuntimeError('The damping factor found is too close to 1 leading '
+                           'to numerical instability.')
+    for key in keys:
+        df_history.record(key, target, x)
+    return x, args
+
+
 class BasicITM(object):
     """
     Base for all models.
@@ -100,9 +203,25 @@ class BasicITM(object):
     summary_default_script = None
     nodes_default_script = None
     layout_default_script = None
+    approximate = False
+    errors = None
+    ci = None
+    top_nodes = None
+    num_threads = None
+    concurrency = None
 
     def __init__(self, G, excluded_nodes, source_nodes, sink_nodes,
-                 extra_input_params=None):
+                 extra_input_params=None, precision='double'):
+
+        if precision not in ('double', 'single'):
+            raise RuntimeError('Precision must be either double or single.')
+        self.precision = precision
+
+        # Number of threads used to solve blocks of right hand sides. This is
+        # a process-wide setting, made at start-up (see
+        # common.utils.parallel.set_num_threads()).
+        self.num_threads = get_num_threads()
+        self._solver_stats = solver_stats()
 
         self.source_nodes = source_nodes
         self.sink_nodes = sink_nodes
@@ -186,6 +305,74 @@ class BasicITM(object):
         """Print context information."""
         raise NotImplementedError
 
+    @property
+    def dtype(self):
+        """
+        NumPy type of the right hand side blocks and the results.
+        """
+
+        return 'f' if self.precision == 'single' else 'd'
+
+    def _apply_precision(self):
+        """
+        Convert the results to single precision if requested. The systems
+        are always factorized and solved in double precision, but with a
+        fixed damping factor the right hand side blocks and the solutions
+        are already kept in single precision.
+        """
+
+        if self.precision == 'single':
+            for name in ('F', 'H'):
+                if hasattr(self, name):
+                    setattr(self, name,
+                            getattr(self, name).astype('f', copy=False))
+
+    def _record_solver_stats(self):
+        """
+        Record the concurrency of the parallel block solves of the model.
+        The statistics are shared by all threads, so they may include the
+        solves of other models evaluated at the same time.
+        """
+
+        stats = solver_stats(since=self._solver_stats)
+        if stats['columns'] > 0:
+            self.concurrency = stats['concurrency']
+
+    def _rank_nodes(self, total, boundary_ixs, top_k):
+        """
+        Indices of the top_k nodes with the largest total, excluding
+        the boundary nodes (None if top_k is None).
+        """
+
+        if top_k is None:
+            return None
+        boundary_ixs = set(boundary_ixs)
+        order = [i for i in (-total).argsort(kind='mergesort')
+                 if i not in boundary_ixs]
+        return order[:top_k]
+
+    def _set_top_nodes(self, top, lower, upper):
+        """
+        Record the top nodes found by approximate evaluation as a list of
+        triples (node, lower, upper), where lower and upper bound the total of
+        the node over all boundary nodes.
+        """
+
+        if top is None:
+            return
+        self.top_nodes = [(self.G.nodes[i], lower[i], upper[i]) for i in top]
+
+    def _report_approximation(self):
+
+        if not self.approximate:
+            return []
+        elif self.approximate == 'montecarlo':
+            return ['Approximation: Monte Carlo, %d walks per boundary node '
+                    '(95%% confidence half-width %.2g)' % \
+                    (self.num_walks, max(list(self.errors) + [0.0]))]
+        return ['Approximation: Residual push (max. error %.2g)' % \
+                max(list(self.errors) + [0.0])]
+
     def _input_params(self):
 
         graph_data = '%s (%d nodes, %d links)' %\
@@ -198,4 +385,11 @@ class BasicITM(object):
                [['Graph', graph_data]] + \
                [line.split(':') for line in self.report_contexts()] + \
                [['Excluded nodes', len(self.excluded_nodes)]]
+        if self.precision == 'single':
+            data.append(['Precision', 'Single'])
+        if self.num_threads is not None and self.num_threads > 1:
+            threads = '%d' % self.num_threads
+            if self.concurrency is not None:
+                threads += ' (concurrency %.2f)' % self.concurrency
+            data.append(['Solver threads', threads])
         return data
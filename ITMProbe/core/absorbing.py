@@ -28,15 +28,19 @@
 
 import numpy as np
 from . import BasicITM
+from . import find_damping_factor
+from . import damping_search_key
 from .laplacian import BasicLaplacian
-from ...common.utils.newton import rootfind_newton
+from .greens import GreensFunctionLaplacian
+from .push import ResidualPush
+from .montecarlo import RandomWalkSampler
+from .montecarlo import sample_walks
 
 
 def evaluate_context(SPL, sink_ixs):
 
-    F = np.zeros((SPL.L.shape[0],len(sink_ixs)), 'd')
+    F = SPL.solve_boundary_cols(sink_ixs)
     for i, k in enumerate(sink_ixs):
-        F[:,i] = SPL.solve(SPL.boundary_col_data[:,i], True)
         F[sink_ixs,i] = 0.0
         F[k,i] = 1.0
     return F
@@ -61,11 +65,13 @@ def _get_disconnected_ixs(W, sink_ixs, alpha_out_map):
 
 
 def _process_context_SPL(sink_ixs, SPL):
+    if isinstance(SPL, GreensFunctionLaplacian):
+        return SPL.absorbing_context(sink_ixs)
     SPL.set_boundary_ixs(sink_ixs)
     return evaluate_context(SPL, sink_ixs)
 
 
-def _process_context_df(W, sink_ixs, alpha_out_map, df):
+def _process_context_df(W, sink_ixs, alpha_out_map, df, dtype='d'):
 
     disconnected_ixs = [] if df <= (1.0 - 1e-14) else \
                        _get_disconnected_ixs(W, sink_ixs, alpha_out_map)
@@ -74,9 +80,35 @@ def _process_context_df(W, sink_ixs, alpha_out_map, df):
     alpha_out_map2.update(alpha_in_map2)
 
     df_mask = W.get_df_mask(df, alpha_out_map2, 1.0, alpha_in_map2)
-    SPL = BasicLaplacian(W, df_mask, boundary_cols=sink_ixs)
+    SPL = BasicLaplacian(W, df_mask, boundary_cols=sink_ixs, dtype=dtype)
     return evaluate_context(SPL, sink_ixs)
 
+def _process_context_push(W, sink_ixs, alpha_out_map, df, accuracy,
+                          top_k=None):
+
+    row_df = df * np.ones(len(W.nodes), 'd')
+    for i, alpha in alpha_out_map.iteritems():
+        row_df[i] = alpha
+    solver = ResidualPush(W, row_df, sink_ixs, True)
+    F, errors, top = solver.solve(accuracy, top_k)
+    for i, k in enumerate(sink_ixs):
+        F[k,i] = 1.0
+    return F, errors, top
+
+
+def _process_context_walks(W, sink_ixs, alpha_out_map, df, num_walks,
+                           seed=None, num_processes=1):
+
+    row_df = df * np.ones(len(W.nodes), 'd')
+    for i, alpha in alpha_out_map.iteritems():
+        row_df[i] = alpha
+    sampler = RandomWalkSampler(W, row_df, sink_ixs)
+    F, ci, total_ci = sample_walks(sampler, True, num_walks, seed=seed,
+                                   num_processes=num_processes)
+    for i, k in enumerate(sink_ixs):
+        F[k,i] = 1.0
+    return F, ci, total_ci
+
 
 def _process_context_mu_newton(W,
                                sink_ixs,
@@ -105,14 +137,13 @@ def _process_context_mu_newton(W,
         v[sink_ixs] = 0.0
         G_col_sum = SPL.solve(v, False)
         F_col_sum = np.dot(G_col_sum, SPL.boundary_col_data)
-        Gsq_col_sum = SPL.solve(G_col_sum, False)
-        GF_col_sum = np.dot(Gsq_col_sum, SPL.boundary_col_data)
 
         fval = F_col_sum.sum() / n - target_absorption_prob
-        fpval = GF_col_sum.sum() / n / x0
-        return fval, fpval, SPL
+        return fval, SPL
 
-    x, _, _, SPL =  rootfind_newton(_root_func, 0.85, 0.0, 1.0, maxiter, tol)
+    network_key = damping_search_key('absorbing', W, alpha_out_map)
+    x, SPL = find_damping_factor(_root_func, network_key, len(sink_ixs),
+                                 target_absorption_prob, 0.85, maxiter, tol)
     F = evaluate_context(SPL, sink_ixs)
     return x, n, F
 
@@ -128,10 +159,18 @@ class AbsorbingAnalysis(BasicITM):
     mode = 'absorbing'
 
     def __init__(self, G, sink_nodes, df=1.0, antisink_map=None, ap=None,
-                 context_laplacian=None, **kwargs):
+                 context_laplacian=None, approximate=False, accuracy=1e-4,
+                 top_k=None, num_walks=1000, seed=None, num_processes=1,
+                 **kwargs):
 
         if df is None and ap is None:
             raise RuntimeError('Invalid specification of dissipation.')
+        if approximate not in (False, True, 'push', 'montecarlo'):
+            raise RuntimeError('Unknown approximation method: %s.' %
+                               approximate)
+        if approximate and df is None:
+            raise RuntimeError('Approximate evaluation requires a fixed '
+                               'damping factor.')
 
         if antisink_map is None:
             antisink_map = dict()
@@ -143,14 +182,22 @@ class AbsorbingAnalysis(BasicITM):
 
         self.df = df
         self.ap = ap
+        self.approximate = approximate
+        self.accuracy = accuracy
+        self.top_k = top_k
+        self.num_walks = num_walks
+        self.seed = seed
+        self.num_processes = num_processes
 
         self._solve_boundary_problem(G, antisink_map, context_laplacian)
+        self._record_solver_stats()
+        self._apply_precision()
 
     def _solve_boundary_problem(self, G, antisink_map, SPL=None):
 
         sink_ixs = [G.node2index[node] for node in self.sink_nodes]
 
-        if SPL is not None:
+        if SPL is not None and not self.approximate:
             # Use the laplacian provided - no need to recreate it.
             self.F = _process_context_SPL(sink_ixs, SPL)
 
@@ -159,7 +206,30 @@ class AbsorbingAnalysis(BasicITM):
             alpha_out_map = dict( (G.node2index[p], antisink_map[p]) \
                                   for p in antisink_map if G.has_node(p) )
 
-            if self.df is None:
+            if self.approximate == 'montecarlo':
+                self.F, self.ci, total_ci = \
+                    _process_context_walks(W,
+                                           sink_ixs,
+                                           alpha_out_map,
+                                           self.df,
+                                           self.num_walks,
+                                           self.seed,
+                                           self.num_processes)
+                self.errors = self.ci.max(0)
+                total = self.F.sum(1)
+                top = self._rank_nodes(total, sink_ixs, self.top_k)
+                self._set_top_nodes(top, total - total_ci, total + total_ci)
+            elif self.approximate:
+                self.F, self.errors, top = \
+                    _process_context_push(W,
+                                          sink_ixs,
+                                          alpha_out_map,
+                                          self.df,
+                                          self.accuracy,
+                                          self.top_k)
+                total = self.F.sum(1)
+                self._set_top_nodes(top, total, total + self.errors.sum())
+            elif self.df is None:
                 self.df, self.connected_nodes, self.F = \
                     _process_context_mu_newton(W,
                                                sink_ixs,
@@ -169,11 +239,13 @@ class AbsorbingAnalysis(BasicITM):
                 self.F = _process_context_df(W,
                                              sink_ixs,
                                              alpha_out_map,
-                                             self.df)
+                                             self.df,
+                                             self.dtype)
 
     def report_contexts(self):
         return [ 'Absorbing boundary: [%s] (Dissipation=%.2g)' % \
-                  (', '.join(map(str,self.sink_nodes)),1.0-self.df) ]
+                  (', '.join(map(str,self.sink_nodes)),1.0-self.df) ] + \
+               self._report_approximation()
 
     def _save_mode(self, conn):
 
@@ -0,0 +1,157 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+"""
+Bundles of ITM Probe results computed for the same query on several networks.
+
+The ITMs are saved into a single SQLite container. Since the nodes differ
+between networks, every table of the standard ITM schema gets an additional
+bundleid column referring to the bundle table, which lists the network
+labels. Networks where the query could not be evaluated are also listed,
+together with the reasons, so that the bundle always covers the full
+request. A standard ITM for one network can be extracted using
+extract_bundle_slice().
+"""
+
+import sqlite3
+from .container import create_container
+from .container import copy_itm
+from .container import has_table
+from .container import query_column
+from .container import extract_itm
+
+# Columns of all tables in the standard ITM schema
+_bundle_tables = [('shown_params', ['rnk', 'property', 'value']),
+                  ('properties', ['property', 'value']),
+                  ('nodes', ['nodeid', 'name']),
+                  ('sources', ['sourceid', 'nodeid', 'coeff']),
+                  ('sinks', ['sinkid', 'nodeid', 'coeff']),
+                  ('damping', ['nodeid', 'dfout', 'dfin']),
+                  ('F', ['nodeid', 'sinkid', 'val']),
+                  ('H', ['sourceid', 'nodeid', 'val']),
+                  ]
+
+bundle_schema = \
+"""
+CREATE TABLE bundle(
+  bundleid      INTEGER PRIMARY KEY,
+  label         TEXT,
+  evaluated     INTEGER
+);
+
+CREATE TABLE bundle_messages(
+  bundleid      INTEGER,
+  message       TEXT,
+  FOREIGN KEY(bundleid) REFERENCES bundle(bundleid)
+);
+"""
+
+
+def save_bundle(sqlite_db, items):
+    """
+    Save ITMs into SQLite container. The items are triples (label, ITM,
+    messages), where ITM is either an ITM file or an SQLite connection to it,
+    or None if the query could not be evaluated. If sqlite_db exists, it is
+    removed before being reinitialized.
+    """
+
+    conn = create_container(sqlite_db, bundle_schema, _bundle_tables,
+                            'bundleid')
+    cur = conn.cursor()
+    for bundleid, (label, itm, messages) in enumerate(items):
+        cur.execute('INSERT INTO bundle VALUES (?, ?, ?)',
+                    (bundleid, label, int(itm is not None)))
+        cur.executemany('INSERT INTO bundle_messages VALUES (?, ?)',
+                        [(bundleid, msg) for msg in messages])
+        if itm is None:
+            continue
+
+        if isinstance(itm, sqlite3.Connection):
+            src_conn = itm
+        else:
+            src_conn = sqlite3.connect(itm)
+            src_conn.text_factory = str
+        copy_itm(src_conn, conn, _bundle_tables, bundleid)
+        if src_conn is not itm:
+            src_conn.close()
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def is_bundle_file(sqlite_db):
+    """Checks whether sqlite_db is a multi-network bundle."""
+
+    return has_table(sqlite_db, 'bundle')
+
+
+def bundle_labels(sqlite_db, evaluated_only=True):
+    """
+    Returns the list of network labels stored in the bundle (by default,
+    only those where the query was evaluated).
+    """
+
+    sql = 'SELECT label FROM bundle'
+    if evaluated_only:
+        sql += ' WHERE evaluated = 1'
+    return query_column(sqlite_db, sql + ' ORDER BY bundleid')
+
+
+def bundle_messages(sqlite_db):
+    """
+    Returns the list of (label, message) pairs with the warnings and errors
+    arising from evaluation of the query on each network.
+    """
+
+    conn = sqlite3.connect(sqlite_db)
+    conn.text_factory = str
+    messages = conn.execute('SELECT label, message FROM bundle_messages '
+                            'JOIN bundle USING (bundleid) '
+                            'ORDER BY bundleid, bundle_messages.rowid').fetchall()
+    conn.close()
+    return messages
+
+
+def extract_bundle_slice(sqlite_db, label):
+    """
+    Extracts the ITM for the network with the given label from the bundle
+    sqlite_db. Returns an in-memory SQLite connection with the standard ITM
+    tables, which can be passed to the report functions in place of an ITM
+    file.
+    """
+
+    bundleids = query_column(sqlite_db, 'SELECT bundleid FROM bundle WHERE '
+                             'label = ? AND evaluated = 1', (label, ))
+    if not bundleids:
+        available = ', '.join(bundle_labels(sqlite_db))
+        raise RuntimeError('No results for network %s in bundle (available: '
+                           '%s).' % (label, available))
+    return extract_itm(sqlite_db, _bundle_tables, 'bundleid', bundleids[0])
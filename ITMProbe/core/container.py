@@ -0,0 +1,139 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+"""
+SQLite containers holding several ITMs (see sweep and bundle).
+
+A container has an index table listing its members and stores the tables of
+the standard ITM schema with an additional key column referring to the
+index. The tables that are the same for all members may be stored once,
+without the key column. The functions here create such containers, copy
+ITMs into them and extract the ITM of a single member.
+"""
+
+import os
+import sqlite3
+from . import db_schema
+from .script import connect_main_db
+from ...common.utils.filesys import check_file_exists
+
+
+def create_container(sqlite_db, schema, keyed_tables, key, shared_tables=()):
+    """
+    Create the container sqlite_db (removing it first if it exists) with the
+    index tables given by schema. The tables in keyed_tables (pairs of table
+    name and the list of columns of the standard ITM schema) get the extra
+    first column key, while those in shared_tables are as in the standard
+    schema. Returns the connection.
+    """
+
+    if check_file_exists(sqlite_db):
+        os.remove(sqlite_db)
+    conn = sqlite3.connect(sqlite_db)
+    conn.text_factory = str
+    cur = conn.cursor()
+    if shared_tables:
+        cur.executescript(db_schema)
+        for tbl, cols in keyed_tables:
+            cur.execute('DROP TABLE %s' % tbl)
+    cur.executescript(schema)
+    for tbl, cols in keyed_tables:
+        cur.execute('CREATE TABLE %s(%s INTEGER, %s)' % \
+                    (tbl, key, ', '.join(cols)))
+    cur.close()
+    return conn
+
+
+def copy_itm(src_conn, dst_conn, keyed_tables, key_value, shared_tables=()):
+    """
+    Copy the tables of the ITM open as src_conn into the container
+    dst_conn, setting the key column of keyed_tables to key_value. The
+    shared_tables are copied as they are.
+    """
+
+    for tbl in shared_tables:
+        _copy_rows(src_conn, dst_conn, tbl, 'SELECT * FROM %s' % tbl)
+    for tbl, cols in keyed_tables:
+        sql = 'SELECT %d, %s FROM %s' % (key_value, ', '.join(cols), tbl)
+        _copy_rows(src_conn, dst_conn, tbl, sql)
+
+
+def _copy_rows(src_conn, dst_conn, tbl, select_sql):
+
+    src_cur = src_conn.execute(select_sql)
+    num_cols = len(src_cur.description)
+    dst_conn.executemany('INSERT INTO %s VALUES (%s)' % \
+                         (tbl, ', '.join(['?'] * num_cols)), src_cur)
+    src_cur.close()
+
+
+def has_table(sqlite_db, name):
+    """Checks whether the SQLite database sqlite_db has the table name."""
+
+    conn = sqlite3.connect(sqlite_db)
+    row = conn.execute("SELECT count(*) FROM sqlite_master WHERE "
+                       "type='table' AND name=?", (name, )).fetchone()
+    conn.close()
+    return row[0] > 0
+
+
+def query_column(sqlite_db, sql, args=()):
+    """Returns the list of the values of the first column of the query."""
+
+    conn = sqlite3.connect(sqlite_db)
+    conn.text_factory = str
+    values = [row[0] for row in conn.execute(sql, args)]
+    conn.close()
+    return values
+
+
+def extract_itm(sqlite_db, keyed_tables, key, key_value, shared_tables=()):
+    """
+    Extract the ITM with the given value of the key column from the
+    container sqlite_db. Returns an in-memory SQLite connection with the
+    standard ITM tables, which can be passed to the report functions in
+    place of an ITM file.
+    """
+
+    conn = connect_main_db(':memory:')
+    cur = conn.cursor()
+    cur.executescript(db_schema)
+    cur.execute('ATTACH DATABASE ? AS container', (sqlite_db, ))
+    for tbl in shared_tables:
+        cur.execute('INSERT INTO main.%s SELECT * FROM container.%s' % \
+                    (tbl, tbl))
+    for tbl, cols in keyed_tables:
+        cols = ', '.join(cols)
+        cur.execute('INSERT INTO main.%s (%s) SELECT %s FROM container.%s '
+                    'WHERE %s = ?' % (tbl, cols, cols, tbl, key), (key_value, ))
+    conn.commit()
+    cur.execute('DETACH DATABASE container')
+    cur.close()
+    return conn
@@ -28,31 +28,63 @@
 
 import numpy as np
 from . import BasicITM
+from . import find_damping_factor
+from . import damping_search_key
 from .laplacian import BasicLaplacian
-from ...common.utils.newton import rootfind_newton
+from .greens import GreensFunctionLaplacian
+from .push import ResidualPush
+from .montecarlo import RandomWalkSampler
+from .montecarlo import sample_walks
 
 def evaluate_context(SPL, source_ixs):
 
-    H = np.zeros((SPL.L.shape[0],len(source_ixs)), 'd')
+    H = SPL.solve_boundary_rows(source_ixs)
     for j, s in enumerate(source_ixs):
-        H[:,j] = SPL.solve(SPL.get_boundary_row(s), False)
         H[source_ixs,j] = 0.0
         H[s,j] = 1.0
     return H
 
 def _process_context_SPL(source_ixs, SPL):
+    if isinstance(SPL, GreensFunctionLaplacian):
+        return SPL.emitting_context(source_ixs)
     SPL.set_boundary_ixs(source_ixs)
     return evaluate_context(SPL, source_ixs)
 
-def _process_context_df(W, source_ixs, alpha_out_map, df):
+def _process_context_df(W, source_ixs, alpha_out_map, df, dtype='d'):
 
     if df > (1.0 - 1e-3):
         raise RuntimeError('Cannot evaluate a context with a damping factor'
                            ' too close to 1.')
     df_mask = W.get_df_mask(df, alpha_out_map, 1.0, None)
-    SPL = BasicLaplacian(W, df_mask, boundary_rows=source_ixs)
+    SPL = BasicLaplacian(W, df_mask, boundary_rows=source_ixs, dtype=dtype)
     return evaluate_context(SPL, source_ixs)
 
+def _process_context_push(W, source_ixs, alpha_out_map, df, accuracy,
+                          top_k=None):
+
+    row_df = df * np.ones(len(W.nodes), 'd')
+    for i, alpha in alpha_out_map.iteritems():
+        row_df[i] = alpha
+    solver = ResidualPush(W, row_df, source_ixs, False)
+    H, errors, top = solver.solve(accuracy, top_k)
+    for j, s in enumerate(source_ixs):
+        H[s,j] = 1.0
+    return H, errors, top
+
+
+def _process_context_walks(W, source_ixs, alpha_out_map, df, num_walks,
+                           seed=None, num_processes=1):
+
+    row_df = df * np.ones(len(W.nodes), 'd')
+    for i, alpha in alpha_out_map.iteritems():
+        row_df[i] = alpha
+    sampler = RandomWalkSampler(W, row_df, source_ixs)
+    H, ci, total_ci = sample_walks(sampler, False, num_walks, seed=seed,
+                                   num_processes=num_processes)
+    for j, s in enumerate(source_ixs):
+        H[s,j] = 1.0
+    return H, ci, total_ci
+
 
 def _process_context_mu_newton(W,
                                source_ixs,
@@ -81,18 +113,10 @@ def _process_context_mu_newton(W,
         v[source_ixs] = 0.0
         G_row_sum = SPL.solve(v, True)
         H_row_sum = np.dot(SPL.boundary_row_data, G_row_sum)
-        Gsq_row_sum = SPL.solve(G_row_sum, True)
-        HG_row_sum = np.dot(SPL.boundary_row_data, Gsq_row_sum)
         m = len(source_ixs)
 
         fval = H_row_sum.sum() / m - target_avg_path_length
-        fpval = HG_row_sum.sum() / m / x0
-
-        return fval, fpval, SPL
-
-    a = 0.0   # lower bound for df
-    b = 1.0   # upper bound for df - see comment below
-    x0 = 0.8  # starting guess
+        return fval, SPL
 
     # There are two cases to be considered w.r.t. upper bound:
     #
@@ -108,11 +132,10 @@ def _process_context_mu_newton(W,
     #       value very close to 1.0 with path length close to maximal
     #       possible.
 
-    x, _, _, SPL =  rootfind_newton(_root_func, x0, a, b, maxiter, tol)
-
-    if x > (1.0 - 1e-3):
-        raise RuntimeError('The damping factor found is too close to 1 leading '
-                           'to numerical instability.')
+    network_key = damping_search_key('emitting', W, alpha_out_map)
+    x, SPL = find_damping_factor(_root_func, network_key, len(source_ixs),
+                                 target_avg_path_length, 0.8, maxiter, tol,
+                                 x_max=1.0 - 1e-3)
 
     H = evaluate_context(SPL, source_ixs)
     return x, H
@@ -129,10 +152,18 @@ class EmittingAnalysis(BasicITM):
     mode = 'emitting'
 
     def __init__(self, G, source_nodes, df=1.0, antisink_map=None, da=None,
-                 context_laplacian=None, **kwargs):
+                 context_laplacian=None, approximate=False, accuracy=1e-4,
+                 top_k=None, num_walks=1000, seed=None, num_processes=1,
+                 **kwargs):
 
         if df is None and da is None:
             raise RuntimeError('Invalid specification of dissipation.')
+        if approximate not in (False, True, 'push', 'montecarlo'):
+            raise RuntimeError('Unknown approximation method: %s.' %
+                               approximate)
+        if approximate and df is None:
+            raise RuntimeError('Approximate evaluation requires a fixed '
+                               'damping factor.')
 
         if antisink_map is None:
             antisink_map = dict()
@@ -145,14 +176,22 @@ class EmittingAnalysis(BasicITM):
 
         self.df = df
         self.da = da
+        self.approximate = approximate
+        self.accuracy = accuracy
+        self.top_k = top_k
+        self.num_walks = num_walks
+        self.seed = seed
+        self.num_processes = num_processes
 
         self._solve_boundary_problem(G, antisink_map, context_laplacian)
+        self._record_solver_stats()
+        self._apply_precision()
 
     def _solve_boundary_problem(self, G, antisink_map, SPL=None):
 
         source_ixs = [G.node2index[node] for node in self.source_nodes]
 
-        if SPL is not None:
+        if SPL is not None and not self.approximate:
             # Use the laplacian provided - no need to recreate it.
             self.H = _process_context_SPL(source_ixs, SPL)
 
@@ -161,7 +200,30 @@ class EmittingAnalysis(BasicITM):
             alpha_out_map = dict( (G.node2index[p], antisink_map[p]) \
                                   for p in antisink_map if G.has_node(p) )
 
-            if self.df is None:
+            if self.approximate == 'montecarlo':
+                self.H, self.ci, total_ci = \
+                    _process_context_walks(W,
+                                           source_ixs,
+                                           alpha_out_map,
+                                           self.df,
+                                           self.num_walks,
+                                           self.seed,
+                                           self.num_processes)
+                self.errors = self.ci.max(0)
+                total = self.H.sum(1)
+                top = self._rank_nodes(total, source_ixs, self.top_k)
+                self._set_top_nodes(top, total - total_ci, total + total_ci)
+            elif self.approximate:
+                self.H, self.errors, top = \
+                    _process_context_push(W,
+                                          source_ixs,
+                                          alpha_out_map,
+                                          self.df,
+                                          self.accuracy,
+                                          self.top_k)
+                total = self.H.sum(1)
+                self._set_top_nodes(top, total, total + self.errors.sum())
+            elif self.df is None:
                 self.df, self.H = _process_context_mu_newton(W,
                                                              source_ixs,
                                                              alpha_out_map,
@@ -170,12 +232,13 @@ class EmittingAnalysis(BasicITM):
                 self.H = _process_context_df(W,
                                              source_ixs,
                                              alpha_out_map,
-                                             self.df)
+                                             self.df,
+                                             self.dtype)
 
     def report_contexts(self):
         return [ 'Context: [%s] (Dissipation=%.2g)' % \
                  (', '.join(map(str,self.source_nodes)),
-                  1.0-self.df) ]
+                  1.0-self.df) ] + self._report_approximation()
 
     def _save_mode(self, conn):
 
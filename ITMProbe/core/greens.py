@@ -0,0 +1,226 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+Precomputed dense Green's functions.
+
+For graphs with a few thousand nodes, the Green's function of the whole
+graph (the inverse of its Laplacian, with dissipation at every node) fits
+into memory. It is computed once for the given damping factor and
+antisinks, using block solves with a single factorization, and saved as a
+NumPy .npy file, together with a JSON file describing the parameters. The
+saved file is later opened as a read-only memory map, so it is shared by
+all processes using it.
+
+With G the Green's function of the whole graph and B the boundary, the
+solutions of the emitting and absorbing models are
+
+  H = inv(G[B,B]) * G[B,:]   (rows, one per source),
+  F = G[:,B] * inv(G[B,B])   (columns, one per sink),
+
+obtained by splitting the walks at their first (for F) or last (for H)
+visit to the boundary. They require only slicing of G and dense algebra
+with small matrices.
+"""
+
+import os.path
+import numpy as np
+from numpy.lib.format import open_memmap
+from scipy.sparse.linalg import dsolve
+from .laplacian import BasicLaplacian
+from .laplacian import FullGraphLaplacian
+from ...common.utils.dataobj import save_data_object
+from ...common.utils.dataobj import restore_data_object
+
+
+def _params_file(greens_file):
+    return os.path.splitext(greens_file)[0] + '.json'
+
+
+def _full_graph_df_mask(G, W, df, antisink_map):
+
+    alpha_out_map = dict( (G.node2index[p], antisink_map[p]) \
+                          for p in antisink_map if G.has_node(p) )
+    return W.get_df_mask(df, alpha_out_map, 1.0, None)
+
+
+def precompute_greens_function(G, df, antisink_map, greens_file,
+                               dtype='float32', block_size=256):
+    """
+    Compute the Green's function of the whole graph G with damping factor df
+    and antisinks given by antisink_map and save it into greens_file (a .npy
+    file). The parameters are saved into the JSON file with the same name
+    and the extension .json.
+    """
+
+    if antisink_map is None:
+        antisink_map = {}
+    if df >= 1.0:
+        raise RuntimeError('The Green\'s function of the whole graph requires '
+                           'a damping factor smaller than 1.')
+
+    W = G.weighted_adjacency_matrix()
+    df_mask = _full_graph_df_mask(G, W, df, antisink_map)
+    num_nodes = len(W.nodes)
+    nnz = W.nnz
+
+    SPL = BasicLaplacian(W, df_mask)
+    lu = dsolve.splu(SPL.L.tocsc(), permc_spec='MMD_AT_PLUS_A')
+
+    greens = open_memmap(greens_file, mode='w+', dtype=dtype,
+                         shape=(num_nodes, num_nodes))
+    for start in xrange(0, num_nodes, block_size):
+        end = min(start + block_size, num_nodes)
+        rhs = np.zeros((num_nodes, end - start), dtype)
+        rhs[np.arange(start, end), np.arange(end - start)] = 1.0
+        greens[:, start:end] = lu.solve(rhs)
+    greens.flush()
+    del greens
+
+    params = {'graph_name': getattr(G, 'name', G.filename),
+              'num_nodes': num_nodes,
+              'nnz': nnz,
+              'df': df,
+              'antisink_map': antisink_map,
+              'dtype': dtype,
+              }
+    save_data_object(params, _params_file(greens_file))
+
+
+def greens_params(greens_file):
+    """
+    Returns the parameters (a dictionary) of the Green's function saved in
+    greens_file by precompute_greens_function().
+    """
+
+    return restore_data_object(_params_file(greens_file))
+
+
+def matches_greens_params(G, params, df=None, antisink_map=None,
+                          dissipation_targets=()):
+    """
+    Checks whether the damping factor df and the antisinks given by
+    antisink_map agree with the parameters params of a Green's function for
+    the graph G. The arguments that are None are not checked. However, if
+    df is None while any of dissipation_targets (the values of da, ap or dr)
+    is given, the damping factor is to be found from the target, so the
+    Green's function does not match.
+    """
+
+    if df is None:
+        if any(x is not None for x in dissipation_targets):
+            return False
+    elif abs(df - params['df']) > 1e-12:
+        return False
+    if antisink_map is not None:
+        def _alphas(amap):
+            return dict((p, float(amap[p])) for p in amap if G.has_node(p))
+        if _alphas(antisink_map) != _alphas(params['antisink_map']):
+            return False
+    return True
+
+
+def load_greens_laplacian(G, greens_file):
+    """
+    Open the Green's function saved in greens_file by
+    precompute_greens_function() for the graph G. Returns the pair (SPL, df),
+    where SPL is a GreensFunctionLaplacian and df the damping factor of
+    the Green's function.
+    """
+
+    params = greens_params(greens_file)
+    W = G.weighted_adjacency_matrix()
+    if params['num_nodes'] != len(W.nodes) or params['nnz'] != W.nnz:
+        raise RuntimeError('The Green\'s function in %s was computed for a '
+                           'different graph.' % greens_file)
+
+    greens = np.load(greens_file, mmap_mode='r')
+    df = params['df']
+    df_mask = _full_graph_df_mask(G, W, df, params['antisink_map'])
+    return GreensFunctionLaplacian(W, df_mask, greens), df
+
+
+class GreensFunctionLaplacian(FullGraphLaplacian):
+    """
+    Full graph Laplacian whose Green's function is given explicitly as a
+    dense (possibly memory-mapped) array, so that no factorization is
+    needed. Apart from the FullGraphLaplacian interface, it provides
+    the methods emitting_context() and absorbing_context() that compute the
+    solutions of the emitting and absorbing models directly from the Green's
+    function.
+
+    Arguments:
+      * W: graph adjacency matrix storage class instance;
+      * df_mask: damping factors used to compute the Green's function;
+      * greens: the Green's function of the whole graph.
+    """
+
+    def __init__(self, W, df_mask, greens):
+
+        self.use_symmetric_solver = False
+        super(GreensFunctionLaplacian, self).__init__(W, df_mask)
+        self.greens = greens
+
+    def _full_solve(self, rhs, autoTranspose=False):
+
+        # Avoid converting the whole of greens to double precision
+        rhs = np.asarray(rhs, self.greens.dtype)
+        if autoTranspose:
+            return np.dot(self.greens, rhs).astype('d')
+        return np.dot(self.greens.transpose(), rhs).astype('d')
+
+    def _full_greens_cols(self, ixs, autoTranspose=False):
+
+        if autoTranspose:
+            return self.greens[:, ixs].astype('d')
+        return self.greens[ixs, :].transpose().astype('d')
+
+    def emitting_context(self, source_ixs):
+        """
+        Returns the array H of the emitting model with the given sources.
+        """
+
+        G_BB = self.greens[np.ix_(source_ixs, source_ixs)].astype('d')
+        G_BT = self.greens[source_ixs, :].astype('d')
+        H = np.linalg.solve(G_BB, G_BT).transpose()
+        H[source_ixs, :] = 0.0
+        H[source_ixs, np.arange(len(source_ixs))] = 1.0
+        return H
+
+    def absorbing_context(self, sink_ixs):
+        """
+        Returns the array F of the absorbing model with the given sinks.
+        """
+
+        G_BB = self.greens[np.ix_(sink_ixs, sink_ixs)].astype('d')
+        G_TB = self.greens[:, sink_ixs].astype('d')
+        F = np.linalg.solve(G_BB.transpose(), G_TB.transpose()).transpose()
+        F[sink_ixs, :] = 0.0
+        F[sink_ixs, np.arange(len(sink_ixs))] = 1.0
+        return F
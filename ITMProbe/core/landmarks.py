@@ -0,0 +1,220 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+Persistent cache of the rows and columns of the Green's function of the
+whole graph for frequently used boundary nodes (landmarks).
+
+The vectors are kept in an SQLite database, keyed by a digest of the full
+graph Laplacian (which determines both the network and the damping
+factors), the orientation (row or column) and the node index. Every lookup
+is recorded in the query history: a vector is admitted into the cache only
+once its node has been queried at least min_queries times, so that the
+cache is populated by the nodes that are actually popular. The least
+recently used vectors are evicted when the cache holds more than
+max_entries vectors.
+"""
+
+import hashlib
+import sqlite3
+import numpy as np
+
+landmarks_schema = \
+"""
+CREATE TABLE IF NOT EXISTS vectors(
+  key           TEXT,
+  orient        INTEGER,
+  nodeid        INTEGER,
+  last_used     INTEGER,
+  data          BLOB,
+  PRIMARY KEY(key, orient, nodeid)
+);
+
+CREATE TABLE IF NOT EXISTS history(
+  key           TEXT,
+  orient        INTEGER,
+  nodeid        INTEGER,
+  count         INTEGER,
+  PRIMARY KEY(key, orient, nodeid)
+);
+
+CREATE TABLE IF NOT EXISTS stats(
+  property      TEXT PRIMARY KEY,
+  value         INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS vectors_lru ON vectors(last_used);
+"""
+
+
+def laplacian_key(L):
+    """
+    Digest of a sparse Laplacian, identifying the network together with the
+    damping factors.
+    """
+
+    digest = hashlib.sha1()
+    digest.update(str(L.shape))
+    for arr in (L.indptr, L.indices, L.data):
+        digest.update(np.ascontiguousarray(arr).tostring())
+    return digest.hexdigest()
+
+
+class LandmarkCache(object):
+    """
+    Cache of Green's function rows and columns stored in the SQLite database
+    cache_db (a filename, created if necessary).
+
+    Arguments:
+      * cache_db: SQLite database file;
+      * max_entries: maximal number of vectors kept;
+      * min_queries: number of queries of a node before its vectors are
+          admitted into the cache.
+    """
+
+    def __init__(self, cache_db, max_entries=1000, min_queries=2):
+
+        self.conn = sqlite3.connect(cache_db)
+        self.conn.executescript(landmarks_schema)
+        self.max_entries = max_entries
+        self.min_queries = min_queries
+        self.hits = 0
+        self.misses = 0
+        cur = self.conn.execute('SELECT max(last_used) FROM vectors')
+        self._clock = cur.fetchone()[0] or 0
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    def get(self, key, orient, nodeid):
+        """
+        Returns the cached vector (orient is 0 for rows and 1 for columns)
+        or None, and records the query in the history.
+        """
+
+        # The history must be committed, since other processes may use the
+        # same cache.
+        nodeid = int(nodeid)
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO history VALUES '
+                              '(?,?,?,0)', (key, orient, nodeid))
+            self.conn.execute('UPDATE history SET count=count+1 WHERE key=? '
+                              'AND orient=? AND nodeid=?',
+                              (key, orient, nodeid))
+
+            row = self.conn.execute('SELECT data FROM vectors WHERE key=? AND '
+                                    'orient=? AND nodeid=?',
+                                    (key, orient, nodeid)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute('UPDATE vectors SET last_used=? WHERE key=? AND '
+                              'orient=? AND nodeid=?',
+                              (self._tick(), key, orient, nodeid))
+        return np.fromstring(str(row[0]), dtype='<f8')
+
+    def put(self, key, orient, nodeid, vector, force=False):
+        """
+        Store the vector if its node has been queried often enough (or if
+        force is True), evicting the least recently used vectors if
+        necessary. Returns True if the vector was stored.
+        """
+
+        nodeid = int(nodeid)
+        if not force:
+            row = self.conn.execute('SELECT count FROM history WHERE key=? '
+                                    'AND orient=? AND nodeid=?',
+                                    (key, orient, nodeid)).fetchone()
+            if row is None or row[0] < self.min_queries:
+                return False
+
+        data = np.asarray(vector, dtype='<f8').tostring()
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO vectors VALUES '
+                              '(?,?,?,?,?)', (key, orient, nodeid,
+                                              self._tick(),
+                                              sqlite3.Binary(data)))
+            num_entries = self.conn.execute('SELECT count(*) FROM vectors'
+                                            ).fetchone()[0]
+            if num_entries > self.max_entries:
+                self.conn.execute('DELETE FROM vectors WHERE rowid IN (SELECT '
+                                  'rowid FROM vectors ORDER BY last_used '
+                                  'LIMIT ?)',
+                                  (num_entries - self.max_entries, ))
+        return True
+
+    def popular(self, key, orient, num_nodes):
+        """
+        Returns the indices of the num_nodes most frequently queried nodes
+        (for the given key and orientation) whose vectors are not cached.
+        """
+
+        cur = self.conn.execute('SELECT nodeid FROM history WHERE key=? AND '
+                                'orient=? AND NOT EXISTS (SELECT 1 FROM '
+                                'vectors WHERE vectors.key=history.key AND '
+                                'vectors.orient=history.orient AND '
+                                'vectors.nodeid=history.nodeid) '
+                                'ORDER BY count DESC LIMIT ?',
+                                (key, orient, num_nodes))
+        return [row[0] for row in cur]
+
+    def stats(self):
+        """
+        Returns a dictionary with the hit and miss counts (for this session
+        and in total) and the number of cached vectors.
+        """
+
+        stored = dict(self.conn.execute('SELECT property, value FROM stats'))
+        total_hits = stored.get('hits', 0) + self.hits
+        total_misses = stored.get('misses', 0) + self.misses
+        queries = total_hits + total_misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'total_hits': total_hits,
+                'total_misses': total_misses,
+                'hit_rate': float(total_hits) / queries if queries else 0.0,
+                'entries': self.conn.execute('SELECT count(*) FROM vectors'
+                                             ).fetchone()[0],
+                }
+
+    def close(self):
+        """
+        Save the statistics and close the database.
+        """
+
+        for prop, value in (('hits', self.hits), ('misses', self.misses)):
+            self.conn.execute('INSERT OR IGNORE INTO stats VALUES (?,0)',
+                              (prop, ))
+            self.conn.execute('UPDATE stats SET value=value+? WHERE '
+                              'property=?', (value, prop))
+        self.hits = self.misses = 0
+        self.conn.commit()
+        self.conn.close()
@@ -29,11 +29,33 @@
 """Routines and classes for solving discrete Laplace equation."""
 import numpy
 from scipy import linalg
+from scipy.sparse import csr_matrix
 from scipy.sparse.linalg import dsolve
+from .landmarks import laplacian_key
+from ...common.utils.parallel import solve_columns
 
-# Use UMFPACK if possible. SuperLU seems slower under first impression but I
-# did not thoroughly test.
-dsolve.use_solver(useUmfpack=True, assumeSortedIndices=True)
+# The Laplacians are factorized by SuperLU with a minimum degree ordering
+# (on L^T + L), which beats the default column ordering by an order of
+# magnitude on the ITM Probe networks. UMFPACK is not used: its solver does
+# not accept blocks of right hand sides.
+
+
+def fill_reducing_ordering(W, df=0.85):
+    """
+    Compute a fill-reducing ordering of the nodes of the graph with the
+    adjacency matrix W. The result is an array of node indices in elimination
+    order, suitable for the node_ordering attribute of a graph.
+
+    The ordering is obtained by the minimum degree algorithm applied to the
+    sparsity pattern of L^T + L, where L is the Laplacian of the graph with
+    damping factor df. Since it depends only on the structure of the graph,
+    it can be computed once and stored with the graph.
+    """
+    W = W.copy()
+    W.node_ordering = None
+    SPL = BasicLaplacian(W, W.get_df_mask(df))
+    lu = dsolve.splu(SPL.L.tocsc(), permc_spec='MMD_AT_PLUS_A')
+    return numpy.argsort(lu.perm_c)
 
 
 class BasicLaplacian(object):
@@ -42,9 +64,21 @@ class BasicLaplacian(object):
     matrix of a graph (normalized to a stochastic matrix) in a sparse form, with
     the boundary specified at the construction time.
     Precomputes the inverse of the Laplacian (Green's function) as a sparse
-    LU-decomposition using a direct linear solver (UMFPACK or SuperLU). The
+    LU-decomposition using a direct linear solver (SuperLU). The
     inverse is accessed using the solve() method.
 
+    If W has a precomputed node_ordering, the Laplacian is permuted
+    symmetrically according to it and factorized by SuperLU without further
+    column reordering. The solve() method permutes the right hand side and
+    the solution so that the ordering is invisible to the caller.
+
+    If the adjacency matrix is symmetric and the damping factors are uniform
+    over the outgoing links of each node, the Laplacian is similar (via a
+    diagonal scaling) to a symmetric positive-definite matrix K. In that case
+    only K is factorized and the same factorization serves both orientations
+    of solve(). Set the class attribute use_symmetric_solver to False to
+    always use the general LU factorization.
+
     Arguments:
       * W: graph adjacency matrix storage class instance;
       * df_mask: an array of the same size as data array of
@@ -57,9 +91,15 @@ class BasicLaplacian(object):
       * boundary_cols: indices of the columns of the transisiton matrix that are
           extracted, saved and zeroed in the matrix. The extracted columns can be
           accessed using the method get_boundary_col();
+      * dtype: precision of the right hand side blocks and the solutions of
+          solve_boundary_rows() and solve_boundary_cols() ('d' or 'f'). The
+          factorization is always in double precision.
     """
 
-    def __init__(self, W, df_mask, boundary_rows=None, boundary_cols=None):
+    use_symmetric_solver = True
+
+    def __init__(self, W, df_mask, boundary_rows=None, boundary_cols=None,
+                 dtype='d'):
 
         # self.L will point to W.adjacency_matrix, which will be modified
         # in-place
@@ -70,6 +110,9 @@ class BasicLaplacian(object):
 
         self.boundary_rows = boundary_rows
         self.boundary_cols = boundary_cols
+        self.dtype = dtype
+        self.node_ordering = W.node_ordering
+        self._ordered_L = None
 
         # Construct transition matrix from adjacency. This matrix need not be
         # stochastic if W.row_weights is not set to row sums.
@@ -88,6 +131,63 @@ class BasicLaplacian(object):
         # Solvers for computing a solution - set only on first run
         self.solve_left = None
         self.solve_right = None
+        self.solve_sym = None
+
+        self.symmetric = False
+        if self.use_symmetric_solver:
+            self._init_symmetric(W.row_weights, df_mask, W.diagonal_ix)
+
+    def _init_symmetric(self, row_weights, df_mask, diagonal_ix):
+        """
+        Tries to write L = inv(S) * K + E, where S is diagonal, K symmetric
+        and E holds the entries of L in the columns of `decoupled' nodes
+        (whose rows in L are zero apart from the diagonal). Sets
+        self.symmetric to True on success.
+        """
+
+        # With the adjacency matrix A symmetric, row weights w and the damping
+        # factor mu_i applied to all outgoing links of a coupled node i, the
+        # off-diagonal entries of L are L_ij = -mu_i * A_ij / w_i. Multiplying
+        # each coupled row by s_i = w_i / mu_i gives the symmetric matrix
+        # K = diag(w / mu) - A. Decoupled rows (boundary nodes, nodes with
+        # zero damping factor, isolated nodes) are left unscaled but their
+        # columns must be moved into E, since they are not matched by the
+        # corresponding rows.
+
+        L = self.L
+        n = L.shape[0]
+        rows = numpy.repeat(numpy.arange(n), numpy.diff(L.indptr))
+        offdiag = (L.indices != rows) & (L.data != 0.0)
+        coupled = numpy.zeros(n, dtype=bool)
+        coupled[rows[offdiag]] = True
+
+        # Any entry of the row will do for mu - it is checked through the
+        # symmetry of K below.
+        mu = numpy.ones(n, 'd')
+        mu[rows[offdiag]] = df_mask[offdiag]
+        scale = numpy.ones(n, 'd')
+        scale[coupled] = row_weights[coupled] / mu[coupled]
+
+        e_mask = offdiag & ~coupled[L.indices]
+        K_data = L.data * scale[rows]
+        K_data[e_mask] = 0.0
+        K = csr_matrix((K_data, L.indices, L.indptr), shape=L.shape)
+
+        D = K - K.transpose()
+        if D.nnz and abs(D.data).max() > 1e-12 * abs(K_data).max():
+            return
+
+        if e_mask.any():
+            self._sym_E = csr_matrix((L.data[e_mask],
+                                      (rows[e_mask], L.indices[e_mask])),
+                                     shape=L.shape)
+        else:
+            self._sym_E = None
+        self._sym_K = K
+        self._sym_scale = scale
+        self._sym_decoupled = numpy.flatnonzero(~coupled)
+        self._sym_diag = L.data[diagonal_ix][self._sym_decoupled]
+        self.symmetric = True
 
     def _extract_boundary(self):
 
@@ -151,6 +251,53 @@ class BasicLaplacian(object):
 
         return self.boundary_col_data[:, self.boundary_col_map[j]]
 
+    def solve_boundary_row(self, i):
+        """
+        Solves the system L^Tx = r, where r is the row i (if extracted) of
+        the original transition matrix.
+        """
+
+        return self.solve(self.get_boundary_row(i), False)
+
+    def solve_boundary_col(self, j):
+        """
+        Solves the system Lx = c, where c is the column j (if extracted) of
+        the original transition matrix.
+        """
+
+        return self.solve(self.get_boundary_col(j), True)
+
+    def solve_many(self, rhs, autoTranspose=False):
+        """
+        Solves the system (see solve()) for each column of the 2D array rhs.
+        The columns are split among the solver threads (see
+        common.utils.parallel.set_num_threads()).
+        """
+
+        return solve_columns(lambda b: self.solve(b, autoTranspose), rhs)
+
+    def solve_boundary_rows(self, ixs):
+        """
+        Returns the solutions of solve_boundary_row() for all i in ixs as
+        columns of an array.
+        """
+
+        rhs = numpy.zeros((self.L.shape[0], len(ixs)), self.dtype)
+        for k, i in enumerate(ixs):
+            rhs[:, k] = self.get_boundary_row(i)
+        return self.solve_many(rhs, False)
+
+    def solve_boundary_cols(self, ixs):
+        """
+        Returns the solutions of solve_boundary_col() for all j in ixs as
+        columns of an array.
+        """
+
+        rhs = numpy.zeros((self.L.shape[0], len(ixs)), self.dtype)
+        for k, j in enumerate(ixs):
+            rhs[:, k] = self.get_boundary_col(j)
+        return self.solve_many(rhs, True)
+
     def get_full_greens_func(self):
         """
         Retrieve the full Green's function matrix in dense form.
@@ -178,26 +325,114 @@ class BasicLaplacian(object):
         # x in this case multiplies L on the right). Thus, autoTranspose set
         # really means that `left' structures are used.
 
+        if self.symmetric:
+            return self._solve_symmetric(rhs, autoTranspose)
+
         if not autoTranspose:
             if self.solve_left is None:
-                A = self.L.transpose() # a CSC matrix - no copy
-                self.solve_left = dsolve.factorized(A)
+                A = self._get_ordered_L().transpose() # a CSC matrix - no copy
+                self.solve_left = self._factorized(A)
             solve = self.solve_left
         else:
             if self.solve_right is None:
-                A = self.L.tocsc() # requires a copy
-                self.solve_right = dsolve.factorized(A)
+                A = self._get_ordered_L().tocsc() # requires a copy
+                self.solve_right = self._factorized(A)
             solve = self.solve_right
-        x = solve(rhs)
+
+        return self._ordered_solve(solve, rhs)
+
+    def _solve_symmetric(self, rhs, autoTranspose):
+
+        # Here L = inv(S) * K + E, where S = diag(self._sym_scale). E is
+        # nonzero only in the columns of decoupled nodes, for which the
+        # equations reduce to L_ii * x_i = rhs_i.
+        if self.solve_sym is None:
+            K = self._permuted(self._sym_K).transpose() # CSC, same as K
+            if self.node_ordering is None:
+                permc_spec = 'MMD_AT_PLUS_A'
+            else:
+                permc_spec = 'NATURAL'
+            lu = dsolve.splu(K, permc_spec=permc_spec, diag_pivot_thresh=0.0,
+                             options=dict(SymmetricMode=True))
+            self.solve_sym = lu.solve
+
+        rhs = numpy.asarray(rhs, 'd')
+        E = self._sym_E
+        dc = self._sym_decoupled
+        # The right hand side may hold several columns
+        scale = self._sym_scale
+        diag = self._sym_diag
+        if rhs.ndim == 2:
+            scale = scale[:, numpy.newaxis]
+            if diag is not None:
+                diag = diag[:, numpy.newaxis]
+        if autoTranspose:
+            # Lx = rhs  <=>  Kx = S(rhs - Ex), with x fixed on decoupled nodes
+            u = rhs.copy()
+            if E is not None:
+                x_dc = numpy.zeros(u.shape, 'd')
+                x_dc[dc] = rhs[dc] / diag
+                u -= E * x_dc
+            u *= scale
+            return self._ordered_solve(self.solve_sym, u)
+        else:
+            # L^Tx = rhs  <=>  x = S inv(K) rhs on coupled nodes, with the
+            # decoupled nodes corrected afterwards
+            x = self._ordered_solve(self.solve_sym, rhs)
+            x *= scale
+            if E is not None:
+                x[dc] = (rhs[dc] - (E.transpose() * x)[dc]) / diag
+            return x
+
+    def _ordered_solve(self, solve, rhs):
+        """
+        Solves for rhs (a vector or a 2D array of columns) with the solver
+        for the permuted system, permuting the rows of rhs and of the solution
+        accordingly.
+        """
+
+        if self.node_ordering is None:
+            return solve(rhs)
+        y = solve(numpy.asarray(rhs)[self.node_ordering])
+        x = numpy.empty_like(y)
+        x[self.node_ordering] = y
         return x
 
+    def _permuted(self, A):
+        """
+        Returns A with rows and columns permuted according to node_ordering.
+        """
+        if self.node_ordering is None:
+            return A
+        A = A[self.node_ordering, :]
+        return A[:, self.node_ordering]
+
+    def _get_ordered_L(self):
+        """
+        Returns L with rows and columns permuted according to node_ordering.
+        """
+        if self._ordered_L is None:
+            self._ordered_L = self._permuted(self.L)
+        return self._ordered_L
+
+    def _factorized(self, A):
+
+        # SuperLU is used in both cases since its solver accepts blocks of
+        # right hand sides
+        if self.node_ordering is None:
+            permc_spec = 'MMD_AT_PLUS_A'
+        else:
+            # A is already in fill-reducing order
+            permc_spec = 'NATURAL'
+        return dsolve.splu(A, permc_spec=permc_spec).solve
+
 
 class FullGraphLaplacian(BasicLaplacian):
     """
     Constructs the discrete Laplacian corresponding to the given adjacency
     matrix of a graph (normalized to a stochastic matrix) in a sparse form.
     Precomputes the inverse of the Laplacian (Green's function) as a sparse
-    LU-decomposition using a direct linear solver (UMFPACK or SuperLU). The
+    LU-decomposition using a direct linear solver (SuperLU). The
     inverse is accessed using the solve() method.
 
     The boundary is specified after construction (using the set_boundary_ixs()
@@ -213,6 +448,10 @@ class FullGraphLaplacian(BasicLaplacian):
           adjacency_matrix. Should contain the damping factors that multiply
           each entry of the normalized adjacency_matrix to obtain the Markov chain
           transisiton matrix (with implicit boundary unless df_mask == 1.0).
+      * landmarks: optional LandmarkCache storing the rows and columns of
+          the Green's function of frequently used boundary nodes;
+      * dtype: precision of the right hand side blocks and the solutions (see
+          BasicLaplacian).
     """
 
     #  The idea behind this is to compute the Green's function of the whole
@@ -237,10 +476,13 @@ class FullGraphLaplacian(BasicLaplacian):
     #  inv(A)*u = X*u - (Y * inv(W)) * Z * u. The transpose problem turns out
     #  only to require dealing with inv(M).T rather than inv(M).
 
-    def __init__(self, W, df_mask):
+    def __init__(self, W, df_mask, landmarks=None, dtype='d'):
 
-        super(FullGraphLaplacian, self).__init__(W, df_mask)
+        super(FullGraphLaplacian, self).__init__(W, df_mask, dtype=dtype)
         self.df_mask = df_mask
+        self.landmarks = landmarks
+        if landmarks is not None:
+            self.landmarks_key = laplacian_key(self.L)
 
     def _extract_boundary(self):
         # This function is unnecessary is this class.
@@ -289,12 +531,49 @@ class FullGraphLaplacian(BasicLaplacian):
         # z = Z*u
         # YQ = Y*inv(W)
 
+        x = self._full_solve(rhs, autoTranspose)
+        return self._apply_boundary(x, autoTranspose)
+
+    def solve_boundary_row(self, i):
+        """
+        Solves the system L^Tx = r, where r is the row i of the original
+        transition matrix. Since r = e_i - L[i,:], the solution for the whole
+        graph is the row i of the Green's function with 1 subtracted at i.
+        """
+
+        x = self._full_greens_cols([i], False)[:, 0]
+        x[i] -= 1.0
+        return self._apply_boundary(x, False)
+
+    def solve_boundary_col(self, j):
+        """
+        Solves the system Lx = c, where c is the column j of the original
+        transition matrix (see solve_boundary_row()).
+        """
+
+        x = self._full_greens_cols([j], True)[:, 0]
+        x[j] -= 1.0
+        return self._apply_boundary(x, True)
+
+    def solve_boundary_rows(self, ixs):
+
+        X = self._full_greens_cols(ixs, False)
+        X[ixs, numpy.arange(len(ixs))] -= 1.0
+        return self._apply_boundary(X, False)
+
+    def solve_boundary_cols(self, ixs):
+
+        X = self._full_greens_cols(ixs, True)
+        X[ixs, numpy.arange(len(ixs))] -= 1.0
+        return self._apply_boundary(X, True)
+
+    def _apply_boundary(self, x, autoTranspose=False):
+
         if autoTranspose:
             YQ = self.tmp_mat_T
         else:
             YQ = self.tmp_mat
 
-        x = super(FullGraphLaplacian, self).solve(rhs, autoTranspose)
         z = x[self.boundary_ixs]
         x[self.boundary_ixs] = 0.0
         res = x - numpy.dot(YQ, z)
@@ -312,20 +591,67 @@ class FullGraphLaplacian(BasicLaplacian):
         self.tmp_mat = self._compute_tmp_mat(boundary_ixs, False)
         self.tmp_mat_T = self._compute_tmp_mat(boundary_ixs, True)
 
+    def _full_solve(self, rhs, autoTranspose=False):
+        """
+        Solves the system with the Laplacian of the whole graph (without
+        boundary).
+        """
+
+        return super(FullGraphLaplacian, self).solve(rhs, autoTranspose)
+
+    def _full_greens_cols(self, ixs, autoTranspose=False):
+        """
+        Returns the columns (autoTranspose == True) or the rows (as columns)
+        of the Green's function of the whole graph indexed by ixs.
+        """
+
+        n = self.L.shape[0]
+        orient = int(autoTranspose)
+        Y = numpy.zeros((n, len(ixs)), self.dtype)
+        missing = []
+        for i, k in enumerate(ixs):
+            x = None
+            if self.landmarks is not None:
+                x = self.landmarks.get(self.landmarks_key, orient, k)
+            if x is None:
+                missing.append(i)
+            else:
+                Y[:, i] = x
+
+        if missing:
+            rhs = numpy.zeros((n, len(missing)), self.dtype)
+            rhs[[ixs[i] for i in missing], numpy.arange(len(missing))] = 1.0
+            Y[:, missing] = solve_columns(
+                lambda b: self._full_solve(b, autoTranspose), rhs)
+            if self.landmarks is not None:
+                for i in missing:
+                    self.landmarks.put(self.landmarks_key, orient, ixs[i],
+                                       Y[:, i])
+        return Y
+
+    def populate_landmarks(self, num_nodes):
+        """
+        Computes and stores into the landmark cache the rows and columns of
+        the Green's function for (at most) num_nodes most frequently queried
+        nodes not yet in the cache.
+        """
+
+        for orient in (0, 1):
+            ixs = self.landmarks.popular(self.landmarks_key, orient, num_nodes)
+            rhs = numpy.zeros((self.L.shape[0], len(ixs)), 'd')
+            rhs[ixs, numpy.arange(len(ixs))] = 1.0
+            Y = solve_columns(lambda b: self._full_solve(b, bool(orient)), rhs)
+            for i, k in enumerate(ixs):
+                self.landmarks.put(self.landmarks_key, orient, k, Y[:, i],
+                                   True)
+
     def _compute_tmp_mat(self, boundary_ixs, autoTranspose=False):
 
         # Here we extract the columns of the Green's function associated with
         # the boundary. The rows corresponding to the boundary indices are
         # extracted into the W matrix and zeroed in the original matrix.
 
-        num_bndr = len(boundary_ixs)
-        Y = numpy.zeros((self.L.shape[0], num_bndr), 'd')
-        tmp = numpy.zeros(self.L.shape[0], 'd')
-        for i, k in enumerate(boundary_ixs):
-            tmp[:] = 0.0
-            tmp[k] = 1.0
-            Y[:, i] = super(FullGraphLaplacian, self).solve(tmp, autoTranspose)
-
+        Y = self._full_greens_cols(boundary_ixs, autoTranspose)
         W = Y[boundary_ixs, :]
         Y[boundary_ixs, :] = 0.0
         YQ = numpy.dot(Y, linalg.inv(W))
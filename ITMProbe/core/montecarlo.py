@@ -0,0 +1,278 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+Monte Carlo evaluation of emitting and absorbing models.
+
+For graphs too large to factorize, the entries of the Green's function are
+estimated by simulating damped random walks. The walks are advanced in
+vectorized batches directly over the CSR arrays of the adjacency matrix: a
+walk at node u is dissipated with probability 1-mu_u and otherwise moves
+along an outgoing link chosen with probability proportional to its weight.
+
+ * Emitting model: the walks start at each source and H[i,j] is the
+   average number of visits of the walks from source j to the transient node
+   i before they are dissipated or reach a source.
+ * Absorbing model: F[:,k] = sum_n P^n b, where P is the transient part of
+   the transition matrix and b the column of transition probabilities into
+   the sink k. Rather than starting walks at every transient node, the
+   walks run backward from each sink: they start at a node v with
+   probability proportional to b[v] and move from u to v with probability
+   proportional to P[v,u]. The walks carry weights correcting for the
+   column sums of P not being probabilities, so that the average weighted
+   number of visits to i is an unbiased estimate of F[i,k].
+
+The walks for each start are split into batches, each with its own random
+seed derived from the seed supplied, so that the results are reproducible
+regardless of the number of processes used. The batches are evaluated in a
+process pool shared by all queries and the confidence intervals are
+computed from the variation between the batch means.
+"""
+
+import threading
+import multiprocessing
+import numpy as np
+from scipy.stats import t as t_distribution
+
+
+class _LinkTable(object):
+    """
+    Selects the links of the rows of a CSR matrix with probabilities
+    proportional to their weights.
+    """
+
+    def __init__(self, M):
+
+        self.indptr = M.indptr
+        self.indices = M.indices
+
+        # Links are selected by bisection of the cumulative sum of all weights
+        # (offset by the cumulative weight of preceding rows).
+        self.cum_data = np.cumsum(M.data)
+        cum_data = np.concatenate(([0.0], self.cum_data))
+        self.row_offset = cum_data[M.indptr[:-1]]
+        self.row_sums = np.asarray(M.sum(1)).ravel()
+
+    def select(self, pos, rng):
+        """Next positions of the walks at pos."""
+
+        target = self.row_offset[pos] + \
+                 rng.random_sample(len(pos)) * self.row_sums[pos]
+        link = np.searchsorted(self.cum_data, target, side='right')
+        # Guard against rounding at the ends of the row
+        link = np.clip(link, self.indptr[pos], self.indptr[pos+1]-1)
+        return self.indices[link]
+
+
+class RandomWalkSampler(object):
+    """
+    Simulates random walks for the transition matrix obtained by normalizing
+    the rows of the adjacency matrix and multiplying them by the damping
+    factors. The walks stop on dissipation or on reaching a boundary node.
+
+    Arguments:
+      * W: graph adjacency matrix storage class instance;
+      * row_df: array of damping factors of the rows of the transition matrix;
+      * boundary_ixs: indices of the boundary nodes;
+      * chunk_size: maximal number of walks advanced together.
+    """
+
+    def __init__(self, W, row_df, boundary_ixs, chunk_size=1000000):
+
+        A = W._adjacency_matrix
+        n = A.shape[0]
+        self.n = n
+        self.boundary_ixs = list(boundary_ixs)
+        self.chunk_size = chunk_size
+        self.links = _LinkTable(A)
+
+        row_scale = np.zeros(n, 'd')
+        nz = W.row_weights > 0.0
+        row_scale[nz] = row_df[nz] / W.row_weights[nz]
+        self.cont_prob = np.minimum(row_scale * self.links.row_sums, 1.0)
+
+        self.is_boundary = np.zeros(n, dtype=bool)
+        self.is_boundary[self.boundary_ixs] = True
+        self.transient_ixs = np.flatnonzero(~self.is_boundary)
+        if self.cont_prob[~self.is_boundary].max() >= 1.0:
+            raise RuntimeError('Monte Carlo evaluation requires all damping '
+                               'factors to be smaller than 1.')
+
+        # Backward walks use the transpose of the transition matrix with the
+        # boundary rows removed. A backward walk at u continues with the
+        # probability back_cont[u], which is the column sum of u unless it
+        # exceeds the largest forward continuation probability, and its
+        # weight is multiplied by back_weight[u] to compensate.
+        row_scale[self.boundary_ixs] = 0.0
+        P_T = A.transpose().tocsr().copy()
+        P_T.data *= row_scale[P_T.indices]
+        P_T.eliminate_zeros()
+        self.back_links = _LinkTable(P_T)
+        col_sums = self.back_links.row_sums
+        self.back_cont = np.minimum(col_sums,
+                                    self.cont_prob[self.transient_ixs].max())
+        self.back_cont[self.boundary_ixs] = 0.0
+        self.back_weight = np.zeros(n, 'd')
+        nz = self.back_cont > 0.0
+        self.back_weight[nz] = col_sums[nz] / self.back_cont[nz]
+
+    def step(self, pos, rng):
+        """
+        Advance the walks at positions pos by one step. Returns the indices
+        of the walks that survived and their new positions.
+        """
+
+        alive = np.flatnonzero(rng.random_sample(len(pos)) <
+                               self.cont_prob[pos])
+        return alive, self.links.select(pos[alive], rng)
+
+    def emitting_batch(self, source, num_walks, rng):
+        """
+        Average number of visits to each node of num_walks walks starting at
+        source, counting only the visits to transient nodes.
+        """
+
+        visits = np.zeros(self.n, 'd')
+        for start in xrange(0, num_walks, self.chunk_size):
+            pos = np.repeat(source, min(self.chunk_size, num_walks-start))
+            while len(pos):
+                _, pos = self.step(pos, rng)
+                pos = pos[~self.is_boundary[pos]]
+                visits += np.bincount(pos, minlength=self.n)
+        return visits / num_walks
+
+    def absorbing_batch(self, sink, num_walks, rng):
+        """
+        Estimate of the probabilities of absorption at sink of the walks
+        starting at each transient node, obtained from num_walks backward
+        walks starting at sink.
+        """
+
+        visits = np.zeros(self.n, 'd')
+        total = self.back_links.row_sums[sink]
+        if total <= 0.0:
+            return visits
+        for start in xrange(0, num_walks, self.chunk_size):
+            num = min(self.chunk_size, num_walks-start)
+            pos = self.back_links.select(np.repeat(sink, num), rng)
+            weights = np.repeat(total, num)
+            while len(pos):
+                visits += np.bincount(pos, weights, minlength=self.n)
+                alive = np.flatnonzero(rng.random_sample(len(pos)) <
+                                       self.back_cont[pos])
+                pos = pos[alive]
+                weights = weights[alive] * self.back_weight[pos]
+                # Split the walks whose weights grew beyond the initial one
+                copies = np.maximum((weights / total).astype(int), 1)
+                pos = np.repeat(pos, copies)
+                weights = np.repeat(weights / copies, copies)
+                pos = self.back_links.select(pos, rng)
+        return visits / num_walks
+
+    def batch(self, transpose, num_walks, seed):
+        """
+        Evaluate one batch of walks (for all boundary nodes) with the random
+        generator initialized by seed.
+        """
+
+        rng = np.random.RandomState(seed)
+        if transpose:
+            walk_batch = self.absorbing_batch
+        else:
+            walk_batch = self.emitting_batch
+        X = np.zeros((self.n, len(self.boundary_ixs)), 'd')
+        for j, k in enumerate(self.boundary_ixs):
+            X[:,j] = walk_batch(k, num_walks, rng)
+        return X
+
+
+# Process pool shared by all queries, created on first use and replaced only
+# if more processes are requested.
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+def get_process_pool(num_processes):
+    """
+    Return the shared process pool with at least num_processes processes.
+    """
+
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size < num_processes:
+            if _pool is not None:
+                # Pending work is completed before the workers exit
+                _pool.close()
+            _pool = multiprocessing.Pool(num_processes)
+            _pool_size = num_processes
+        return _pool
+
+def _run_batches(args):
+    sampler, tasks = args
+    return [sampler.batch(*task) for task in tasks]
+
+
+def sample_walks(sampler, transpose, num_walks, num_batches=10, seed=None,
+                 num_processes=1, confidence=0.95):
+    """
+    Estimate the rows (transpose == False) or the columns (transpose ==
+    True) of the Green's function for all boundary nodes of the sampler by
+    num_walks walks per boundary node, split into num_batches batches
+    evaluated by num_processes processes.
+
+    Returns the tuple (X, ci, total_ci), where X is the array of estimates
+    (one column per boundary node), ci the array of half-widths of the
+    confidence intervals of the entries of X and total_ci the half-widths
+    for the totals of X over all columns.
+    """
+
+    if num_batches < 2:
+        raise RuntimeError('At least two batches of walks are required.')
+    batch_walks = -(-num_walks // num_batches)
+    seeds = np.random.RandomState(seed).randint(2**31-1, size=num_batches)
+    tasks = [(transpose, batch_walks, s) for s in seeds]
+
+    if num_processes > 1:
+        # The sampler is sent once with each process's share of the batches.
+        size = -(-num_batches // num_processes)
+        chunks = [(sampler, tasks[i:i+size])
+                  for i in xrange(0, num_batches, size)]
+        pool = get_process_pool(num_processes)
+        batches = [X for chunk in pool.map(_run_batches, chunks)
+                   for X in chunk]
+    else:
+        batches = [sampler.batch(*task) for task in tasks]
+
+    batches = np.array(batches)
+    X = batches.mean(0)
+    q = t_distribution.ppf(0.5 * (1.0 + confidence), num_batches - 1)
+    scale = q / np.sqrt(num_batches)
+    ci = scale * batches.std(0, ddof=1)
+    total_ci = scale * batches.sum(2).std(0, ddof=1)
+    return X, ci, total_ci
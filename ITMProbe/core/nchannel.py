@@ -28,22 +28,20 @@
 
 import numpy as np
 from . import BasicITM
+from . import find_damping_factor
+from . import damping_search_key
 from .laplacian import BasicLaplacian
 from ...common.graph.dmatrix import dijkstra
-from ...common.utils.newton import rootfind_newton
 
 
 def evaluate_context(SPL, source_ixs, sink_ixs):
 
-    F = np.zeros((SPL.L.shape[0], len(sink_ixs)), 'd')
-    H = np.zeros((SPL.L.shape[0], len(source_ixs)), 'd')
-
     P_S = np.zeros((len(source_ixs), SPL.L.shape[0]), 'd')
     for i, s in enumerate(source_ixs):
         P_S[i, :] = SPL.get_boundary_row(s)
 
+    F = SPL.solve_boundary_cols(sink_ixs)
     for i, k in enumerate(sink_ixs):
-        F[:, i] = SPL.solve(SPL.get_boundary_col(k), True)
         F[source_ixs, i] = 0.0
         F[sink_ixs, i] = 0.0
 
@@ -54,8 +52,8 @@ def evaluate_context(SPL, source_ixs, sink_ixs):
         for j, s in enumerate(source_ixs):
             F[s, i] = G_SK[j, i]
 
+    H = SPL.solve_boundary_rows(source_ixs)
     for j, s in enumerate(source_ixs):
-        H[:, j] = SPL.solve(SPL.get_boundary_row(s), False)
         H[source_ixs, j] = 0.0
         H[sink_ixs, j] = 0.0
         for i, k in enumerate(sink_ixs):
@@ -146,7 +144,8 @@ def _process_context_df(W,
                         source_ixs,
                         sink_ixs,
                         alpha_out_map,
-                        df):
+                        df,
+                        dtype='d'):
 
     if df < 1e-14:
         raise RuntimeError('Cannot evaluate a context with a damping factor'
@@ -159,7 +158,8 @@ def _process_context_df(W,
 
     SPL = BasicLaplacian(W, df_mask,
                          boundary_rows=source_ixs + sink_ixs,
-                         boundary_cols=sink_ixs + source_ixs)
+                         boundary_cols=sink_ixs + source_ixs,
+                         dtype=dtype)
     return evaluate_context(SPL, source_ixs, sink_ixs)
 
 
@@ -190,40 +190,31 @@ def _process_context_mu_newton(W,
                              boundary_rows=source_ixs+sink_ixs,
                              boundary_cols=sink_ixs+source_ixs)
 
-        Fs = np.zeros(len(sink_ixs), 'd')
-        Ts = np.zeros(len(sink_ixs), 'd')
-        DTs = np.zeros(len(sink_ixs), 'd')
-        fval = 0.0
-        fpval = 0.0
-
-        for s in source_ixs:
-            Fs[:] = 0.0
-            Ts[:] = 0.0
-            DTs[:] = 0.0
-            P_row_s = SPL.get_boundary_row(s)
-            # Calculate F_{sK} and F_{sk}
-            for j, k in enumerate(sink_ixs):
-                F_col_k = SPL.solve(SPL.get_boundary_col(k), True)
-                GF_col_k = SPL.solve(F_col_k, True)
-                GGF_col_k = SPL.solve(GF_col_k, True)
-                Fs[j] = np.dot(P_row_s, F_col_k)
-                HF_sk = np.dot(P_row_s, GF_col_k)
-                HGF_sk = np.dot(P_row_s, GGF_col_k)
-                Ts[j] = (1.0 + HF_sk / Fs[j])
-                DTs[j] = (Ts[j] - Ts[j]**2 + 2.0 * HGF_sk / Fs[j]) / x0
-
-            fval += (Fs * Ts / Fs.sum()).sum()
-            fpval += (Fs * DTs / Fs.sum()).sum()
+        # The columns F_{.k} and (GF)_{.k} depend only on the sink k, so they
+        # are computed for all sinks at once (each by one block solve) and
+        # multiplied by the stacked boundary rows of all sources.
+        n = SPL.L.shape[0]
+        F_cols = SPL.solve_boundary_cols(sink_ixs)
+        GF_cols = SPL.solve_many(F_cols, True)
+
+        P_S = np.zeros((len(source_ixs), n), 'd')
+        for i, s in enumerate(source_ixs):
+            P_S[i, :] = SPL.get_boundary_row(s)
+
+        # Rows correspond to sources, columns to sinks: Fs[i, j] = F_{sk}
+        Fs = np.dot(P_S, F_cols)
+        HF = np.dot(P_S, GF_cols)
+        Ts = 1.0 + HF / Fs
 
+        fval = ((Fs * Ts).sum(1) / Fs.sum(1)).sum()
         fval /= len(source_ixs)
         fval -= target_avg_path_length
-        fpval /= len(source_ixs)
-        return fval, fpval, SPL
+        return fval, SPL
 
-    a = 0.0   # lower bound for df
-    b = 1.0   # upper bound for df - see comment below
-    x0 = 0.8  # starting guess
-    x, _, _, SPL = rootfind_newton(_root_func, x0, a, b, maxiter, tol)
+    network_key = damping_search_key('nchannel', W, alpha_out_map)
+    context_key = (len(source_ixs), len(sink_ixs))
+    x, SPL = find_damping_factor(_root_func, network_key, context_key,
+                                 target_avg_path_length, 0.8, maxiter, tol)
     F, H = evaluate_context(SPL, source_ixs, sink_ixs)
     return x, F, H
 
@@ -257,6 +248,8 @@ class NormChannelAnalysis(BasicITM):
         self.dr = dr
 
         self._solve_boundary_problem(G, antisink_map, context_laplacian)
+        self._record_solver_stats()
+        self._apply_precision()
 
     def _solve_boundary_problem(self, G, antisink_map, SPL=None):
 
@@ -278,7 +271,8 @@ class NormChannelAnalysis(BasicITM):
                                            source_ixs,
                                            sink_ixs,
                                            alpha_out_map,
-                                           self.df)
+                                           self.df,
+                                           self.dtype)
             elif self.da is not None:
                 # Deviation from shortest path (averaged) - absolute
                 self.df, F, H = _process_context_mu_newton(W,
@@ -0,0 +1,195 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+Approximate evaluation of emitting and absorbing models by residual push.
+
+Instead of factorizing the Laplacian, the solution is built up locally,
+starting from the boundary: each node holds an approximation p and a
+residual r and pushing a node moves its residual into p and spreads it to
+the neighbours according to the transition matrix (Andersen, Chung and Lang
+2006). Only the nodes that receive a large enough residual are ever
+pushed.
+
+Since the damping factors are smaller than 1, the Green's function is
+bounded (all its entries and row sums are at most 1/(1-rho), where rho is
+the largest row sum of the transient part of the transition matrix) and the
+residuals give certified bounds on the error of p, which is always a lower
+bound of the exact solution.
+"""
+
+import numpy as np
+
+
+class ResidualPush(object):
+    """
+    Residual push solver for the transient part of the transition matrix
+    obtained by normalizing the rows of the adjacency matrix, multiplying
+    them by the damping factors and removing the rows and columns of the
+    boundary nodes (as in BasicLaplacian).
+
+    Arguments:
+      * W: graph adjacency matrix storage class instance;
+      * row_df: array of damping factors of the rows of the transition matrix;
+      * boundary_ixs: indices of the boundary nodes;
+      * transpose: if False, the solutions are rows of the Green's function
+          (emitting model), otherwise columns (absorbing model).
+    """
+
+    def __init__(self, W, row_df, boundary_ixs, transpose=False):
+
+        A = W._adjacency_matrix
+        n = A.shape[0]
+        self.boundary_ixs = list(boundary_ixs)
+        self.transpose = transpose
+
+        row_scale = np.zeros(n, 'd')
+        nz = W.row_weights > 0.0
+        row_scale[nz] = row_df[nz] / W.row_weights[nz]
+        transient = np.ones(n, 'd')
+        transient[self.boundary_ixs] = 0.0
+
+        row_sums = np.asarray(A.sum(1)).ravel() * row_scale * transient
+        self.rho = row_sums.max() if n else 0.0
+        if self.rho >= 1.0:
+            raise RuntimeError('Approximate evaluation requires all damping '
+                               'factors to be smaller than 1.')
+
+        # The entries of the transition matrix are obtained on the fly from
+        # the adjacency matrix as A_uv * row_scale[u]. Boundary columns are
+        # removed by the transient mask.
+        if transpose:
+            self.A = A.transpose().tocsr()
+            self.A.sort_indices()
+            self.push_scale = transient
+            self.nbr_scale = row_scale * transient
+        else:
+            self.A = A
+            self.push_scale = row_scale * transient
+            self.nbr_scale = transient
+
+        self.row_scale = row_scale
+        self.transient = transient
+
+    def boundary_residual(self, k):
+        """
+        Initial residual for the boundary node k: the row (or column if
+        transpose is True) k of the transition matrix, restricted to the
+        transient nodes.
+        """
+
+        A = self.A
+        r = np.zeros(A.shape[0], 'd')
+        cols = A.indices[A.indptr[k]:A.indptr[k+1]]
+        r[cols] = A.data[A.indptr[k]:A.indptr[k+1]] * self.nbr_scale[cols]
+        if not self.transpose:
+            r *= self.row_scale[k]
+        return r
+
+    def push(self, p, r, theta):
+        """
+        Push (in place) all residuals larger than theta until none is left.
+        All such residuals are pushed at once, so that the work is done by
+        sparse matrix operations. Returns the number of pushes.
+        """
+
+        num_pushes = 0
+        while True:
+            S = np.flatnonzero(r > theta)
+            if not len(S):
+                break
+            num_pushes += len(S)
+            rS = r[S]
+            p[S] += rS
+            r[S] = 0.0
+            r += (self.A[S].transpose() * (rS * self.push_scale[S])) * \
+                 self.nbr_scale
+        return num_pushes
+
+    def error_bound(self, r):
+        """
+        Upper bound on the error of any entry of the approximate solution
+        with the residual r.
+        """
+
+        if self.transpose:
+            return r.max() / (1.0 - self.rho)
+        else:
+            return r.sum() / (1.0 - self.rho)
+
+    def solve(self, tol, top_k=None, shrink=8.0):
+        """
+        Approximate the solutions for all boundary nodes so that the
+        error of each entry is at most tol. If top_k is given, the pushes
+        continue until, in addition, the top_k transient nodes by the total
+        (summed over all boundary nodes) are separated from the rest by more
+        than the error bound of the total, or the error bound falls to the
+        level of rounding errors (so that ties cannot be separated).
+
+        Returns the tuple (P, errors, top), where P is an array of lower
+        bounds of the solutions (one column per boundary node, with the
+        values at boundary nodes set to 0), errors the bounds on the errors
+        of each column and top the array of indices of the top_k nodes
+        ordered by total (None if top_k is None).
+        """
+
+        n = self.A.shape[0]
+        m = len(self.boundary_ixs)
+        P = np.zeros((n, m), 'd')
+        if m == 0:
+            return P, np.zeros(0, 'd'), None
+        R = [self.boundary_residual(k) for k in self.boundary_ixs]
+
+        theta = max(r.max() for r in R)
+        floor = tol * (1.0 - self.rho)
+        candidates = self.transient > 0.0
+        top = None
+
+        while True:
+            theta = max(theta / shrink, floor)
+            for j, r in enumerate(R):
+                self.push(P[:,j], r, theta)
+            errors = np.array([self.error_bound(r) for r in R])
+
+            if errors.max() <= tol:
+                if top_k is None:
+                    break
+                total = P.sum(1)
+                total[~candidates] = -1.0
+                order = np.argsort(-total, kind='mergesort')
+                top = order[:top_k]
+                if top_k >= candidates.sum() or \
+                   total[order[top_k-1]] - total[order[top_k]] >= \
+                   errors.sum() or \
+                   errors.sum() <= 1e-12 * max(total.max(), 1.0):
+                    break
+            if theta == floor:
+                floor /= shrink
+
+        return P, errors, top
@@ -0,0 +1,358 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+Evaluation of ITM Probe models over a range of damping factors.
+
+The results for all damping factors are saved into a single SQLite
+container. The tables that do not depend on the damping factor (properties,
+nodes, sources, sinks) are stored once, while the remaining tables of the
+standard ITM schema get an additional sweepid column referring to the sweep
+table. A standard ITM for one damping factor can be extracted using
+extract_sweep_slice().
+"""
+
+import sqlite3
+import numpy
+from .laplacian import BasicLaplacian
+from .laplacian import FullGraphLaplacian
+from .laplacian import fill_reducing_ordering
+from ...common.utils.parallel import solve_columns
+from .container import create_container
+from .container import copy_itm
+from .container import has_table
+from .container import query_column
+from .container import extract_itm
+
+# Columns of the tables that depend on damping factor
+_sweep_tables = [('shown_params', ['rnk', 'property', 'value']),
+                 ('damping', ['nodeid', 'dfout', 'dfin']),
+                 ('F', ['nodeid', 'sinkid', 'val']),
+                 ('H', ['sourceid', 'nodeid', 'val']),
+                 ]
+_shared_tables = ['properties', 'nodes', 'sources', 'sinks']
+
+sweep_schema = \
+"""
+CREATE TABLE sweep(
+  sweepid       INTEGER PRIMARY KEY,
+  df            REAL
+);
+"""
+
+
+class DampingFamily(object):
+    """
+    Green's functions of the whole graph for a family of damping factors
+    that share a single sparse factorization.
+
+    If the damping factor mask scales uniformly with the damping factor
+    (all antisink alphas are 0), the Laplacian for the damping factor df
+    satisfies L(df) = (1 - t) * I + t * L(df0), where t = df / df0. Taking
+    df0 as the largest damping factor, we factorize L(df0) once and run
+    Arnoldi iteration on its inverse. Since the Krylov subspaces do not
+    depend on t, one run solves the systems for all damping factors
+    (shifted GMRES). Any system that does not converge within maxiter
+    iterations is solved directly.
+    """
+
+    block_size = 32
+
+    def __init__(self, W, dfs, alpha_out_map, maxiter=150, tol=1e-11):
+
+        self.W = W
+        self.dfs = list(dfs)
+        self.alpha_out_map = alpha_out_map
+        self.df0 = max(self.dfs)
+        self.maxiter = maxiter
+        self.tol = tol
+        self.SPL0 = BasicLaplacian(W.copy(),
+                                   W.get_df_mask(self.df0, alpha_out_map,
+                                                 1.0, None))
+        # Only the Green's functions for the latest boundary are kept.
+        self._cache = {}
+
+    def laplacian(self, k):
+        """
+        Returns the FullGraphLaplacian for the k-th damping factor, to be
+        passed to a model as context_laplacian.
+        """
+
+        return SweepLaplacian(self, k)
+
+    def greens_cols(self, k, ixs, autoTranspose=False):
+        """
+        Returns the columns (autoTranspose == True) or the rows (as columns)
+        of the Green's function of the whole graph for the k-th damping
+        factor indexed by ixs.
+        """
+
+        key = (tuple(ixs), bool(autoTranspose))
+        if key not in self._cache:
+            if len(self._cache) > 1:
+                self._cache.clear()
+            self._cache[key] = self._shifted_solve(ixs, autoTranspose)
+        X = self._cache[key][k]
+        if X is None:
+            X = self._direct_solve(k, ixs, autoTranspose)
+            self._cache[key][k] = X
+        return X.copy()
+
+    def _direct_solve(self, k, ixs, autoTranspose):
+
+        W = self.W
+        df_mask = W.get_df_mask(self.dfs[k], self.alpha_out_map, 1.0, None)
+        SPL = BasicLaplacian(W.copy(), df_mask)
+        n = SPL.L.shape[0]
+        rhs = numpy.zeros((n, len(ixs)), 'd')
+        rhs[list(ixs), numpy.arange(len(ixs))] = 1.0
+        return solve_columns(lambda b: SPL.solve(b, autoTranspose), rhs)
+
+    def _shifted_solve(self, ixs, autoTranspose):
+
+        # The Krylov basis takes n * len(ixs) doubles per iteration, so the
+        # columns are processed in blocks.
+        n = self.SPL0.L.shape[0]
+        ixs = list(ixs)
+        X = [numpy.empty((n, len(ixs)), 'd') for df in self.dfs]
+        for start in xrange(0, len(ixs), self.block_size):
+            cols = slice(start, start + self.block_size)
+            Y = self._shifted_solve_block(ixs[cols], autoTranspose)
+            for i, Yi in enumerate(Y):
+                if Yi is None or X[i] is None:
+                    X[i] = None
+                else:
+                    X[i][:, cols] = Yi
+        return X
+
+    def _shifted_solve_block(self, ixs, autoTranspose):
+
+        # The systems for the columns of the right hand side are run in
+        # lockstep, so that each iteration needs only one block solve.
+        # Orthogonalization uses classical Gram-Schmidt applied twice.
+        n = self.SPL0.L.shape[0]
+        k = len(ixs)
+        ts = [df / self.df0 for df in self.dfs]
+        maxiter = min(self.maxiter, n)
+
+        # The basis is allocated in full, but only the pages of the vectors
+        # computed are touched.
+        V = numpy.empty((maxiter + 1, n, k), 'd')
+        V[0] = 0.0
+        V[0, ixs, numpy.arange(k)] = 1.0
+        H = numpy.zeros((maxiter + 1, maxiter, k), 'd')
+        converged = [None] * len(ts)
+
+        for j in xrange(maxiter):
+            w = solve_columns(lambda b: self.SPL0.solve(b, autoTranspose),
+                              V[j])
+            Vj = V[:j+1]
+            for _ in xrange(2):
+                h = numpy.einsum('jnk,nk->jk', Vj, w)
+                w -= numpy.einsum('jnk,jk->nk', Vj, h)
+                H[:j+1, j] += h
+            H[j+1, j] = numpy.sqrt((w * w).sum(0))
+            breakdown = (H[j+1, j] < 1e-14).any()
+            if not breakdown:
+                numpy.divide(w, H[j+1, j], V[j+1])
+            m = j + 1
+            if m % 5 and m < maxiter and not breakdown:
+                continue
+            for i, t in enumerate(ts):
+                if converged[i] is None:
+                    converged[i] = self._projected_solution(Vj, w, H, m, t)
+            if breakdown or all(x is not None for x in converged):
+                break
+
+        return converged
+
+    def _projected_solution(self, V, w, H, m, t):
+
+        # Minimize |e1 - ((1 - t) * C + t * I) * V_m * z| over z, where C is
+        # the inverse of L(df0). The solution of L(df)x = e is then
+        # x = C * V_m * z = V_m * H_m * z + w * h_{m+1,m} * z_m, where w is
+        # the unnormalized last Arnoldi vector. All right hand sides have
+        # unit norm.
+        k = V.shape[2]
+        X = numpy.empty((V.shape[1], k), 'd')
+        e1 = numpy.zeros(m + 1, 'd')
+        e1[0] = 1.0
+        I = numpy.eye(m + 1, m)
+        for c in xrange(k):
+            Hc = H[:m+1, :m, c]
+            A = (1.0 - t) * Hc + t * I
+            z = numpy.linalg.lstsq(A, e1, rcond=-1)[0]
+            if numpy.linalg.norm(e1 - numpy.dot(A, z)) > self.tol:
+                return None
+            X[:, c] = numpy.dot(V[:, :, c].T, numpy.dot(Hc[:m], z)) + \
+                      w[:, c] * z[-1]
+        return X
+
+
+class SweepLaplacian(FullGraphLaplacian):
+    """
+    FullGraphLaplacian for one damping factor of a DampingFamily. The
+    Green's functions of the whole graph are taken from the family instead
+    of being computed by a separate factorization.
+    """
+
+    use_symmetric_solver = False
+
+    def __init__(self, family, k):
+
+        self.family = family
+        self.k = k
+        W = family.W
+        df_mask = W.get_df_mask(family.dfs[k], family.alpha_out_map, 1.0,
+                                None)
+        super(SweepLaplacian, self).__init__(W.copy(), df_mask)
+
+    def _full_greens_cols(self, ixs, autoTranspose=False):
+
+        return self.family.greens_cols(self.k, ixs, autoTranspose)
+
+
+class DampingSweep(object):
+    """
+    Evaluates the model given by model_class for each damping factor in
+    dfs. The remaining keyword arguments are passed to model_class, which
+    must accept the df argument.
+
+    All models are computed on the same graph, so the fill-reducing
+    ordering (the symbolic part of sparse factorization) is computed only
+    once, unless the graph already has it. Where possible (emitting and
+    absorbing models without antisink dissipation), the Green's functions
+    for all damping factors are obtained from a single factorization (see
+    DampingFamily). Otherwise, each damping factor requires a separate
+    numerical factorization.
+
+    The models are computed one at a time by save(), which writes each
+    model to the container before computing the next one.
+    """
+
+    def __init__(self, model_class, G, dfs, **kwargs):
+
+        if kwargs.get('da') is not None or kwargs.get('dr') is not None:
+            raise RuntimeError('Damping factor sweep requires fixed damping '
+                               'factors.')
+        if not len(dfs):
+            raise RuntimeError('No damping factors specified for sweep.')
+
+        if G.node_ordering is None:
+            G = G.copy()
+            G.node_ordering = \
+                fill_reducing_ordering(G.weighted_adjacency_matrix())
+
+        self.model_class = model_class
+        self.G = G
+        self.dfs = [float(df) for df in dfs]
+        self.kwargs = kwargs
+
+    def _family(self):
+
+        kwargs = self.kwargs
+        antisink_map = kwargs.get('antisink_map') or {}
+        G = self.G
+        if getattr(self.model_class, 'mode', None) not in \
+               ('emitting', 'absorbing') or \
+           kwargs.get('approximate') or \
+           kwargs.get('context_laplacian') is not None or \
+           max(self.dfs) > (1.0 - 1e-3) or \
+           any(antisink_map[p] != 0.0 for p in antisink_map
+               if G.has_node(p)):
+            return None
+        alpha_out_map = dict((G.node2index[p], antisink_map[p]) \
+                             for p in antisink_map if G.has_node(p))
+        return DampingFamily(G.weighted_adjacency_matrix(), self.dfs,
+                             alpha_out_map)
+
+    def iter_models(self):
+        """
+        Yields the pairs (df, model), computing each model only when
+        requested.
+        """
+
+        family = self._family()
+        for k, df in enumerate(self.dfs):
+            kwargs = dict(self.kwargs)
+            if family is not None:
+                kwargs['context_laplacian'] = family.laplacian(k)
+            yield df, self.model_class(self.G, df=df, **kwargs)
+
+    def save(self, sqlite_db):
+        """
+        Compute all models and save their results into SQLite container. If
+        sqlite_db exists, it is removed before being reinitialized.
+        """
+
+        conn = create_container(sqlite_db, sweep_schema, _sweep_tables,
+                                'sweepid', _shared_tables)
+        for sweepid, (df, model) in enumerate(self.iter_models()):
+            conn.execute('INSERT INTO sweep VALUES (?, ?)', (sweepid, df))
+
+            # Save the model as a standard ITM and copy it over.
+            mem_conn = sqlite3.connect(':memory:')
+            mem_conn.text_factory = str
+            model.save(mem_conn)
+            del model
+            shared_tables = _shared_tables if sweepid == 0 else ()
+            copy_itm(mem_conn, conn, _sweep_tables, sweepid, shared_tables)
+            mem_conn.close()
+            conn.commit()
+        conn.close()
+
+
+def is_sweep_file(sqlite_db):
+    """Checks whether sqlite_db is a damping factor sweep container."""
+
+    return has_table(sqlite_db, 'sweep')
+
+
+def sweep_dfs(sqlite_db):
+    """Returns the list of damping factors stored in the sweep container."""
+
+    return query_column(sqlite_db, 'SELECT df FROM sweep ORDER BY sweepid')
+
+
+def extract_sweep_slice(sqlite_db, df):
+    """
+    Extracts the ITM for damping factor df from the sweep container
+    sqlite_db. Returns an in-memory SQLite connection with the standard ITM
+    tables, which can be passed to the report functions in place of an ITM
+    file.
+    """
+
+    sweepids = query_column(sqlite_db, 'SELECT sweepid FROM sweep WHERE '
+                            'abs(df - ?) < 1e-9', (df, ))
+    if not sweepids:
+        available = ', '.join('%g' % x for x in sweep_dfs(sqlite_db))
+        raise RuntimeError('Damping factor %g not found in sweep (available: '
+                           '%s).' % (df, available))
+    return extract_itm(sqlite_db, _sweep_tables, 'sweepid', sweepids[0],
+                       _shared_tables)
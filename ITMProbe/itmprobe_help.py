@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-standalone_run="""Usage: %(program)s standalone-run <input_file>
+standalone_run="""Usage: %(program)s standalone-run [OPTIONS] <input_file>
 
 Run ITM Probe with the full input graph supplied in input file. Output is
 full report printed to stdout.
@@ -9,6 +9,11 @@ Arguments:
 
    <input_file>:  A file in JSON format with ITM Probe arguments. If the
                   file is omitted, use stdin.
+
+Options:
+
+   -j, --threads=<int>
+           Number of threads used to solve the linear systems
 """
 
 custom_image="""Usage: %(program)s custom-image [OPTIONS] <output_file> <layout_file>
@@ -34,7 +39,7 @@ Options:
           Produce color mixture image
 """
 
-run="""Usage: %(program)s run <input_file> <output_file>
+run="""Usage: %(program)s run [OPTIONS] <input_file> <output_file>
 
 Run ITM Probe
 
@@ -42,15 +47,71 @@ Arguments:
 
    <input_file>:   A file in JSON format with ITM Probe arguments
    <output_file>:  An SQLite database where the results are output
+
+Options:
+
+   -j, --threads=<int>
+           Number of threads used to solve the linear systems
 """
 
-batch_run="""Usage: %(program)s batch-run <input_file>
+batch_run="""Usage: %(program)s batch-run [OPTIONS] <input_file>
 
 Run several ITM Probe jobs in one batch.
 
 Arguments:
 
    <input_file>:  A file in JSON format with ITM Probe batch arguments.
+
+Options:
+
+   -j, --threads=<int>
+           Number of threads used to solve the linear systems
+"""
+
+sweep="""Usage: %(program)s sweep [OPTIONS] <input_file> <output_file>
+
+Run ITM Probe for several damping factors in one job
+
+Arguments:
+
+   <input_file>:   A file in JSON format with ITM Probe arguments. The
+                   damping factors are given as a list under 'dfs'.
+   <output_file>:  An SQLite database where the results for all damping
+                   factors are output
+
+Options:
+
+   -j, --threads=<int>
+           Number of threads used to solve the linear systems
+"""
+
+greens="""Usage: %(program)s greens <input_file> <output_file>
+
+Precompute the Green's function of the whole graph
+
+Arguments:
+
+   <input_file>:   A file in JSON format specifying the graph, the damping
+                   factor (df), antisinks (antisink_map) and optionally
+                   the precision (dtype, 'float32' or 'float64')
+   <output_file>:  A NumPy (.npy) file where the Green's function is output.
+                   The parameters are output into the file with the same
+                   name and the extension .json. The file can be used as
+                   'greens_path' in the input of run, standalone-run and
+                   batch-run
+"""
+
+export_graph="""Usage: %(program)s export-graph <graph_file> <output_file>
+
+Write a graph in the binary graph format
+
+Arguments:
+
+   <graph_file>:   A pickled graph (.pkl), a binary graph (.bin) or a file
+                   in JSON format specifying the graph (.json)
+   <output_file>:  The binary graph file. It can be used as
+                   'graph_bin_path' in the input of ITM Probe commands or
+                   uploaded (gzip-compressed) with a standalone run
 """
 
 report="""Usage: %(program)s report [OPTIONS] <ITM_file>
@@ -81,6 +142,12 @@ Options:
                   Retrieve only rows where the --order-by column values
                   are greater than specified value. This option is
                   superseded by the ---use-p-ratio option
+   -d, --df=<real>
+                  Report only the ITM for the given damping factor from a
+                  damping factor sweep (default: report all)
+   -n, --network=<label>
+                  Report only the ITM for the given network from a
+                  multi-network bundle (default: report all)
 """
 
 table="""Usage: %(program)s table [OPTIONS] <script_file> <ITM_file> ...
@@ -205,6 +272,9 @@ Commands:
    run:             run ITM Probe model
    standalone-run:  run ITM Probe model and output full report
    batch-run:       run several ITM Probe jobs in one batch
+   sweep:           run ITM Probe model for several damping factors
+   greens:          precompute the Green's function of the whole graph
+   export-graph:    write a graph in the binary graph format
    table:           print a table from ITMs using custom script
    report:          print default report tables from an ITM
    layout:          produce Graphviz layout from ITMs using default
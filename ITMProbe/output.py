@@ -64,10 +64,13 @@ def formatted_table(data, column_headers, column_formats, title):
     return title, column_headers, body, float_cols
 
 
-def print_table_text(title, column_headers, body, fp=sys.stdout,
+def print_table_text(title, column_headers, body, fp=None,
                       max_header_width=12):
     """Print table as plain text."""
 
+    if fp is None:
+        fp = sys.stdout
+
     # Column widths are either the header widths or maximum lenghts of content
     if column_headers is None:
         column_widths = [0] * len(body[0])
@@ -102,9 +105,12 @@ def print_table_text(title, column_headers, body, fp=sys.stdout,
     fp.write('\n')
 
 
-def print_table_csv(title, column_headers, body, fp=sys.stdout):
+def print_table_csv(title, column_headers, body, fp=None):
     """Print table in CSV format."""
 
+    if fp is None:
+        fp = sys.stdout
+
     writer = csv.writer(fp)
     if title is not None:
         writer.writerow(['* %s *' % title])
@@ -116,9 +122,12 @@ def print_table_csv(title, column_headers, body, fp=sys.stdout):
     writer.writerow([])
 
 
-def print_table_tab(title, column_headers, body, fp=sys.stdout):
+def print_table_tab(title, column_headers, body, fp=None):
     """Print table in TAB-delimited format."""
 
+    if fp is None:
+        fp = sys.stdout
+
     if title is not None:
         fp.write("#\n# %s\n#\n" % title.upper())
 
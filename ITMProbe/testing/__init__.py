@@ -0,0 +1,94 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+Tests and benchmarks of ITM Probe and the supporting graph code.
+
+The tests (test_*.py) are plain unittest modules. To run them all, from the
+directory containing the qmbpmn package:
+
+    python -m unittest discover -s qmbpmn -p 'test_*.py' -t .
+
+The benchmarks (bench_*.py) are scripts run as modules, for example
+
+    python -m qmbpmn.ITMProbe.testing.bench_graph_copies --help
+"""
+
+import os
+import numpy as np
+from scipy.sparse import csr_matrix
+from ...common.utils.dataobj import restore_data_object
+from ...common.graph.csrgraph import CSRDirectedGraph
+
+INPUTS_DIR = os.path.join(os.path.dirname(__file__), 'inputs')
+
+_test_graph = None
+
+def load_test_graph():
+    """
+    The yeast network (about 4000 nodes) shipped with the test inputs. The
+    graph is loaded once and shared, so it must not be modified.
+    """
+
+    global _test_graph
+    if _test_graph is None:
+        from ..commands import graph_from_kwargs
+        kwargs = restore_data_object(os.path.join(INPUTS_DIR,
+                                                  'test_graph.json'))
+        graph_from_kwargs(kwargs)
+        _test_graph = kwargs['G']
+    return _test_graph
+
+
+def load_test_input(name):
+    """ Model arguments from one of the JSON test inputs. """
+
+    return restore_data_object(os.path.join(INPUTS_DIR, '%s.json' % name))
+
+
+def random_graph(num_nodes, degree=10, seed=1, symmetric=True):
+    """
+    Random graph with num_nodes nodes and about degree neighbours per node,
+    with unit weights and zero-weight self-loops. Used by the benchmarks to
+    produce networks larger than the test inputs.
+    """
+
+    rng = np.random.RandomState(seed)
+    rows = np.repeat(np.arange(num_nodes), degree // 2 or 1)
+    cols = rng.randint(0, num_nodes, len(rows))
+    if symmetric:
+        rows, cols = np.concatenate([rows, cols]), np.concatenate([cols, rows])
+    keep = rows != cols
+    rows = np.concatenate([rows[keep], np.arange(num_nodes)])
+    cols = np.concatenate([cols[keep], np.arange(num_nodes)])
+    data = np.concatenate([np.ones(keep.sum()), np.zeros(num_nodes)])
+    A = csr_matrix((data, (rows, cols)), shape=(num_nodes, num_nodes))
+    A.data = np.minimum(A.data, 1.0)
+    nodes = ['N%d' % i for i in xrange(num_nodes)]
+    return CSRDirectedGraph(A, nodes)
@@ -0,0 +1,187 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+"""
+Memory benchmark of adjacency matrix copies.
+
+Runs an emitting query with a damping factor search (which copies the
+adjacency matrix for every Newton step) once with the copy-on-write copies
+and once with full copies of the matrix (the earlier behaviour), each in a
+fresh process, and reports the peak memory used by the query.
+
+SYNOPSIS:
+
+    python -m qmbpmn.ITMProbe.testing.bench_graph_copies [OPTIONS]
+
+OPTIONS:
+    -g, --graph         network graph (pickled, or binary if ending in .bin)
+                        instead of the test graph
+    -r, --replicate     number of linked copies of the test graph in the
+                        benchmark network (default 10)
+    -s, --sources       number of source nodes (default 5)
+    -h, --help          print this message
+"""
+
+import sys
+import time
+import getopt
+import resource
+import subprocess
+import numpy as np
+from scipy.sparse import block_diag
+from ...common.graph.csrgraph import CSRDirectedGraph
+from ...common.graph.adjmatrix import CSRAdjacencyMatrix
+from ..core.emitting import EmittingAnalysis
+from ..core.laplacian import fill_reducing_ordering
+from ..commands import graph_from_kwargs
+from . import load_test_graph
+
+
+def replicated_graph(num_copies):
+    """
+    Network made of num_copies copies of the test graph, linked in a chain
+    through their first nodes.
+    """
+
+    G = load_test_graph()
+    A = G._adjacency_matrix
+    n = A.shape[0]
+    B = block_diag([A] * num_copies, format='lil')
+    for k in xrange(num_copies - 1):
+        B[k*n, (k+1)*n] = B[(k+1)*n, k*n] = 1.0
+    nodes = ['%s_%d' % (v, k) for k in xrange(num_copies) for v in G.nodes]
+    return CSRDirectedGraph(B.tocsr(), nodes)
+
+
+def _load_graph(graph_file, num_copies):
+
+    if graph_file is None:
+        G = replicated_graph(num_copies)
+    else:
+        kwargs = {'graph_bin_path' if graph_file.endswith('.bin') \
+                  else 'graph_path': graph_file}
+        graph_from_kwargs(kwargs)
+        G = kwargs['G']
+    # As for the shipped networks
+    if G.node_ordering is None:
+        G.node_ordering = fill_reducing_ordering(G.weighted_adjacency_matrix())
+    return G
+
+
+def _deep_copy(self):
+    A = self._adjacency_matrix.copy()
+    return self.__class__(A, self.diagonal_ix, self.nodes, self.node2index,
+                          self.row_weights, node_ordering=self.node_ordering)
+
+
+def use_deep_copies():
+    """ Replace copy-on-write copies by full copies of the matrix. """
+
+    CSRAdjacencyMatrix.copy = _deep_copy
+    weighted_adjacency_matrix = CSRDirectedGraph.weighted_adjacency_matrix
+    def _copied_adjacency_matrix(self, transpose=False):
+        W = weighted_adjacency_matrix(self, transpose)
+        W._adjacency_matrix = W._adjacency_matrix.copy()
+        W._adjacency_matrix.data.flags.writeable = True
+        W._data_refs = [1]
+        return W
+    CSRDirectedGraph.weighted_adjacency_matrix = _copied_adjacency_matrix
+
+
+def run_query(G, num_sources):
+    """ Returns the peak memory increase (MB) and time of the query. """
+
+    rng = np.random.RandomState(0)
+    sources = [G.nodes[i] for i in rng.choice(len(G.nodes), num_sources,
+                                              False)]
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.time()
+    EmittingAnalysis(G, sources, df=None, da=20.0)
+    elapsed = time.time() - t0
+    rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (rss1 - rss0) / 1024.0, elapsed
+
+
+def _bench_process(mode, graph_file, num_copies, num_sources):
+
+    G = _load_graph(graph_file, num_copies)
+    if mode == 'deep':
+        use_deep_copies()
+    mem, elapsed = run_query(G, num_sources)
+    print '%d %d %.1f %.2f' % (len(G.nodes), G._adjacency_matrix.nnz, mem,
+                               elapsed)
+
+
+def main(graph_file, num_copies, num_sources):
+
+    print '%-14s %9s %10s %14s %8s' % ('Copies', 'Nodes', 'Edges',
+                                       'Peak mem (MB)', 'Time (s)')
+    for mode, label in (('deep', 'full'), ('cow', 'copy-on-write')):
+        cmd = [sys.executable, '-m', '%s.bench_graph_copies' % __package__,
+               '--run', mode,
+               '-r', str(num_copies), '-s', str(num_sources)]
+        if graph_file is not None:
+            cmd += ['-g', graph_file]
+        output = subprocess.check_output(cmd).split()
+        print '%-14s %9s %10s %14s %8s' % tuple([label] + output)
+
+
+if __name__ == '__main__':
+
+    options = 'hg:r:s:'
+    long_options = ['help', 'graph=', 'replicate=', 'sources=', 'run=']
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], options, long_options)
+        graph_file = None
+        num_copies = 10
+        num_sources = 5
+        mode = None
+        for o, a in opts:
+            if o in ('-h', '--help'):
+                print __doc__
+                sys.exit()
+            elif o in ('-g', '--graph'):
+                graph_file = a
+            elif o in ('-r', '--replicate'):
+                num_copies = int(a)
+            elif o in ('-s', '--sources'):
+                num_sources = int(a)
+            elif o == '--run':
+                mode = a
+
+        if mode is None:
+            main(graph_file, num_copies, num_sources)
+        else:
+            _bench_process(mode, graph_file, num_copies, num_sources)
+
+    except getopt.GetoptError:
+        print __doc__
+        sys.exit(2)
@@ -0,0 +1,158 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+"""
+Scaling benchmark of the normalized channel damping factor search.
+
+Runs normalized channel queries with the dissipation given by dr (so that
+the damping factor is found by a root search) for varying numbers of
+sources and sinks, and reports the time, the number of block solves and
+the number of solved columns. The solves are done for the sinks only, so
+the time should grow with the number of sinks rather than with the number
+of source-sink pairs.
+
+SYNOPSIS:
+
+    python -m qmbpmn.ITMProbe.testing.bench_nchannel [OPTIONS]
+
+OPTIONS:
+    -g, --graph         network graph (pickled, or binary if ending in .bin)
+                        instead of the test graph
+    -s, --sources       comma-separated numbers of sources (default 1,4,16)
+    -k, --sinks         comma-separated numbers of sinks (default 1,4,16)
+    -d, --dr            relative deviation from the shortest path length
+                        (default 1.0)
+    -h, --help          print this message
+"""
+
+import sys
+import time
+import getopt
+import numpy as np
+from ...common.utils.newton import RootHistory
+from ..core.nchannel import NormChannelAnalysis
+from ..core import laplacian
+from ..core.laplacian import fill_reducing_ordering
+from ..commands import graph_from_kwargs
+from .. import core
+from . import load_test_graph
+
+
+def _load_graph(graph_file):
+
+    if graph_file is None:
+        G = load_test_graph()
+    else:
+        kwargs = {'graph_bin_path' if graph_file.endswith('.bin') \
+                  else 'graph_path': graph_file}
+        graph_from_kwargs(kwargs)
+        G = kwargs['G']
+    if G.node_ordering is None:
+        G.node_ordering = fill_reducing_ordering(G.weighted_adjacency_matrix())
+    return G
+
+
+def pick_nodes(G, num_sources, num_sinks, seed=0):
+    """ Disjoint random sources and sinks among the well connected nodes. """
+
+    A = G._adjacency_matrix
+    degrees = np.diff(A.indptr)
+    candidates = np.flatnonzero(degrees >= np.median(degrees))
+    rng = np.random.RandomState(seed)
+    ixs = rng.choice(candidates, num_sources + num_sinks, False)
+    nodes = [G.nodes[i] for i in ixs]
+    return nodes[:num_sources], nodes[num_sources:]
+
+
+_counts = {'calls': 0, 'columns': 0}
+_solve_columns = laplacian.solve_columns
+
+def _counting_solve_columns(solve, rhs):
+    _counts['calls'] += 1
+    _counts['columns'] += rhs.shape[1]
+    return _solve_columns(solve, rhs)
+
+laplacian.solve_columns = _counting_solve_columns
+
+
+def run_query(G, num_sources, num_sinks, dr):
+    """ Returns the time, block solves and columns solved by the query. """
+
+    sources, sinks = pick_nodes(G, num_sources, num_sinks)
+    # No warm start from previous queries
+    core.df_history = RootHistory()
+    _counts.update(calls=0, columns=0)
+    t0 = time.time()
+    NormChannelAnalysis(G, sources, sinks, df=None, dr=dr)
+    elapsed = time.time() - t0
+    return elapsed, _counts['calls'], _counts['columns']
+
+
+def main(graph_file, source_counts, sink_counts, dr):
+
+    G = _load_graph(graph_file)
+    fmt = '%8s %6s %9s %8s %8s'
+    print fmt % ('Sources', 'Sinks', 'Time (s)', 'Solves', 'Columns')
+    for num_sinks in sink_counts:
+        for num_sources in source_counts:
+            elapsed, calls, columns = run_query(G, num_sources, num_sinks, dr)
+            print fmt % (num_sources, num_sinks, '%.2f' % elapsed, calls,
+                         columns)
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+
+    options = 'hg:s:k:d:'
+    long_options = ['help', 'graph=', 'sources=', 'sinks=', 'dr=']
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], options, long_options)
+        graph_file = None
+        source_counts = [1, 4, 16]
+        sink_counts = [1, 4, 16]
+        dr = 1.0
+        for o, a in opts:
+            if o in ('-h', '--help'):
+                print __doc__
+                sys.exit()
+            elif o in ('-g', '--graph'):
+                graph_file = a
+            elif o in ('-s', '--sources'):
+                source_counts = [int(x) for x in a.split(',')]
+            elif o in ('-k', '--sinks'):
+                sink_counts = [int(x) for x in a.split(',')]
+            elif o in ('-d', '--dr'):
+                dr = float(a)
+        main(graph_file, source_counts, sink_counts, dr)
+
+    except getopt.GetoptError:
+        print __doc__
+        sys.exit(2)
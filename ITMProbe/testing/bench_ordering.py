@@ -0,0 +1,177 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+"""
+Benchmark of sparse LU factorization under different node orderings.
+
+For each network, the Laplacian (damping factor 0.85) is factorized with
+SuperLU's default COLAMD column ordering, with minimum degree on L^T + L
+computed at factorization time, and with the node ordering stored in the
+network graph (NATURAL column order). The table reports the factorization
+time, the number of nonzeros in the LU factors and the time of a solve
+with 10 right hand sides.
+
+SYNOPSIS:
+
+    python -m qmbpmn.ITMProbe.testing.bench_ordering [OPTIONS] [NETWORK ...]
+
+Each NETWORK is a graph file (pickled, binary if ending in .bin, or a JSON
+input) or a web network configuration (*net.cfg). A directory stands for
+all network configurations in it, such as the ITMProbe network directory of
+a deployment. Without arguments, the test graph and a network made of
+linked copies of it are used.
+
+OPTIONS:
+    -r, --replicate     number of copies of the test graph in the larger
+                        default network (default 5)
+    -h, --help          print this message
+"""
+
+import os
+import sys
+import time
+import getopt
+import numpy as np
+from scipy.sparse.linalg import dsolve
+from ...common.utils.dataobj import restore_data_object
+from ..core.laplacian import BasicLaplacian
+from ..core.laplacian import fill_reducing_ordering
+from ..commands import graph_from_kwargs
+from .bench_graph_copies import replicated_graph
+from . import load_test_graph
+
+
+def _graph_file(network_file):
+
+    config = restore_data_object(network_file)
+    return os.path.join(os.path.dirname(network_file), config['graph_file'])
+
+
+def load_networks(paths):
+    """ Yields (name, graph) for the networks given on the command line. """
+
+    for path in paths:
+        if os.path.isdir(path):
+            network_files = sorted(os.path.join(path, f) \
+                                   for f in os.listdir(path) \
+                                   if f.endswith('net.cfg'))
+        else:
+            network_files = [path]
+        for network_file in network_files:
+            if network_file.endswith('net.cfg'):
+                graph_file = _graph_file(network_file)
+            else:
+                graph_file = network_file
+            if graph_file.endswith('.bin'):
+                kwargs = {'graph_bin_path': graph_file}
+            elif graph_file.endswith('.json'):
+                kwargs = restore_data_object(graph_file)
+            else:
+                kwargs = {'graph_path': graph_file}
+            graph_from_kwargs(kwargs, graph_file)
+            yield os.path.basename(network_file), kwargs['G']
+
+
+def _factorize(SPL, permc_spec):
+
+    A = SPL._get_ordered_L().transpose()
+    t0 = time.time()
+    lu = dsolve.splu(A, permc_spec=permc_spec)
+    elapsed = time.time() - t0
+    rhs = np.random.RandomState(0).rand(A.shape[0], 10)
+    t0 = time.time()
+    lu.solve(rhs)
+    return elapsed, lu.L.nnz + lu.U.nnz, time.time() - t0
+
+
+def bench_network(G):
+    """
+    Returns a list of (ordering, factorization time, LU nonzeros, solve
+    time) for the graph G.
+    """
+
+    W = G.weighted_adjacency_matrix()
+    W.node_ordering = None
+    SPL = BasicLaplacian(W, W.get_df_mask(0.85))
+    results = []
+    for permc_spec in ('COLAMD', 'MMD_AT_PLUS_A'):
+        results.append((permc_spec, ) + _factorize(SPL, permc_spec))
+
+    node_ordering = G.node_ordering
+    label = 'stored'
+    if node_ordering is None:
+        node_ordering = fill_reducing_ordering(G.weighted_adjacency_matrix())
+        label = 'computed'
+    W = G.weighted_adjacency_matrix()
+    W.node_ordering = node_ordering
+    SPL = BasicLaplacian(W, W.get_df_mask(0.85))
+    results.append((label, ) + _factorize(SPL, 'NATURAL'))
+    return results
+
+
+def main(paths, num_copies):
+
+    if paths:
+        networks = load_networks(paths)
+    else:
+        networks = [('test_graph', load_test_graph()),
+                    ('test_graph x %d' % num_copies,
+                     replicated_graph(num_copies))]
+
+    fmt = '%-24s %8s %9s %-14s %9s %11s %9s'
+    print fmt % ('Network', 'Nodes', 'Edges', 'Ordering', 'Factor(s)',
+                 'LU nonzeros', 'Solve(s)')
+    for name, G in networks:
+        for ordering, t_factor, lu_nnz, t_solve in bench_network(G):
+            print fmt % (name[:24], len(G.nodes), G._adjacency_matrix.nnz,
+                         ordering, '%.3f' % t_factor, lu_nnz,
+                         '%.3f' % t_solve)
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+
+    options = 'hr:'
+    long_options = ['help', 'replicate=']
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], options, long_options)
+        num_copies = 5
+        for o, a in opts:
+            if o in ('-h', '--help'):
+                print __doc__
+                sys.exit()
+            elif o in ('-r', '--replicate'):
+                num_copies = int(a)
+        main(args, num_copies)
+
+    except getopt.GetoptError:
+        print __doc__
+        sys.exit(2)
@@ -0,0 +1,140 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+"""Tests of the binary graph format."""
+
+import os
+import json
+import gzip
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from cStringIO import StringIO
+from qmbpmn.common.graph.csrgraph import read_binary_graph
+from qmbpmn.ITMProbe import commands
+from qmbpmn.ITMProbe.core.laplacian import fill_reducing_ordering
+from qmbpmn.ITMProbe.testing import INPUTS_DIR
+from qmbpmn.ITMProbe.testing import load_test_graph
+from qmbpmn.ITMProbe.testing import load_test_input
+
+
+def standalone_input(name):
+    """ A test input without the graph, as a JSON stream. """
+
+    kwargs = load_test_input(name)
+    for key in ('graph', 'graph_path', 'graph_bin_path'):
+        kwargs.pop(key, None)
+    return StringIO(json.dumps(kwargs))
+
+
+def report_lines(conn):
+
+    fp = StringIO()
+    commands.standalone_report(conn, fp)
+    return fp.getvalue().splitlines()
+
+
+class BinaryGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.G = load_test_graph()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assertSameGraph(self, G1, G2):
+        A1 = G1._adjacency_matrix
+        A2 = G2._adjacency_matrix
+        self.assertEqual(list(G1.nodes), list(G2.nodes))
+        self.assertTrue(np.all(A1.indptr == A2.indptr))
+        self.assertTrue(np.all(A1.indices == A2.indices))
+        self.assertTrue(np.all(A1.data == A2.data))
+
+    def test_round_trip(self):
+        fp = StringIO()
+        self.G.tobinary(fp)
+        fp.seek(0)
+        G = read_binary_graph(fp)
+        self.assertSameGraph(self.G, G)
+        self.assertTrue(G.node_ordering is None)
+
+    def test_node_attributes(self):
+        G = read_binary_graph(self._binary_file(self.G))
+        n = len(G.nodes)
+        G.node_weights = np.linspace(1.0, 2.0, n)
+        G.node_ordering = fill_reducing_ordering(G.weighted_adjacency_matrix())
+        G2 = read_binary_graph(self._binary_file(G, 'G2.bin'))
+        self.assertSameGraph(G, G2)
+        self.assertTrue(np.all(G2.node_weights == G.node_weights))
+        self.assertTrue(np.all(G2.node_ordering == G.node_ordering))
+
+    def test_truncated_file(self):
+        fp = StringIO()
+        self.G.tobinary(fp)
+        data = fp.getvalue()
+        self.assertRaises(IOError, read_binary_graph,
+                          StringIO(data[:len(data) // 2]))
+        self.assertRaises(IOError, read_binary_graph, StringIO('CSRGRAPX'))
+
+    def test_export_graph(self):
+        out_file = os.path.join(self.tmp_dir, 'exported.bin')
+        commands.export_graph(out_file,
+                              os.path.join(INPUTS_DIR, 'test_graph.json'))
+        kwargs = {'graph_bin_path': out_file}
+        commands.graph_from_kwargs(kwargs)
+        self.assertSameGraph(self.G, kwargs['G'])
+
+    def test_standalone_model(self):
+        # The same query with the graph given inline and in binary format
+        kwargs = load_test_input('emitting_test')
+        kwargs.pop('graph_path')
+        kwargs.update(load_test_input('test_graph'))
+        conn1 = commands.standalone_model(StringIO(json.dumps(kwargs)))
+
+        gz_fp = StringIO()
+        out_fp = gzip.GzipFile(mode='wb', fileobj=gz_fp)
+        self.G.tobinary(out_fp)
+        out_fp.close()
+        gz_fp.seek(0)
+        G = read_binary_graph(gzip.GzipFile(mode='rb', fileobj=gz_fp))
+        conn2 = commands.standalone_model(standalone_input('emitting_test'),
+                                          G=G)
+        self.assertEqual(report_lines(conn1), report_lines(conn2))
+
+    def _binary_file(self, G, name='G.bin'):
+        path = os.path.join(self.tmp_dir, name)
+        G.tobinary(path)
+        return path
+
+
+if __name__ == '__main__':
+    unittest.main()
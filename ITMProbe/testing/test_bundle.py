@@ -0,0 +1,101 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+"""Tests of multi-network bundles."""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from qmbpmn.ITMProbe.core.emitting import EmittingAnalysis
+from qmbpmn.ITMProbe.core.bundle import save_bundle
+from qmbpmn.ITMProbe.core.bundle import is_bundle_file
+from qmbpmn.ITMProbe.core.bundle import bundle_labels
+from qmbpmn.ITMProbe.core.bundle import bundle_messages
+from qmbpmn.ITMProbe.core.bundle import extract_bundle_slice
+from qmbpmn.ITMProbe.core.sweep import is_sweep_file
+from qmbpmn.ITMProbe.testing import load_test_graph
+
+
+class BundleTest(unittest.TestCase):
+
+    tables = ['shown_params', 'properties', 'nodes', 'sources', 'sinks',
+              'damping', 'F', 'H']
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        G = load_test_graph()
+        self.itm_files = []
+        for k, sources in enumerate([['CDC42'], ['BEM1', 'STE12']]):
+            itm_file = os.path.join(self.tmp_dir, 'net%d.sqlite' % k)
+            EmittingAnalysis(G, df=0.85, source_nodes=sources).save(itm_file)
+            self.itm_files.append(itm_file)
+        self.bundle_file = os.path.join(self.tmp_dir, 'bundle.sqlite')
+
+        # One ITM passed as a connection, one as a file
+        conn = sqlite3.connect(self.itm_files[1])
+        conn.text_factory = str
+        save_bundle(self.bundle_file,
+                    [('net0', self.itm_files[0], []),
+                     ('missing', None, ['Query nodes not found.']),
+                     ('net1', conn, ['Some warning.'])])
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_labels(self):
+        self.assertTrue(is_bundle_file(self.bundle_file))
+        self.assertFalse(is_sweep_file(self.bundle_file))
+        self.assertFalse(is_bundle_file(self.itm_files[0]))
+        self.assertEqual(bundle_labels(self.bundle_file), ['net0', 'net1'])
+        self.assertEqual(bundle_labels(self.bundle_file, False),
+                         ['net0', 'missing', 'net1'])
+        self.assertEqual(bundle_messages(self.bundle_file),
+                         [('missing', 'Query nodes not found.'),
+                          ('net1', 'Some warning.')])
+
+    def test_extract_slice(self):
+        for label, itm_file in zip(['net0', 'net1'], self.itm_files):
+            conn = extract_bundle_slice(self.bundle_file, label)
+            itm_conn = sqlite3.connect(itm_file)
+            itm_conn.text_factory = str
+            for tbl in self.tables:
+                sql = 'SELECT * FROM %s ORDER BY rowid' % tbl
+                self.assertEqual(conn.execute(sql).fetchall(),
+                                 itm_conn.execute(sql).fetchall(), tbl)
+            itm_conn.close()
+            conn.close()
+
+    def test_missing_slice(self):
+        self.assertRaises(RuntimeError, extract_bundle_slice,
+                          self.bundle_file, 'missing')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+"""Tests of the damping factor searches and their history."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import numpy as np
+from qmbpmn.common.utils.newton import RootHistory
+from qmbpmn.common.utils.newton import SQLiteRootHistory
+from qmbpmn.ITMProbe import core
+from qmbpmn.ITMProbe.core import damping_search_key
+from qmbpmn.ITMProbe.core import find_damping_factor
+from qmbpmn.ITMProbe.core import set_progress_callback
+from qmbpmn.ITMProbe.core.emitting import EmittingAnalysis
+from qmbpmn.ITMProbe.core.laplacian import BasicLaplacian
+from qmbpmn.ITMProbe.testing import load_test_graph
+
+
+class RootHistoryTest(unittest.TestCase):
+
+    def test_interpolation(self):
+        history = RootHistory()
+        self.assertEqual(history.estimate('a', 1.0, 0.5), 0.5)
+        history.record('a', 1.0, 0.2)
+        history.record('a', 3.0, 0.6)
+        self.assertAlmostEqual(history.estimate('a', 2.0), 0.4)
+        self.assertAlmostEqual(history.estimate('a', 5.0), 0.6)
+
+    def test_threads(self):
+        history = RootHistory(max_keys=5, max_targets=3)
+        errors = []
+        def _worker(k):
+            try:
+                for i in xrange(2000):
+                    history.record(i % 7, (k * i) % 11, 0.5)
+                    history.estimate(i % 7, 3.0)
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=_worker, args=(k, ))
+                   for k in xrange(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(len(history._roots) <= 5)
+
+
+class SQLiteRootHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'history.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_persistence(self):
+        key = ('emitting', 'ABCD', ((3, 0.0), ))
+        history = SQLiteRootHistory(self.path)
+        self.assertEqual(history.estimate(key, 1.0, 0.5), 0.5)
+        history.record(key, 1.0, 0.2)
+        history.record(key, 3.0, 0.6)
+
+        # Another process opening the same database
+        history = SQLiteRootHistory(self.path)
+        self.assertAlmostEqual(history.estimate(key, 2.0), 0.4)
+        self.assertEqual(history.estimate(('emitting', ), 2.0), None)
+
+    def test_limits(self):
+        history = SQLiteRootHistory(self.path, max_keys=2, max_targets=3)
+        for i in xrange(5):
+            history.record('a', float(i), 0.1 * i)
+        for key in ('b', 'c'):
+            history.record(key, 1.0, 0.5)
+        self.assertEqual(history.estimate('a', 0.0), None)
+        self.assertEqual(sorted(history._roots_for_key('b')), [(1.0, 0.5)])
+
+        history = SQLiteRootHistory(self.path, max_keys=5, max_targets=3)
+        for i in xrange(5):
+            history.record('a', float(i), 0.1 * i)
+        self.assertEqual(sorted(t for t, _ in history._roots_for_key('a')),
+                         [2.0, 3.0, 4.0])
+
+    def test_unavailable(self):
+        # Errors accessing the database only lose the history
+        history = SQLiteRootHistory(os.path.join(self.tmp_dir, 'missing',
+                                                 'history.db'))
+        history.record('a', 1.0, 0.2)
+        self.assertEqual(history.estimate('a', 1.0, 0.5), 0.5)
+
+
+class DampingSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_history = core.df_history
+        core.df_history = RootHistory()
+        self.iterations = []
+        set_progress_callback(lambda stage, **info: \
+                              self.iterations.append(info['df']))
+
+    def tearDown(self):
+        core.df_history = self.saved_history
+        set_progress_callback(None)
+
+    def test_rejected_root_not_recorded(self):
+        root_func = lambda x: (x - 0.9999, None)
+        self.assertRaises(RuntimeError, find_damping_factor, root_func,
+                          'net', 1, 5.0, x_max=0.999)
+        self.assertEqual(core.df_history.estimate(('net', ), 5.0), None)
+        x, _ = find_damping_factor(root_func, 'net', 1, 5.0)
+        self.assertAlmostEqual(x, 0.9999)
+        self.assertAlmostEqual(core.df_history.estimate(('net', ), 5.0),
+                               0.9999)
+
+    def test_key_depends_on_weights(self):
+        G = load_test_graph()
+        W = G.weighted_adjacency_matrix()
+        key = damping_search_key('emitting', W, {})
+        self.assertEqual(key, damping_search_key(
+            'emitting', G.weighted_adjacency_matrix(), {}))
+        W2 = W.copy()
+        W2.adjacency_matrix.data[0] += 1.0
+        self.assertNotEqual(key, damping_search_key('emitting', W2, {}))
+        self.assertNotEqual(key, damping_search_key('emitting', W, {0: 0.0}))
+
+    def test_emitting_search(self):
+        G = load_test_graph()
+        sources = ['CDC42']
+        model = EmittingAnalysis(G, sources, df=None, da=9.15,
+                                 antisink_map={'SLT2': 0.0, 'NUP53': 0.0})
+        num_iter = len(self.iterations)
+
+        # The average path length at the damping factor found
+        i = G.node2index['CDC42']
+        W = G.weighted_adjacency_matrix()
+        alpha_out_map = dict((G.node2index[p], 0.0) for p in ('SLT2', 'NUP53'))
+        df_mask = W.get_df_mask(model.df, alpha_out_map, 1.0, None)
+        SPL = BasicLaplacian(W, df_mask, boundary_rows=[i])
+        v = np.ones(len(G.nodes), 'd')
+        v[i] = 0.0
+        path_length = np.dot(SPL.boundary_row_data, SPL.solve(v, True))[0]
+        self.assertAlmostEqual(path_length, 9.15, 6)
+
+        # The same query is warm-started from the history
+        del self.iterations[:]
+        model2 = EmittingAnalysis(G, sources, df=None, da=9.15,
+                                  antisink_map={'SLT2': 0.0, 'NUP53': 0.0})
+        self.assertAlmostEqual(model.df, model2.df, 8)
+        self.assertTrue(len(self.iterations) < num_iter)
+
+
+if __name__ == '__main__':
+    unittest.main()
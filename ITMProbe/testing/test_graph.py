@@ -0,0 +1,122 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""Tests of the CSR graph and adjacency matrix classes."""
+
+import unittest
+import numpy as np
+from qmbpmn.ITMProbe.testing import load_test_graph
+
+
+class AdjacencyCopyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.G = load_test_graph()
+        self.original = self.G._adjacency_matrix.data.copy()
+
+    def tearDown(self):
+        self.assertTrue(np.all(self.G._adjacency_matrix.data == self.original))
+
+    def test_copies_share_structure(self):
+        W = self.G.weighted_adjacency_matrix()
+        W2 = W.copy()
+        A2 = W2.adjacency_matrix
+        A = W.adjacency_matrix
+        self.assertTrue(np.shares_memory(A.indices, A2.indices))
+        self.assertTrue(np.shares_memory(A.indptr, A2.indptr))
+        self.assertFalse(np.shares_memory(A.data, A2.data))
+
+    def test_write_after_copy(self):
+        W = self.G.weighted_adjacency_matrix()
+        W.adjacency_matrix.data *= 0.5
+        W2 = W.copy()
+        W2.adjacency_matrix.data *= 0.5
+        self.assertTrue(np.allclose(W.adjacency_matrix.data,
+                                    0.5 * self.original))
+        self.assertTrue(np.allclose(W2.adjacency_matrix.data,
+                                    0.25 * self.original))
+
+    def test_stale_reference_is_read_only(self):
+        W = self.G.weighted_adjacency_matrix()
+        A = W.adjacency_matrix
+        W2 = W.copy()
+        def _modify():
+            A.data[0] = 100.0
+        self.assertRaises(ValueError, _modify)
+        self.assertTrue(np.all(W2.adjacency_matrix.data == self.original))
+
+    def test_owner_reclaims_data(self):
+        W = self.G.weighted_adjacency_matrix()
+        A = W.adjacency_matrix
+        W2 = W.copy()
+        W2.adjacency_matrix
+        # W2 now has its own data, so W is the only owner of A.data
+        self.assertTrue(W.adjacency_matrix is A)
+        A.data[0] += 1.0
+        self.assertEqual(W2.adjacency_matrix.data[0], self.original[0])
+
+    def test_graph_data_is_read_only(self):
+        W = self.G.weighted_adjacency_matrix()
+        def _modify():
+            W._adjacency_matrix.data[0] = 100.0
+        self.assertRaises(ValueError, _modify)
+
+
+class SubgraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.G = load_test_graph()
+        rng = np.random.RandomState(3)
+        self.node_ixs = rng.choice(len(self.G.nodes), 300, replace=False)
+
+    def test_edges_match_dense_matrix(self):
+        rows, cols, weights, symmetric = self.G.subgraph(self.node_ixs)
+        A = self.G._adjacency_matrix
+        D = A[self.node_ixs][:, self.node_ixs].toarray()
+        self.assertEqual(len(rows), (D > 0).sum())
+        self.assertTrue(np.all(weights > 0))
+        for i, j, w, s in zip(rows, cols, weights, symmetric):
+            self.assertEqual(A[i, j], w)
+            self.assertEqual(s, A[j, i] > 0)
+
+    def test_self_loops_are_symmetric(self):
+        rows, cols, _, symmetric = self.G.subgraph(self.node_ixs)
+        loops = rows == cols
+        self.assertTrue(loops.any())
+        self.assertTrue(np.all(symmetric[loops]))
+
+    def test_node_order(self):
+        rows, _, _, _ = self.G.subgraph(self.node_ixs)
+        position = dict((k, i) for i, k in enumerate(self.node_ixs))
+        positions = [position[i] for i in rows]
+        self.assertEqual(positions, sorted(positions))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+
+"""Tests of the precomputed Green's functions."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from qmbpmn.ITMProbe import commands
+from qmbpmn.ITMProbe.core.greens import GreensFunctionLaplacian
+from qmbpmn.ITMProbe.core.greens import precompute_greens_function
+from qmbpmn.ITMProbe.core.emitting import EmittingAnalysis
+from qmbpmn.ITMProbe.core.absorbing import AbsorbingAnalysis
+from qmbpmn.ITMProbe.testing import load_test_graph
+from qmbpmn.ITMProbe.testing import load_test_input
+from qmbpmn.common.utils.dataobj import save_data_object
+
+
+class GreensFunctionTest(unittest.TestCase):
+
+    df = 0.85
+    antisink_map = {'SLT2': 0.0, 'NUP53': 0.0}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.G = load_test_graph()
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.greens_path = os.path.join(cls.tmp_dir, 'greens.npy')
+        precompute_greens_function(cls.G, cls.df, cls.antisink_map,
+                                   cls.greens_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def _kwargs(self, **kwargs):
+        kwargs.update(G=self.G, greens_path=self.greens_path)
+        commands.greens_from_kwargs(kwargs)
+        return kwargs
+
+    def assertClose(self, X, Y, tol=1e-5):
+        self.assertTrue(abs(X - Y).max() < tol * abs(Y).max(),
+                        abs(X - Y).max())
+
+    def test_emitting(self):
+        kwargs = self._kwargs(source_nodes=['CDC42', 'BEM1'])
+        self.assertTrue(isinstance(kwargs['context_laplacian'],
+                                   GreensFunctionLaplacian))
+        self.assertEqual(kwargs['df'], self.df)
+        self.assertEqual(kwargs['antisink_map'], self.antisink_map)
+        exact = EmittingAnalysis(self.G, ['CDC42', 'BEM1'], df=self.df,
+                                 antisink_map=self.antisink_map)
+        self.assertClose(EmittingAnalysis(**kwargs).H, exact.H)
+
+    def test_absorbing(self):
+        kwargs = self._kwargs(sink_nodes=['CDC42', 'ELP3', 'STE12'],
+                              df=self.df, antisink_map=self.antisink_map)
+        self.assertTrue('context_laplacian' in kwargs)
+        exact = AbsorbingAnalysis(self.G, ['CDC42', 'ELP3', 'STE12'],
+                                  df=self.df, antisink_map=self.antisink_map)
+        self.assertClose(AbsorbingAnalysis(**kwargs).F, exact.F)
+
+    def test_different_antisinks(self):
+        # The Green's function is not used for other antisinks
+        antisink_map = {'SLT2': 0.0}
+        kwargs = self._kwargs(sink_nodes=['CDC42'], df=self.df,
+                              antisink_map=antisink_map)
+        self.assertFalse('context_laplacian' in kwargs)
+        self.assertEqual(kwargs['antisink_map'], antisink_map)
+        exact = AbsorbingAnalysis(self.G, ['CDC42'], df=self.df,
+                                  antisink_map=antisink_map)
+        self.assertClose(AbsorbingAnalysis(**kwargs).F, exact.F, 1e-12)
+
+    def test_different_df(self):
+        kwargs = self._kwargs(sink_nodes=['CDC42'], df=0.7,
+                              antisink_map=self.antisink_map)
+        self.assertFalse('context_laplacian' in kwargs)
+        self.assertEqual(kwargs['df'], 0.7)
+
+    def test_dissipation_targets(self):
+        # The damping factor found from a dissipation target differs from
+        # that of the Green's function, which is therefore not used
+        kwargs = self._kwargs(source_nodes=['CDC42'], df=None, da=9.15,
+                              antisink_map=self.antisink_map)
+        self.assertFalse('context_laplacian' in kwargs)
+        self.assertEqual(kwargs['df'], None)
+        model = EmittingAnalysis(**kwargs)
+        exact = EmittingAnalysis(self.G, ['CDC42'], df=None, da=9.15,
+                                 antisink_map=self.antisink_map)
+        self.assertAlmostEqual(model.df, exact.df, 8)
+        self.assertTrue(abs(model.df - self.df) > 1e-3)
+
+        kwargs = self._kwargs(sink_nodes=['CDC42'], ap=0.5)
+        self.assertFalse('context_laplacian' in kwargs)
+        self.assertFalse('df' in kwargs)
+        kwargs = self._kwargs(source_nodes=['CDC42'], sink_nodes=['STE12'],
+                              df=None, dr=0.5)
+        self.assertFalse('context_laplacian' in kwargs)
+
+        # A matching damping factor takes precedence over the target
+        kwargs = self._kwargs(source_nodes=['CDC42'], df=self.df, da=9.15)
+        self.assertTrue('context_laplacian' in kwargs)
+
+    def test_batch_dissipation_targets(self):
+        input_file = os.path.join(self.tmp_dir, 'batch.json')
+        global_params = load_test_input('test_graph')
+        global_params['greens_path'] = self.greens_path
+        jobs = [{'output_file': os.path.join(self.tmp_dir, 'btch1.itm'),
+                 'model': 'emitting',
+                 'source_nodes': ['CDC42'],
+                 'da': 9.15,
+                 }]
+        save_data_object({'global_params': global_params, 'jobs': jobs},
+                         input_file)
+        self.assertRaises(RuntimeError, commands.batch_run, input_file)
+
+        del global_params['greens_path']
+        global_params['da'] = 9.15
+        del jobs[0]['da']
+        save_data_object({'global_params': global_params, 'jobs': jobs},
+                         input_file)
+        self.assertRaises(RuntimeError, commands.batch_run, input_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
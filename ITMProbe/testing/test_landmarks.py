@@ -0,0 +1,112 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+
+"""Tests of the landmark cache of Green's function rows and columns."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from qmbpmn.ITMProbe.core.landmarks import LandmarkCache
+from qmbpmn.ITMProbe.core.laplacian import FullGraphLaplacian
+from qmbpmn.ITMProbe.core.emitting import EmittingAnalysis
+from qmbpmn.ITMProbe.testing import load_test_graph
+
+
+class LandmarkCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_db = os.path.join(self.tmp_dir, 'landmarks.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_history_committed(self):
+        # The history of one connection is seen by the others
+        cache1 = LandmarkCache(self.cache_db, min_queries=2)
+        cache2 = LandmarkCache(self.cache_db, min_queries=2)
+        vector = np.arange(5.0)
+        self.assertTrue(cache1.get('key', 0, 3) is None)
+        self.assertFalse(cache2.put('key', 0, 3, vector))
+        self.assertTrue(cache2.get('key', 0, 3) is None)
+        self.assertTrue(cache1.put('key', 0, 3, vector))
+        self.assertTrue(np.all(cache2.get('key', 0, 3) == vector))
+        self.assertEqual(cache1.popular('key', 0, 10), [])
+        self.assertEqual(cache2.stats()['hits'], 1)
+        cache1.close()
+        cache2.close()
+
+        cache = LandmarkCache(self.cache_db)
+        stats = cache.stats()
+        self.assertEqual(stats['total_hits'], 1)
+        self.assertEqual(stats['total_misses'], 2)
+        self.assertEqual(stats['entries'], 1)
+        cache.close()
+
+    def test_eviction(self):
+        cache = LandmarkCache(self.cache_db, max_entries=2)
+        for k in range(3):
+            cache.put('key', 1, k, np.ones(3) * k, True)
+        cache.get('key', 1, 1)
+        cache.put('key', 1, 3, np.ones(3) * 3, True)
+        self.assertTrue(cache.get('key', 1, 0) is None)
+        self.assertTrue(cache.get('key', 1, 2) is None)
+        self.assertEqual(cache.get('key', 1, 1)[0], 1.0)
+        self.assertEqual(cache.get('key', 1, 3)[0], 3.0)
+        cache.close()
+
+    def test_exact_solutions(self):
+        G = load_test_graph()
+        df = 0.85
+        antisink_map = {'SLT2': 0.0}
+        W = G.weighted_adjacency_matrix()
+        alpha_out_map = {G.node2index['SLT2']: 0.0}
+        df_mask = W.get_df_mask(df, alpha_out_map, 1.0, None)
+        sources = ['CDC42', 'BEM1']
+        exact = EmittingAnalysis(G, sources, df=df, antisink_map=antisink_map)
+
+        # The first run fills the cache, the second one only reads it.
+        for run in range(2):
+            cache = LandmarkCache(self.cache_db, min_queries=1)
+            SPL = FullGraphLaplacian(W.copy(), df_mask, cache)
+            model = EmittingAnalysis(G, sources, df=df,
+                                     antisink_map=antisink_map,
+                                     context_laplacian=SPL)
+            self.assertTrue(abs(model.H - exact.H).max() < 1e-12)
+            self.assertEqual(cache.stats()['misses'], 0 if run else 4)
+            self.assertEqual(cache.stats()['entries'], 4)
+            cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+"""Tests of the Laplacian solvers against the residuals of exact solves."""
+
+import threading
+import unittest
+import numpy as np
+from qmbpmn.ITMProbe.core.emitting import EmittingAnalysis
+from qmbpmn.ITMProbe.core.laplacian import BasicLaplacian
+from qmbpmn.ITMProbe.core.laplacian import fill_reducing_ordering
+from qmbpmn.common.utils.parallel import get_num_threads
+from qmbpmn.common.utils.parallel import set_num_threads
+from qmbpmn.common.utils.parallel import solve_columns
+from qmbpmn.common.utils.parallel import solver_stats
+from qmbpmn.ITMProbe.testing import load_test_graph
+from qmbpmn.ITMProbe.testing import random_graph
+
+_ordering = None
+
+def _laplacian(ordered, df=0.85):
+
+    global _ordering
+    G = load_test_graph()
+    W = G.weighted_adjacency_matrix()
+    if ordered:
+        if _ordering is None:
+            _ordering = fill_reducing_ordering(W)
+        W.node_ordering = _ordering
+    else:
+        W.node_ordering = None
+    return BasicLaplacian(W, W.get_df_mask(df))
+
+
+class OrderedSolveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.SPL = _laplacian(True)
+        rng = np.random.RandomState(5)
+        self.rhs = rng.rand(self.SPL.L.shape[0], 4)
+
+    def assertSolves(self, x, rhs, autoTranspose):
+        L = self.SPL.L
+        A = L if autoTranspose else L.transpose()
+        self.assertTrue(np.allclose(A * x, rhs, rtol=0.0, atol=1e-10))
+
+    def test_vector_rhs(self):
+        for autoTranspose in (False, True):
+            x = self.SPL.solve(self.rhs[:, 0], autoTranspose)
+            self.assertEqual(x.shape, (self.SPL.L.shape[0],))
+            self.assertSolves(x, self.rhs[:, 0], autoTranspose)
+
+    def test_block_rhs(self):
+        for autoTranspose in (False, True):
+            X = self.SPL.solve(self.rhs, autoTranspose)
+            self.assertEqual(X.shape, self.rhs.shape)
+            self.assertSolves(X, self.rhs, autoTranspose)
+            for k in xrange(self.rhs.shape[1]):
+                x = self.SPL.solve(self.rhs[:, k], autoTranspose)
+                self.assertTrue(np.allclose(X[:, k], x, rtol=1e-12))
+
+    def test_solve_many(self):
+        for num_threads in (1, 3):
+            set_num_threads(num_threads)
+            try:
+                for autoTranspose in (False, True):
+                    X = self.SPL.solve_many(self.rhs, autoTranspose)
+                    for k in xrange(self.rhs.shape[1]):
+                        x = self.SPL.solve(self.rhs[:, k], autoTranspose)
+                        self.assertTrue(np.allclose(X[:, k], x, rtol=1e-12))
+            finally:
+                set_num_threads(1)
+
+    def test_same_as_unordered(self):
+        SPL = _laplacian(False)
+        for autoTranspose in (False, True):
+            x1 = self.SPL.solve(self.rhs, autoTranspose)
+            x2 = SPL.solve(self.rhs, autoTranspose)
+            self.assertTrue(np.allclose(x1, x2, rtol=1e-10, atol=1e-14))
+
+
+class SolverStatsTest(unittest.TestCase):
+
+    def test_concurrent_updates(self):
+        rhs = np.ones((10, 3), 'd')
+        start = solver_stats()
+        def _worker():
+            for k in xrange(200):
+                solve_columns(lambda b: b, rhs)
+        threads = [threading.Thread(target=_worker) for k in xrange(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = solver_stats(since=start)
+        self.assertEqual(stats['calls'], 8 * 200)
+        self.assertEqual(stats['columns'], 8 * 200 * 3)
+
+    def test_models_keep_threads(self):
+        # Models report the process-wide setting but do not change it
+        set_num_threads(2)
+        try:
+            model = EmittingAnalysis(load_test_graph(), ['CDC42'], df=0.85)
+            self.assertEqual(model.num_threads, 2)
+            self.assertEqual(get_num_threads(), 2)
+            self.assertTrue(model.concurrency > 0.0)
+        finally:
+            set_num_threads(1)
+
+
+class GeneralLaplacian(BasicLaplacian):
+    use_symmetric_solver = False
+
+
+class SymmetricSolveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.G = random_graph(2000, seed=2)
+        rng = np.random.RandomState(7)
+        self.rhs = rng.rand(2000, 3)
+        # Boundary rows and nodes with zero damping factor are decoupled;
+        # the latter keep their columns, which go to E
+        self.boundary_rows = [0, 17, 1999]
+        self.absorbing_nodes = [5, 33]
+
+    def _laplacians(self, ordered):
+
+        W = self.G.weighted_adjacency_matrix()
+        if ordered:
+            W.node_ordering = fill_reducing_ordering(W)
+        df_mask = W.get_df_mask(0.7)
+        indptr = W.adjacency_matrix.indptr
+        for i in self.absorbing_nodes:
+            df_mask[indptr[i]:indptr[i+1]] = 0.0
+        SPL1 = BasicLaplacian(W.copy(), df_mask, self.boundary_rows)
+        SPL2 = GeneralLaplacian(W.copy(), df_mask, self.boundary_rows)
+        return SPL1, SPL2
+
+    def test_symmetric_solver_used(self):
+        SPL1, SPL2 = self._laplacians(False)
+        self.assertTrue(SPL1.symmetric)
+        self.assertTrue(SPL1._sym_E is not None)
+        self.assertFalse(SPL2.symmetric)
+
+    def test_asymmetric_graph_not_symmetric(self):
+        self.assertFalse(_laplacian(False).symmetric)
+
+    def test_same_as_general_solver(self):
+        for ordered in (False, True):
+            SPL1, SPL2 = self._laplacians(ordered)
+            for autoTranspose in (False, True):
+                x1 = SPL1.solve(self.rhs, autoTranspose)
+                x2 = SPL2.solve(self.rhs, autoTranspose)
+                self.assertTrue(np.allclose(x1, x2, rtol=1e-10, atol=1e-14))
+                x1 = SPL1.solve(self.rhs[:, 1], autoTranspose)
+                self.assertTrue(np.allclose(x1, x2[:, 1], rtol=1e-10,
+                                            atol=1e-14))
+
+    def test_residuals(self):
+        SPL, _ = self._laplacians(True)
+        L = SPL.L
+        x = SPL.solve(self.rhs, True)
+        self.assertTrue(np.allclose(L * x, self.rhs, rtol=0.0, atol=1e-10))
+        x = SPL.solve(self.rhs, False)
+        self.assertTrue(np.allclose(L.transpose() * x, self.rhs, rtol=0.0,
+                                    atol=1e-10))
+
+
+if __name__ == '__main__':
+    unittest.main()
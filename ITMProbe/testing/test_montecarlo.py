@@ -0,0 +1,94 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+
+"""Tests of the Monte Carlo approximation against exact solutions."""
+
+import unittest
+import numpy as np
+from qmbpmn.ITMProbe.core import montecarlo
+from qmbpmn.ITMProbe.core.emitting import EmittingAnalysis
+from qmbpmn.ITMProbe.core.absorbing import AbsorbingAnalysis
+from qmbpmn.ITMProbe.testing import load_test_graph
+
+
+class MonteCarloTest(unittest.TestCase):
+
+    df = 0.85
+    antisink_map = {'SLT2': 0.0, 'NUP53': 0.0}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.G = load_test_graph()
+
+    def _models(self, model_class, num_walks, **kwargs):
+        exact = model_class(self.G, df=self.df,
+                            antisink_map=self.antisink_map, **kwargs)
+        approx = model_class(self.G, df=self.df,
+                             antisink_map=self.antisink_map,
+                             approximate='montecarlo', num_walks=num_walks,
+                             seed=3, **kwargs)
+        return exact, approx
+
+    def assertEstimates(self, model_class, attr, max_error, **kwargs):
+        exact, approx = self._models(model_class, 20000, **kwargs)
+        X = getattr(exact, attr)
+        Y = getattr(approx, attr)
+        err = abs(X - Y)
+        self.assertTrue(err.max() < max_error, err.max())
+        # Most of the confidence intervals (nominally 95%) should hold
+        covered = (err <= approx.ci + 1e-15)[X > 1e-3]
+        self.assertTrue(covered.mean() > 0.85, covered.mean())
+
+    def test_emitting(self):
+        self.assertEstimates(EmittingAnalysis, 'H', 0.01,
+                             source_nodes=['CDC42', 'BEM1'])
+
+    def test_absorbing(self):
+        self.assertEstimates(AbsorbingAnalysis, 'F', 0.02,
+                             sink_nodes=['CDC42', 'ELP3', 'STE12'])
+
+    def test_processes(self):
+        # The results do not depend on the number of processes and the
+        # process pool is shared between queries.
+        kwargs = dict(df=self.df, antisink_map=self.antisink_map,
+                      sink_nodes=['CDC42', 'ELP3'], approximate='montecarlo',
+                      num_walks=2000, seed=5)
+        F1 = AbsorbingAnalysis(self.G, num_processes=1, **kwargs).F
+        F2 = AbsorbingAnalysis(self.G, num_processes=2, **kwargs).F
+        pool = montecarlo.get_process_pool(2)
+        F3 = AbsorbingAnalysis(self.G, num_processes=2, **kwargs).F
+        self.assertTrue(np.all(F1 == F2))
+        self.assertTrue(np.all(F1 == F3))
+        self.assertTrue(montecarlo.get_process_pool(2) is pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
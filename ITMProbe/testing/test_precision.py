@@ -0,0 +1,86 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+
+"""Accuracy of the single precision mode on the test inputs."""
+
+import unittest
+import numpy as np
+from qmbpmn.ITMProbe.commands import model_classes
+from qmbpmn.ITMProbe.testing import load_test_graph
+from qmbpmn.ITMProbe.testing import load_test_input
+
+test_inputs = ['emitting_test', 'emitting_test2', 'absorbing_test1',
+               'absorbing_test2', 'channel_test', 'channel_test1',
+               'channel_test3']
+
+
+class SinglePrecisionTest(unittest.TestCase):
+
+    top_k = 100
+
+    @classmethod
+    def setUpClass(cls):
+        cls.G = load_test_graph()
+
+    def _model(self, name, precision):
+        kwargs = load_test_input(name)
+        for key in ('graph', 'graph_path', 'graph_bin_path'):
+            kwargs.pop(key, None)
+        model_class = model_classes[kwargs.pop('model')]
+        return model_class(self.G, precision=precision, **kwargs)
+
+    def test_inputs(self):
+        for name in test_inputs:
+            double = self._model(name, 'double')
+            single = self._model(name, 'single')
+            for attr in ('F', 'H'):
+                if not hasattr(double, attr):
+                    continue
+                X = getattr(double, attr)
+                Y = getattr(single, attr)
+                self.assertEqual(Y.dtype, np.float32)
+                err = abs(X - Y).max() / abs(X).max()
+                self.assertTrue(err < 1e-5, (name, attr, err))
+
+                # The top nodes by total may only differ by swapping nodes
+                # whose totals are within the single precision error.
+                total = X.sum(1)
+                top = np.argsort(-total, kind='mergesort')[:self.top_k]
+                top_single = np.argsort(-Y.sum(1),
+                                        kind='mergesort')[:self.top_k]
+                tol = 1e-5 * abs(total).max()
+                for i in set(top) ^ set(top_single):
+                    self.assertTrue(abs(total[i] - total[top[-1]]) < tol,
+                                    (name, attr, i))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+
+"""Tests of the residual push approximation against exact solutions."""
+
+import unittest
+import numpy as np
+from qmbpmn.ITMProbe.core.emitting import EmittingAnalysis
+from qmbpmn.ITMProbe.core.absorbing import AbsorbingAnalysis
+from qmbpmn.ITMProbe.testing import load_test_graph
+
+
+class ResidualPushTest(unittest.TestCase):
+
+    df = 0.85
+    antisink_map = {'SLT2': 0.0, 'NUP53': 0.0}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.G = load_test_graph()
+
+    def assertApproximates(self, model_class, attr, accuracy, top_k=None,
+                           **kwargs):
+        exact = model_class(self.G, df=self.df,
+                            antisink_map=self.antisink_map, **kwargs)
+        approx = model_class(self.G, df=self.df,
+                             antisink_map=self.antisink_map,
+                             approximate='push', accuracy=accuracy,
+                             top_k=top_k, **kwargs)
+        X = getattr(exact, attr)
+        Y = getattr(approx, attr)
+        # Push gives lower bounds within the reported errors
+        self.assertTrue((Y <= X + 1e-12).all())
+        self.assertTrue(approx.errors.max() <= accuracy)
+        self.assertTrue(((X - Y).max(0) <= approx.errors + 1e-12).all())
+
+        if top_k is not None:
+            total = X.sum(1)
+            top = [self.G.node2index[node] for node, _, _ in approx.top_nodes]
+            boundary = kwargs.get('source_nodes', kwargs.get('sink_nodes'))
+            boundary_ixs = [self.G.node2index[node] for node in boundary]
+            expected = exact._rank_nodes(total, boundary_ixs, top_k)
+            self.assertEqual(len(top), top_k)
+            self.assertEqual(set(top), set(expected))
+            for i, (node, lower, upper) in zip(top, approx.top_nodes):
+                self.assertTrue(lower - 1e-12 <= total[i] <= upper + 1e-12)
+
+    def test_emitting(self):
+        self.assertApproximates(EmittingAnalysis, 'H', 1e-6,
+                                source_nodes=['CDC42', 'BEM1'])
+
+    def test_absorbing(self):
+        self.assertApproximates(AbsorbingAnalysis, 'F', 1e-6,
+                                sink_nodes=['CDC42', 'ELP3', 'STE12'])
+
+    def test_top_k(self):
+        for top_k in (5, 200):
+            self.assertApproximates(EmittingAnalysis, 'H', 1e-6, top_k,
+                                    source_nodes=['CDC42'])
+            self.assertApproximates(AbsorbingAnalysis, 'F', 1e-4, top_k,
+                                    sink_nodes=['CDC42', 'ELP3', 'STE12'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+
+"""Tests of damping factor sweeps against models computed one at a time."""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import numpy as np
+from qmbpmn.ITMProbe.core.emitting import EmittingAnalysis
+from qmbpmn.ITMProbe.core.absorbing import AbsorbingAnalysis
+from qmbpmn.ITMProbe.core.sweep import DampingSweep
+from qmbpmn.ITMProbe.core.sweep import extract_sweep_slice
+from qmbpmn.ITMProbe.core.sweep import sweep_dfs
+from qmbpmn.ITMProbe.testing import load_test_graph
+
+
+class DampingSweepTest(unittest.TestCase):
+
+    dfs = [0.5, 0.7, 0.85, 0.95]
+
+    def setUp(self):
+        self.G = load_test_graph()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assertSweepMatches(self, model_class, attr, family=True, **kwargs):
+        sweep = DampingSweep(model_class, self.G, self.dfs, **kwargs)
+        self.assertEqual(sweep._family() is not None, family)
+        for df, model in sweep.iter_models():
+            direct = model_class(self.G, df=df, **kwargs)
+            X = getattr(direct, attr)
+            err = abs(getattr(model, attr) - X).max()
+            self.assertTrue(err < 1e-9 * abs(X).max(), (df, err))
+
+    def test_emitting(self):
+        self.assertSweepMatches(EmittingAnalysis, 'H',
+                                source_nodes=['CDC42', 'BEM1'],
+                                antisink_map={'SLT2': 0.0, 'NUP53': 0.0})
+
+    def test_absorbing(self):
+        self.assertSweepMatches(AbsorbingAnalysis, 'F',
+                                sink_nodes=['CDC42', 'ELP3', 'STE12'],
+                                antisink_map={'SLT2': 0.0, 'NUP53': 0.0})
+
+    def test_antisink_dissipation(self):
+        # Antisink damping factors do not scale with df, so each damping
+        # factor is solved separately.
+        self.assertSweepMatches(EmittingAnalysis, 'H', family=False,
+                                source_nodes=['CDC42'],
+                                antisink_map={'SLT2': 0.3})
+
+    def test_save(self):
+        kwargs = dict(source_nodes=['CDC42'], antisink_map={'SLT2': 0.0})
+        sweep_file = os.path.join(self.tmp_dir, 'sweep.sqlite')
+        DampingSweep(EmittingAnalysis, self.G, self.dfs, **kwargs).save(
+            sweep_file)
+        self.assertEqual(sweep_dfs(sweep_file), self.dfs)
+
+        sql = 'SELECT sourceid, nodeid, val FROM H ORDER BY sourceid, nodeid'
+        conn = extract_sweep_slice(sweep_file, 0.7)
+        rows = conn.execute(sql).fetchall()
+        conn.close()
+
+        direct_file = os.path.join(self.tmp_dir, 'direct.sqlite')
+        EmittingAnalysis(self.G, df=0.7, **kwargs).save(direct_file)
+        conn = sqlite3.connect(direct_file)
+        expected = conn.execute(sql).fetchall()
+        conn.close()
+
+        self.assertEqual([r[:2] for r in rows], [r[:2] for r in expected])
+        vals = np.array([r[2] for r in rows])
+        expected_vals = np.array([r[2] for r in expected])
+        self.assertTrue(abs(vals - expected_vals).max() < 1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,6 +34,7 @@ from .ncbi_gene import NCBIGenes_from_index
 from ..graph.csrgraph import CSRDirectedGraph
 from ..graph.digraph import DirectedGraph
 from ...web.ITMProbe.network import ITMProbeNetwork
+from ...ITMProbe.core.laplacian import fill_reducing_ordering
 from ..utils.dataobj import save_data_object
 
 NODE_URL_FMT = "http://www.ncbi.nlm.nih.gov/sites/entrez?db=gene" \
@@ -195,6 +196,7 @@ def create_network(dest_path, network_file, graph_file, biogrid_file,
                                       network_name_suffix)
 
     G2 = CSRDirectedGraph(G1._adjacency_matrix, G1.nodes)
+    G2.node_ordering = fill_reducing_ordering(G2.weighted_adjacency_matrix())
     graph_path = os.path.join(dest_path, graph_file)
     with open(graph_path, 'wb') as fp:
         G2.tofile(fp)
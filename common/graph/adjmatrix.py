@@ -27,6 +27,7 @@
 #
 
 import numpy as np
+from scipy.sparse import csr_matrix
 
 class CSRAdjacencyMatrix(object):
     """
@@ -37,26 +38,47 @@ class CSRAdjacencyMatrix(object):
 
     * adjacency_matrix - a matrix in CSR format, owned by
                          the object instance, hence can
-                         be overwritten.
+                         be overwritten. Only its data array
+                         may be modified in-place since the
+                         index arrays (indices and indptr) may
+                         be shared with other instances.
     * diagonal_ix - array of indices of diagonal elements.
     * nodes - list of node names.
     * node2index - mapping of node names to adjacency matrix indices.
     * row_weights - weights used to normalize rows to obtain the transition
                     matrix.
+    * node_ordering - optional fill-reducing ordering of nodes (array of node
+                      indices in elimination order) used when factorizing
+                      Laplacians derived from the matrix.
     All the above attributes except adjacency_matrix should not be modified
     in-place.
+
+    Copies share the structure of adjacency_matrix with the original. The
+    data array is shared as well until adjacency_matrix is first accessed,
+    when it is copied (copy-on-write). If shared is True, the data array of
+    the supplied adjacency_matrix is considered to belong to someone else
+    (for example, a read-only graph) and is also copied on first access.
+
+    While it is shared, the data array is marked read-only, so that a
+    matrix obtained from adjacency_matrix before copy() was called cannot
+    be used to modify the copies. Such references should not be kept: take
+    adjacency_matrix again after copying.
     """
 
     def __init__(self, adjacency_matrix, diagonal_ix, nodes, node2index,
-                 row_weights=None):
+                 row_weights=None, shared=False, node_ordering=None):
 
-        self.adjacency_matrix = adjacency_matrix
+        self._adjacency_matrix = adjacency_matrix
+        # Number of instances (or other owners) sharing the data array. This
+        # list is itself shared among all such instances.
+        self._data_refs = [2 if shared else 1]
         self.diagonal_ix = diagonal_ix
         self.nodes = nodes
         self.node2index = node2index
         self.row_weights = row_weights
+        self.node_ordering = node_ordering
         if row_weights is None:
-            A = self.adjacency_matrix
+            A = self._adjacency_matrix
             self.row_weights = np.empty(len(nodes), dtype=A.data.dtype)
             row_start = A.indptr[0]
             for i, row_end in enumerate(A.indptr[1:]):
@@ -64,13 +86,47 @@ class CSRAdjacencyMatrix(object):
                 self.row_weights[i] = row_data.sum()
                 row_start = row_end
 
+    @property
+    def adjacency_matrix(self):
+        """
+        The adjacency matrix owned by this instance. Accessing it makes a
+        private copy of the data array if that array is shared.
+        """
+        A = self._adjacency_matrix
+        if self._data_refs[0] == 1 and not A.data.flags.writeable:
+            # No longer shared - take the data array back if it is ours
+            try:
+                A.data.flags.writeable = True
+            except ValueError:
+                pass
+        if self._data_refs[0] > 1 or not A.data.flags.writeable:
+            self._data_refs[0] -= 1
+            self._data_refs = [1]
+            self._adjacency_matrix = csr_matrix((A.data.copy(), A.indices,
+                                                 A.indptr), shape=A.shape)
+            self._adjacency_matrix.has_sorted_indices = A.has_sorted_indices
+        return self._adjacency_matrix
+
+    @property
+    def nnz(self):
+        """
+        Number of stored entries of the adjacency matrix (does not copy).
+        """
+        return self._adjacency_matrix.nnz
+
     def copy(self):
         """
-        Create a new instance with a copy of adjacency_matrix.
+        Create a new instance sharing adjacency_matrix with the original. The
+        data array is copied only when adjacency_matrix is accessed on either
+        instance.
         """
-        A = self.adjacency_matrix.copy()
-        return self.__class__(A, self.diagonal_ix, self.nodes, self.node2index,
-                              self.row_weights)
+        W = self.__class__(self._adjacency_matrix, self.diagonal_ix,
+                           self.nodes, self.node2index, self.row_weights,
+                           node_ordering=self.node_ordering)
+        self._adjacency_matrix.data.flags.writeable = False
+        self._data_refs[0] += 1
+        W._data_refs = self._data_refs
+        return W
 
     def get_df_mask(self, alpha_out=1.0, alpha_out_map=None, alpha_in=1.0,
                     alpha_in_map=None):
@@ -79,8 +135,9 @@ class CSRAdjacencyMatrix(object):
         adjacency_matrix.
         """
 
-        # Construct edge modification factors
-        A = self.adjacency_matrix
+        # Construct edge modification factors. Only the structure of the
+        # adjacency matrix is needed here so we do not trigger a copy.
+        A = self._adjacency_matrix
 
         df_mask = np.zeros_like(A.data)
 
@@ -94,10 +151,8 @@ class CSRAdjacencyMatrix(object):
         for i, alpha in alpha_out_map.iteritems():
             tmp[i] = alpha
 
-        row_start = A.indptr[0]
-        for i, row_end in enumerate(A.indptr[1:]):
-            df_mask[row_start:row_end] = tmp[i]
-            row_start = row_end
+        df_mask[A.indptr[0]:A.indptr[-1]] = \
+            np.repeat(tmp, np.diff(A.indptr))
 
         # ... and columns with df_in
         tmp = alpha_in * np.ones(A.shape[0], 'd')
@@ -116,13 +171,10 @@ class CSRAdjacencyMatrix(object):
         than unity.
         """
         A = self.adjacency_matrix
-        row_start = A.indptr[0]
-        for i, row_end in enumerate(A.indptr[1:]):
-            row_data = A.data[row_start:row_end]
-            row_sum = self.row_weights[i]
-            if row_sum > 0.0:
-                # Here the implicit assumption is that self.row_weights[i] is
-                # zero iff the sum of entries in row i is zero.
-                np.divide(row_data, row_sum, row_data)
-            row_start = row_end
+        # Here the implicit assumption is that self.row_weights[i] is zero iff
+        # the sum of entries in row i is zero, so such rows are left as they
+        # are.
+        row_sums = np.where(self.row_weights > 0.0, self.row_weights, 1.0)
+        data = A.data[A.indptr[0]:A.indptr[-1]]
+        np.divide(data, np.repeat(row_sums, np.diff(A.indptr)), data)
 
@@ -26,7 +26,10 @@
 # Code author:  Aleksandar Stojmirovic
 #
 
+import numpy as np
+from scipy.sparse import csr_matrix
 from .digraph import DirectedGraph
+from .digraph import GRAPHBIN_MAGIC
 from .adjmatrix import CSRAdjacencyMatrix
 from ..utils.filesys import write_string_list
 from ..utils.filesys import read_string_list
@@ -48,7 +51,8 @@ class CSRDirectedGraph(DirectedGraph):
             with an open file containing all data
     """
 
-    _attrs = ['nodes', '_adjacency_matrix', '_diagonal_ix', 'node_weights']
+    _attrs = ['nodes', '_adjacency_matrix', '_diagonal_ix', 'node_weights',
+              'node_ordering']
 
     def __init__(self, *args):
 
@@ -58,6 +62,9 @@ class CSRDirectedGraph(DirectedGraph):
         self._num_edges = 0
         self._num_nodes = 0
         self.node_weights = None
+        # Fill-reducing node ordering for sparse factorization. It is
+        # computed once, when the graph is created, and stored with it.
+        self.node_ordering = None
         self._adjacency_matrix = None
         self._diagonal_ix = None
 
@@ -90,11 +97,17 @@ class CSRDirectedGraph(DirectedGraph):
             A = self._adjacency_matrix.T.tocsr()
             A.sort_indices()
             diagonal_ix = self.get_diagonal_ix(A)
+            shared = False
         else:
-            A = self._adjacency_matrix.copy()
+            # The graph is read-only so the matrix can be shared as long as
+            # its data array is copied before being modified.
+            A = self._adjacency_matrix
+            A.data.flags.writeable = False
             diagonal_ix = self._diagonal_ix
+            shared = True
         return CSRAdjacencyMatrix(A, diagonal_ix, self.nodes, self.node2index,
-                                  self.node_weights)
+                                  self.node_weights, shared,
+                                  self.node_ordering)
 
     def outgoing_edges(self, node):
 
@@ -105,6 +118,99 @@ class CSRDirectedGraph(DirectedGraph):
                  for j, x in zip(A.indices[rng], A.data[rng]) \
                  if x > 0]
 
+    def _row_entries(self, row_ixs):
+        """
+        Return the positions (in data and indices arrays of the adjacency
+        matrix) of all stored entries in the given rows, together with the
+        row index of each entry.
+        """
+        A = self._adjacency_matrix
+        starts = A.indptr[row_ixs]
+        counts = A.indptr[row_ixs + 1] - starts
+        rows = np.repeat(row_ixs, counts)
+        offsets = np.arange(counts.sum()) - \
+                  np.repeat(np.cumsum(counts) - counts, counts)
+        return rows, np.repeat(starts, counts) + offsets
+
+    def subgraph(self, node_ixs):
+        """
+        Extract all edges of the subgraph induced by the nodes with given
+        indices.
+
+        Returns a tuple (rows, cols, weights, symmetric) of arrays of the same
+        length, one entry for each edge (rows[k], cols[k]) with positive
+        weight. The boolean array symmetric is True for the edges whose
+        reverse edge is also present (including self-loops). Node indices
+        refer to the full graph. Edges are ordered by the position of their
+        starting node in node_ixs (duplicates removed) and then by their
+        ending node.
+        """
+        A = self._adjacency_matrix
+        node_ixs = np.asarray(node_ixs, dtype=A.indptr.dtype)
+        _, first_ixs = np.unique(node_ixs, return_index=True)
+        node_ixs = node_ixs[np.sort(first_ixs)]
+
+        rows, pos = self._row_entries(node_ixs)
+        cols = A.indices[pos]
+        weights = A.data[pos]
+
+        shown = np.zeros(A.shape[0], dtype=bool)
+        shown[node_ixs] = True
+        keep = shown[cols] & (weights > 0)
+        rows = rows[keep]
+        cols = cols[keep]
+        weights = weights[keep]
+
+        # Edges are encoded as single integers in order to find the reverse
+        # edges in one pass.
+        n = np.int64(A.shape[0])
+        edge_keys = rows.astype(np.int64) * n + cols
+        reverse_keys = cols.astype(np.int64) * n + rows
+        symmetric = np.in1d(reverse_keys, edge_keys)
+
+        return rows, cols, weights, symmetric
+
+    def extract_nodes(self, nodes):
+        """
+        Construct the subgraph generated by nodes as a new DirectedGraph
+        instance.
+        """
+        rows, cols, weights, _ = \
+              self.subgraph([self.node2index[p] for p in nodes])
+        G_new = DirectedGraph()
+        for i, j, weight in zip(rows, cols, weights):
+            G_new.insert_edge(self.nodes[i], self.nodes[j], weight)
+        return G_new
+
+    def transitive_closure(self, nodes):
+        """
+        Return a set of all nodes accessible from given nodes (by following
+        outgoing edges).
+        """
+        A = self._adjacency_matrix
+        visited = np.zeros(A.shape[0], dtype=bool)
+        frontier = np.unique(np.array([self.node2index[p] for p in nodes],
+                                      dtype=A.indptr.dtype))
+        visited[frontier] = True
+
+        # Breadth-first search, one level at a time
+        while len(frontier):
+            _, pos = self._row_entries(frontier)
+            cols = A.indices[pos[A.data[pos] > 0]]
+            frontier = np.unique(cols[~visited[cols]])
+            visited[frontier] = True
+
+        return set(self.nodes[i] for i in np.flatnonzero(visited))
+
+    def copy(self):
+        """
+        Produce a copy of the graph. Since the graph is read-only, the copy
+        shares all node and adjacency data with the original.
+        """
+        G = self.__class__.__new__(self.__class__)
+        G.__dict__.update(self.__dict__)
+        return G
+
     def insert_node(self, p):
         raise NotImplementedError('May not add nodes or edges to CSRDirectedGraph instance.')
 
@@ -114,3 +220,44 @@ class CSRDirectedGraph(DirectedGraph):
     def extend(self, G):
         raise NotImplementedError('May not add nodes or edges to CSRDirectedGraph instance.')
 
+
+def _read_array(fp, dtype, count):
+    dtype = np.dtype(dtype)
+    buf = fp.read(dtype.itemsize * count)
+    if len(buf) != dtype.itemsize * count:
+        raise IOError("Unexpected end of binary graph file")
+    return np.frombuffer(buf, dtype)
+
+
+def read_binary_graph(in_file):
+    """
+    Read a graph written by the tobinary() method of a directed graph and
+    return it as a CSRDirectedGraph instance. The in_file argument can be a
+    file name or an open (binary) file object; it is read sequentially so
+    pipes and sockets work as well.
+    """
+
+    if not hasattr(in_file, 'read'):
+        with open(in_file, 'rb') as fp:
+            return read_binary_graph(fp)
+
+    fp = in_file
+    if fp.read(8) != 'CSRGRAPH':
+        raise IOError("Not a binary graph file")
+    magic = int(_read_array(fp, '<u4', 1)[0])
+    if magic != GRAPHBIN_MAGIC:
+        raise IOError("Unsupported binary graph file version")
+    nodes = read_string_list(fp, True)
+    num_nodes = len(nodes)
+    nnz = int(_read_array(fp, '<u4', 1)[0])
+    data = _read_array(fp, '<f8', nnz).astype('d')
+    indices = _read_array(fp, '<u4', nnz).astype(np.int32)
+    indptr = _read_array(fp, '<u4', num_nodes + 1).astype(np.int32)
+    A = csr_matrix((data, indices, indptr), shape=(num_nodes, num_nodes))
+
+    G = CSRDirectedGraph(A, nodes)
+    if _read_array(fp, '<u4', 1)[0]:
+        G.node_weights = _read_array(fp, '<f8', num_nodes).astype('d')
+    if _read_array(fp, '<u4', 1)[0]:
+        G.node_ordering = _read_array(fp, '<u4', num_nodes).astype(np.intp)
+    return G
@@ -30,8 +30,11 @@ import cPickle as pickle
 import numpy as np
 from scipy.sparse import lil_matrix
 from ..utils.dataobj import save_data_object
+from ..utils.filesys import write_string_list
 from .adjmatrix import CSRAdjacencyMatrix
 
+GRAPHBIN_MAGIC = 0x0C5A0001
+
 class DirectedGraph(object):
     """
     Directed graph. Based on coo formatted sparse matrix.
@@ -234,14 +237,63 @@ class DirectedGraph(object):
         A = self.weighted_adjacency_matrix().adjacency_matrix
         nw = list(self.node_weights) if self.node_weights is not None else None
         obj = {'graph': {'nodes': self.nodes,
-                         'data': list(A.data),
-                         'indices': list(A.indices),
-                         'indptr': list(A.indptr),
+                         'data': A.data.tolist(),
+                         'indices': A.indices.tolist(),
+                         'indptr': A.indptr.tolist(),
                          'node_weights': nw,
                          },
                }
         save_data_object(obj, out_file)
 
+    def tobinary(self, out_file):
+        """
+        Write a representation of this graph as CSR adjacency matrix to a
+        binary file. This is much more compact and faster to read back than
+        the JSON representation - the arrays are written directly, without
+        conversion to Python lists. The file can be read with
+        csrgraph.read_binary_graph().
+        """
+
+        # *** Binary graph structure ***
+        # char start_separator           - 'CSRGRAPH'
+        # uint32 version_magic           - changes for each different version
+        # uint32 num_nodes
+        # uint32 nodes_buflen
+        # char nodes_buf[]               - node names
+        # uint32 nnz                     - number of stored entries
+        # float64 data[nnz]              - CSR adjacency matrix
+        # uint32 indices[nnz]
+        # uint32 indptr[num_nodes+1]
+        # uint32 has_node_weights
+        # float64 node_weights[num_nodes] - only if has_node_weights
+        # uint32 has_node_ordering
+        # uint32 node_ordering[num_nodes] - only if has_node_ordering
+
+        if not hasattr(out_file, 'write'):
+            with open(out_file, 'wb') as fp:
+                self.tobinary(fp)
+            return
+
+        A = self._adjacency_matrix.tocsr()
+        A.sort_indices()
+        fp = out_file
+        fp.write('CSRGRAPH')
+        fp.write(np.array([GRAPHBIN_MAGIC], dtype='<u4').tostring())
+        write_string_list(fp, self.nodes, True)
+        fp.write(np.array([A.nnz], dtype='<u4').tostring())
+        # Arrays are converted to strings (rather than written through the
+        # buffer interface) so that any file-like object can be used.
+        fp.write(np.asarray(A.data, dtype='<f8').tostring())
+        fp.write(np.asarray(A.indices, dtype='<u4').tostring())
+        fp.write(np.asarray(A.indptr, dtype='<u4').tostring())
+        for attr, dtype in [('node_weights', '<f8'), ('node_ordering', '<u4')]:
+            x = getattr(self, attr, None)
+            if x is None:
+                fp.write(np.array([0], dtype='<u4').tostring())
+            else:
+                fp.write(np.array([1], dtype='<u4').tostring())
+                fp.write(np.asarray(x, dtype=dtype).tostring())
+
     def _reduce(self):
         # Pickle a dictionary of values to make it easier to move or change
         # classes later
@@ -29,8 +29,165 @@
 """Processors of images output by Graphviz programs."""
 
 from subprocess import Popen, PIPE
-from xml.dom import minidom
+from cStringIO import StringIO
+import xml.sax
+from xml.sax.handler import ContentHandler
+from xml.sax.handler import feature_namespaces
+from xml.sax.handler import feature_external_ges
+from xml.sax.saxutils import XMLGenerator
 from ...common.utils.jinjaenv import get_jinja_env
+from . import svg
+
+class SVGStreamFilter(XMLGenerator):
+    """
+    SAX handler that copies a Graphviz SVG image to an output stream,
+    fixing it on the way:
+
+    * sets the stroke width on the top graph group;
+    * adds the missing 'px' units to the font-size styles of the labels
+      (either Graphviz or Firefox bug, depending on the point of view);
+    * optionally scales the image to fit into map_view (width, height),
+      replacing its viewBox by the scaled width and height;
+    * optionally drops the labels (text elements).
+    """
+
+    def __init__(self, out, stroke_width=0.3, map_view=None, with_text=True,
+                 xml_header=True):
+
+        XMLGenerator.__init__(self, out, 'utf-8')
+        self.stroke_width = stroke_width
+        self.map_view = map_view
+        self.with_text = with_text
+        self.xml_header = xml_header
+        self.scale = None
+        self._seen_svg = False
+        self._seen_g = False
+        self._skip_depth = 0
+
+    def startDocument(self):
+        if self.xml_header:
+            XMLGenerator.startDocument(self)
+
+    def _fix_root(self, attrs):
+
+        if self.map_view is None or 'viewBox' not in attrs:
+            return
+        x, y, w, h = map(float, attrs.pop('viewBox').split())
+        w = w - x
+        h = h - y
+        self.scale = min(self.map_view[0] / w, self.map_view[1] / h)
+        attrs['width'] = '%.5f' % (self.scale * w)
+        attrs['height'] = '%.5f' % (self.scale * h)
+
+    def _fix_graph(self, attrs):
+
+        if self.stroke_width is not None:
+            attrs['style'] = 'stroke-width:%.3fpx;' % self.stroke_width
+        if self.scale is not None:
+            attrs['transform'] = 'scale(%.5f %.5f) %s' % \
+                (self.scale, self.scale, attrs.get('transform', ''))
+
+    @staticmethod
+    def _fix_text(attrs):
+
+        styles = attrs.get('style', '').split(';')
+        for i, stl in enumerate(styles):
+            stl_props = stl.split(':')
+            if stl_props[0] == 'font-size':
+                try:
+                    font_size = float(stl_props[1])
+                    if font_size > 0.0:
+                        styles[i] = 'font-size:%.2fpx' % font_size
+                        attrs['style'] = ';'.join(styles)
+                except ValueError:
+                    pass
+                break
+
+    def startElement(self, name, attrs):
+
+        if self._skip_depth or (name == 'text' and not self.with_text):
+            self._skip_depth += 1
+            return
+
+        attrs = dict(attrs.items())
+        if name == 'svg' and not self._seen_svg:
+            self._seen_svg = True
+            self._fix_root(attrs)
+        elif name == 'g' and not self._seen_g:
+            self._seen_g = True
+            self._fix_graph(attrs)
+        elif name == 'text':
+            self._fix_text(attrs)
+        XMLGenerator.startElement(self, name, attrs)
+
+    def endElement(self, name):
+
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        XMLGenerator.endElement(self, name)
+
+    def characters(self, content):
+        if not self._skip_depth:
+            XMLGenerator.characters(self, content)
+
+    def ignorableWhitespace(self, content):
+        if not self._skip_depth:
+            XMLGenerator.ignorableWhitespace(self, content)
+
+
+class _TeeHandler(ContentHandler):
+    """ Forwards SAX events to several handlers """
+
+    def __init__(self, handlers):
+        ContentHandler.__init__(self)
+        self.handlers = handlers
+
+    def startDocument(self):
+        for handler in self.handlers:
+            handler.startDocument()
+
+    def endDocument(self):
+        for handler in self.handlers:
+            handler.endDocument()
+
+    def startElement(self, name, attrs):
+        for handler in self.handlers:
+            handler.startElement(name, attrs)
+
+    def endElement(self, name):
+        for handler in self.handlers:
+            handler.endElement(name)
+
+    def characters(self, content):
+        for handler in self.handlers:
+            handler.characters(content)
+
+    def ignorableWhitespace(self, content):
+        for handler in self.handlers:
+            handler.ignorableWhitespace(content)
+
+    def processingInstruction(self, target, data):
+        for handler in self.handlers:
+            handler.processingInstruction(target, data)
+
+
+def filter_svg_stream(fp_in, *handlers):
+    """
+    Parse the SVG from fp_in incrementally, passing the events to the
+    handlers (typically instances of SVGStreamFilter). The DTD referenced
+    by Graphviz output is not fetched.
+    """
+
+    parser = xml.sax.make_parser()
+    parser.setFeature(feature_namespaces, False)
+    parser.setFeature(feature_external_ges, False)
+    if len(handlers) == 1:
+        parser.setContentHandler(handlers[0])
+    else:
+        parser.setContentHandler(_TeeHandler(handlers))
+    parser.parse(fp_in)
+
 
 def optional_http_header(meth):
     """ Decorator to optionally write http header before anything else."""
@@ -43,6 +200,12 @@ def optional_http_header(meth):
 class BasicOutputImage(object):
     """Basic image processor that does not do any processing."""
 
+    # True if the processor writes images directly from layouts (through
+    # write_layout) rather than processing Graphviz output
+    direct_svg = False
+    # True if the image is worth compressing for HTTP transfer
+    compressible = False
+
     def __init__(self, name, text, mime_type, write_http_header=True):
 
         self.name = name
@@ -50,7 +213,12 @@ class BasicOutputImage(object):
         self.mime_type = mime_type
         self.neato_option = '-T%s' % name
         self.write_http_header = write_http_header
-        self.http_header = "Content-Type: %s\n\n" % self.mime_type
+        self.http_headers = [('Content-Type', self.mime_type)]
+
+    @property
+    def http_header(self):
+        """HTTP headers (http_headers) in CGI output form."""
+        return ''.join('%s: %s\n' % item for item in self.http_headers) + '\n'
 
     @optional_http_header
     def process_stream(self, fp_in, fp_out, legend_items=None):
@@ -75,46 +243,25 @@ class BasicOutputImage(object):
 class SVGOutputImage(BasicOutputImage):
     """Processor for image in SVG format."""
 
-    @staticmethod
-    def _get_image_DOM(fp_in, stroke_width=0.3):
-        image_DOM = minidom.parse(fp_in)
-        image_DOM.normalize()
-        img_doc = image_DOM.documentElement
-        G = img_doc.getElementsByTagName('g')[0]
-
-        # Set stroke-width for the graph (edges + node frames)
-        if stroke_width != None:
-            G.setAttribute('style', 'stroke-width:%.3fpx;' % stroke_width)
-
-        # Fix a bug (either by graphviz or firefox, depending on the point
-        # of view) that makes the node labels too large. The problem is that
-        # SVG text font-size style attribute does not have units attached.
-
-        # We fix it by getting the font-size from each of the labels, checking
-        # if it has units and, if not, inserting 'px' next to it.
-        for txt_node in G.getElementsByTagName("text"):
-            font_size = 0.0
-            styles = txt_node.getAttribute('style').split(';')
-
-            for i, stl in enumerate(styles):
-                stl_props = stl.split(':')
-                if stl_props[0] == 'font-size':
-                    try:
-                        font_size = float(stl_props[1])
-                        if font_size > 0.0:
-                            styles[i] = 'font-size:%.2fpx' % font_size
-                            txt_node.setAttribute('style', ';'.join(styles))
-                    except ValueError:
-                        pass
-                    break
-
-        return image_DOM
+    direct_svg = True
+    compressible = True
+    stroke_width = 0.3
 
     @optional_http_header
     def process_stream(self, fp_in, fp_out, legend_items=None):
-        image_DOM = self._get_image_DOM(fp_in)
-        fp_out.write(image_DOM.toxml("utf-8"))
-        image_DOM.unlink()
+        filter_svg_stream(fp_in, SVGStreamFilter(fp_out, self.stroke_width))
+
+    def write_layout(self, layout, nodes_attr, default_attr, fp_out,
+                     legend_items=None):
+        """Write the image of a layout colored by nodes_attr and
+        default_attr (see NeatoLayout.render_colored) directly, without
+        running Graphviz."""
+
+        if self.write_http_header:
+            fp_out.write(self.http_header)
+        geometry = svg.layout_geometry(layout.dot_layout)
+        svg.write_svg(fp_out, geometry, nodes_attr, default_attr,
+                      layout.graph_type == 'digraph', self.stroke_width)
 
     def html(self, url):
         return '<embed class="solid-bg" src="%s" type="%s"' \
@@ -122,12 +269,14 @@ class SVGOutputImage(BasicOutputImage):
 
 class EPSOutputImage(BasicOutputImage):
     """Processor for image in postscript format."""
+
+    compressible = True
+
     def __init__(self, name, text):
         BasicOutputImage.__init__(self, name, text, 'application/postscript')
         self.neato_option = '-T%s' % 'ps2'
-        self.http_header = "Content-Type: %s\n" % self.mime_type
-        self.http_header += "Content-Disposition: attachment;" \
-                            " filename=itm_probe_results.eps\n\n"
+        self.http_headers.append(('Content-Disposition',
+                                  'attachment; filename=itm_probe_results.eps'))
 
     def html(self, url):
         msg = 'Click here to download the EPS image.'
@@ -143,9 +292,8 @@ class PDFOutputImage(BasicOutputImage):
     def __init__(self, name, text):
         BasicOutputImage.__init__(self, name, text, 'application/pdf')
         self.neato_option = '-T%s' % 'ps2'
-        self.http_header = "Content-Type: %s\n" % self.mime_type
-        self.http_header += "Content-Disposition: attachment;" \
-                            " filename=itm_probe_results.pdf\n\n"
+        self.http_headers.append(('Content-Disposition',
+                                  'attachment; filename=itm_probe_results.pdf'))
 
     @optional_http_header
     def process_stream(self, fp_in, fp_out, legend_items=None) :
@@ -198,37 +346,12 @@ class SVGNavigatorOutputImage(SVGOutputImage):
         self.navigator_options = nav_opts
 
 
-    @optional_http_header
-    def process_stream(self, fp_in, fp_out, legend_items=None):
-
-        image_DOM = self._get_image_DOM(fp_in)
-        img_doc = image_DOM.documentElement
-
-        # process image_DOM: get bounding box and scale appropriately
-        pts = image_DOM.documentElement.getAttribute('viewBox').split(' ')
-        x, y, w, h = map(float, pts)
-        w = w - x
-        h = h - y
-        scale = min(self.navigator_options['mainMap_view'][0]/w,
-                    self.navigator_options['mainMap_view'][1]/h)
-
-        G = img_doc.getElementsByTagName('g')[0]
-        transform = G.getAttribute('transform')
-        G.setAttribute('transform', "scale(%.5f %.5f) %s" % \
-                       (scale, scale, transform))
-        img_doc.setAttribute('height', '%.5f' % (scale*h))
-        img_doc.setAttribute('width', '%.5f' % (scale*w))
-
-        image_DOM.documentElement.removeAttribute('viewBox')
-
-        # Main Map
-        mainMap_content = image_DOM.documentElement.toxml("utf-8")
+    def _map_scale(self, width, height):
+        return min(self.navigator_options['mainMap_view'][0] / width,
+                   self.navigator_options['mainMap_view'][1] / height)
 
-        # Reference Map - text nodes are removed
-        for node in image_DOM.getElementsByTagName("text"):
-            node.parentNode.removeChild(node)
-        refMap_content = image_DOM.documentElement.toxml("utf-8")
-        image_DOM.unlink()
+    def _write_navigator(self, fp_out, mainMap_content, refMap_content,
+                         legend_items):
 
         # Format legend boundary strings
         if legend_items is not None:
@@ -238,13 +361,50 @@ class SVGNavigatorOutputImage(SVGOutputImage):
             boundaries = []
             color_list = []
 
-        # Write template
+        # Write template - map contents are UTF-8 encoded
         tmpl = self.jinja_env.get_template(self.template)
-        fp_out.write(tmpl.render(mainMap_content=mainMap_content,
-                                 refMap_content=refMap_content,
-                                 color_list=color_list,
-                                 boundaries=boundaries,
-                                 **self.navigator_options))
+        res = tmpl.render(mainMap_content=mainMap_content.decode('utf-8'),
+                          refMap_content=refMap_content.decode('utf-8'),
+                          color_list=color_list,
+                          boundaries=boundaries,
+                          **self.navigator_options)
+        fp_out.write(res.encode('utf-8'))
+
+    def write_layout(self, layout, nodes_attr, default_attr, fp_out,
+                     legend_items=None):
+
+        if self.write_http_header:
+            fp_out.write(self.http_header)
+        geometry = svg.layout_geometry(layout.dot_layout)
+        scale = self._map_scale(*svg.image_size(geometry))
+        directed = layout.graph_type == 'digraph'
+
+        # Main map is scaled to fit; the reference map has no labels
+        maps = []
+        for with_text in (True, False):
+            map_out = StringIO()
+            svg.write_svg(map_out, geometry, nodes_attr, default_attr,
+                          directed, self.stroke_width, scale, view_box=False,
+                          with_text=with_text, xml_header=False)
+            maps.append(map_out.getvalue())
+        self._write_navigator(fp_out, maps[0], maps[1], legend_items)
+
+    @optional_http_header
+    def process_stream(self, fp_in, fp_out, legend_items=None):
+
+        # Main map is scaled to fit; the reference map has no labels. Both
+        # are produced in a single pass over the Graphviz output.
+        mainMap_out = StringIO()
+        refMap_out = StringIO()
+        map_view = self.navigator_options['mainMap_view']
+        filter_svg_stream(fp_in,
+                          SVGStreamFilter(mainMap_out, self.stroke_width,
+                                          map_view, xml_header=False),
+                          SVGStreamFilter(refMap_out, self.stroke_width,
+                                          map_view, with_text=False,
+                                          xml_header=False))
+        self._write_navigator(fp_out, mainMap_out.getvalue(),
+                              refMap_out.getvalue(), legend_items)
 
     def html(self, url):
         return '<embed src="%s" type="%s" width="%d" height="%d"/>' % \
@@ -30,9 +30,16 @@ import numpy as np
 from collections import defaultdict
 from .colormaps import BrewerColors
 from .render import NeatoLayout
+from .stress import StressLayout
 
 MIN_BRIGHTNESS = 0.3
 
+# Layout backends: in-process stress majorization or external neato
+LAYOUT_ENGINES = {'stress': StressLayout,
+                  'neato': NeatoLayout,
+                  }
+DEFAULT_LAYOUT_ENGINE = 'stress'
+
 # Discretization function factories for color imaging
 def discretize_log_upper(num_bins, b=0.0, step=0.8, base=2.0):
     """Logarithmic discretization"""
@@ -52,34 +59,33 @@ def discretize_sqrt(num_bins, a=0.0, b=1.0):
     return lambda k: pow(a + step * k, 2.0)
 
 
-def make_layout(G, shown_nodes, sources, sinks, neato_executable='neato',
-                neato_seed=None):
+def layout_spec(G, shown_nodes, sources, sinks, neato_seed=None):
     """
-    Produce a layout of a subgraph using Graphviz.
+    Collect the nodes, edges and attributes of the subgraph to be laid out
+    by neato. Returns a dictionary of keyword arguments for NeatoLayout.
     """
 
     nodes_attr = defaultdict(dict)
     edges_map = {}
 
     # Extract edges: need to check if directed.
-    for v1 in shown_nodes:
-        if G.has_node(v1):
-            for v2, wght in G.outgoing_edges(v1):
-                if v2 not in shown_nodes:
-                    continue
-                # Vertices with self-pointing edges have a different shape
-                if v1 == v2:
-                    if wght > 0.0:
-                        nodes_attr[v1] = {'shape': 'ellipse',
-                                          'height': 0.20,
-                                          'width': 0.04 + 0.08 * len(v1.__str__()),
-                                          }
-                elif (v2, v1) in edges_map:
-                    # undirected edge
-                    edges_map[(v2, v1)] = False
-                else:
-                    # directed edge
-                    edges_map[(v1, v2)] = True
+    node_ixs = [G.node2index[v] for v in shown_nodes if G.has_node(v)]
+    rows, cols, _, symmetric = G.subgraph(node_ixs)
+    for i, j, is_symmetric in zip(rows, cols, symmetric):
+        v1 = G.nodes[i]
+        v2 = G.nodes[j]
+        # Vertices with self-pointing edges have a different shape
+        if i == j:
+            nodes_attr[v1] = {'shape': 'ellipse',
+                              'height': 0.20,
+                              'width': 0.04 + 0.08 * len(v1.__str__()),
+                              }
+        elif not is_symmetric:
+            # directed edge
+            edges_map[(v1, v2)] = True
+        elif i < j:
+            # undirected edge - listed only once
+            edges_map[(v1, v2)] = False
 
     shown_edges = sorted(edges_map.keys())
     edges_attr = {}.fromkeys((e for e in edges_map if edges_map[e]),
@@ -127,15 +133,37 @@ def make_layout(G, shown_nodes, sources, sinks, neato_executable='neato',
     else:
         neato_options = '-Gstart=%d' % neato_seed
 
-    return NeatoLayout(shown_nodes, shown_edges,
-                       nodes_attr, default_attr,
-                       edges_attr, neato_executable,
-                       neato_options)
+    return {'shown_nodes': shown_nodes,
+            'shown_edges': shown_edges,
+            'nodes_attr': dict(nodes_attr),
+            'default_attr': default_attr,
+            'edges_attr': edges_attr,
+            'program_options': neato_options,
+            }
 
 
-def render_one_color(ITM_layout, neato_options, node_values, bins, colormap):
+def make_layout(G, shown_nodes, sources, sinks, neato_executable='neato',
+                neato_seed=None, layout_store=None,
+                layout_engine=DEFAULT_LAYOUT_ENGINE):
+    """
+    Produce a layout of a subgraph using the given engine (a key of
+    LAYOUT_ENGINES). If layout_store is given, the layout is looked up in
+    (or added to) the store and a pair (layout_id, layout) is returned.
+    """
+
+    spec = layout_spec(G, shown_nodes, sources, sinks, neato_seed)
+    if layout_store is not None:
+        return layout_store.get_layout(spec, neato_executable, layout_engine)
+    layout_class = LAYOUT_ENGINES[layout_engine]
+    return layout_class(program=neato_executable, **spec)
 
 
+def one_color_attrs(ITM_layout, node_values, bins, colormap):
+    """
+    Rendering attributes coloring the nodes of ITM_layout by node_values
+    discretized into bins. Returns (nodes_attr, default_attr, legend_items).
+    """
+
     nodes_attr = defaultdict(dict)
     default_attr = {'graph': {'bgcolor': 'transparent',
                               },
@@ -162,12 +190,15 @@ def render_one_color(ITM_layout, neato_options, node_values, bins, colormap):
 
     # Prepare legend
     legend_items = (color_list, bins)
-
-    fp_out = ITM_layout.render_colored(neato_options, nodes_attr, default_attr)
-    return fp_out, legend_items
+    return nodes_attr, default_attr, legend_items
 
 
-def render_mixed_color(ITM_layout, neato_options, node_values, bins):
+def mixed_color_attrs(ITM_layout, node_values, bins):
+    """
+    Rendering attributes mixing up to three colors for the nodes of
+    ITM_layout according to the columns of node_values. Returns
+    (nodes_attr, default_attr, None).
+    """
 
     nodes_attr = defaultdict(dict)
     default_attr = {'graph': {'bgcolor': 'transparent',
@@ -202,6 +233,21 @@ def render_mixed_color(ITM_layout, neato_options, node_values, bins):
         if brightness < MIN_BRIGHTNESS:
             nodes_attr[node]['fontcolor'] = '"#ffffff"'
 
+    return nodes_attr, default_attr, None
+
+
+def render_one_color(ITM_layout, neato_options, node_values, bins, colormap):
+
+    nodes_attr, default_attr, legend_items = \
+        one_color_attrs(ITM_layout, node_values, bins, colormap)
+    fp_out = ITM_layout.render_colored(neato_options, nodes_attr, default_attr)
+    return fp_out, legend_items
+
+
+def render_mixed_color(ITM_layout, neato_options, node_values, bins):
+
+    nodes_attr, default_attr, _ = mixed_color_attrs(ITM_layout, node_values,
+                                                    bins)
     fp_out = ITM_layout.render_colored(neato_options, nodes_attr,
                                        default_attr)
     return fp_out, None
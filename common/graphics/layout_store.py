@@ -0,0 +1,273 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+Store of neato layouts shared between queries.
+
+Layouts are keyed by a digest of the displayed subgraph (nodes, edges,
+their attributes, layout engine and neato options), so that any query displaying the same
+subgraph reuses the same layout. When no exact match exists, a stored
+layout of a slightly different node set is extended: its node positions are
+pinned and only the new nodes are placed. The store keeps at most a given
+number of layouts, evicting the least recently used ones, and layouts not
+used for a given time can be removed by expire().
+"""
+
+import os
+import os.path
+import time
+import hashlib
+from ..utils.filesys import makedirs2
+from ..utils.filesys import file_lock
+from ..utils.pickling import save_object
+from ..utils.pickling import restore_object
+from ..utils.pickling import check_object
+from .render import parse_dot_body
+from .itm_graphics import LAYOUT_ENGINES
+from .itm_graphics import DEFAULT_LAYOUT_ENGINE
+
+_INDEX_NAME = 'index'
+
+
+def layout_digest(spec, layout_engine):
+    """
+    Stable digest of a layout specification (as returned by layout_spec)
+    laid out by layout_engine. Does not depend on the order of nodes or
+    edges.
+    """
+
+    def _attrs(attr_map):
+        return sorted((str(k), str(v)) for k, v in attr_map.iteritems())
+
+    nodes_attr = spec['nodes_attr']
+    edges_attr = spec['edges_attr']
+    default_attr = spec['default_attr']
+
+    sha1 = hashlib.sha1()
+    sha1.update(repr(layout_engine))
+    sha1.update(repr(spec['program_options']))
+    sha1.update(repr(sorted((k, _attrs(v))
+                            for k, v in default_attr.iteritems())))
+    sha1.update(repr(sorted((v, _attrs(nodes_attr.get(v, {})))
+                            for v in spec['shown_nodes'])))
+    sha1.update(repr(sorted((e, _attrs(edges_attr.get(e, {})))
+                            for e in spec['shown_edges'])))
+    return sha1.hexdigest()[:20].upper()
+
+
+def node_positions(dot_layout):
+    """
+    Extract node positions (in points) from the body of a dot file
+    produced by neato.
+    """
+
+    positions = {}
+    for kind, names, attrs in parse_dot_body(dot_layout):
+        if kind == 'N' and 'pos' in attrs:
+            x, y = attrs['pos'].rstrip('!').split(',')[:2]
+            positions[names[0]] = (float(x), float(y))
+    return positions
+
+
+class LayoutStore(object):
+    """
+    Directory of pickled NeatoLayout objects with an index of their node
+    sets, sizes and last use times.
+    """
+
+    def __init__(self, store_path, max_entries=1000, max_delta=5):
+        """
+        :param `store_path`: directory holding the layouts;
+        :param `max_entries`: maximum number of stored layouts;
+        :param `max_delta`: maximum number of nodes by which a stored
+                            layout may differ from a requested one to be
+                            extended rather than computed from scratch.
+        """
+
+        self.store_path = store_path
+        self.max_entries = max_entries
+        self.max_delta = max_delta
+        makedirs2(store_path)
+
+    def layout_path(self, layout_id):
+        return os.path.join(self.store_path, '%s.pkl' % layout_id)
+
+    def has_layout(self, layout_id):
+        return check_object(self.store_path, layout_id)
+
+    def _lock_path(self, name):
+        return os.path.join(self.store_path, '%s.lock' % name)
+
+    def _read_index(self):
+        if check_object(self.store_path, _INDEX_NAME, '.idx'):
+            return restore_object(self.store_path, _INDEX_NAME, '.idx')
+        return {}
+
+    def _write_index(self, index):
+        save_object(index, self.store_path, _INDEX_NAME, '.idx')
+
+    def _find_base(self, spec, options):
+        """
+        Find the stored layout with the same options whose node set is
+        closest to the requested one, within max_delta nodes.
+        """
+
+        nodes = frozenset(spec['shown_nodes'])
+        best_id = None
+        best_delta = self.max_delta + 1
+        with file_lock(self._lock_path(_INDEX_NAME)):
+            index = self._read_index()
+        for layout_id, entry in index.iteritems():
+            if entry['options'] != options:
+                continue
+            if len(nodes.intersection(entry['nodes'])) == 0:
+                continue
+            delta = len(nodes.symmetric_difference(entry['nodes']))
+            if delta < best_delta:
+                best_id = layout_id
+                best_delta = delta
+        return best_id
+
+    def _compute_layout(self, spec, neato_executable, layout_engine):
+
+        layout_class = LAYOUT_ENGINES[layout_engine]
+        options = (layout_engine, spec['program_options'])
+        base_id = self._find_base(spec, options) if self.max_delta > 0 \
+                  else None
+        base_layout = None
+        if base_id is not None and self.has_layout(base_id):
+            try:
+                base_layout = restore_object(self.store_path, base_id)
+            except (IOError, EOFError):
+                base_layout = None
+
+        if base_layout is None:
+            return layout_class(program=neato_executable, **spec)
+
+        # Pin the nodes already placed in the base layout. The -s flag makes
+        # the layout engine read the input positions in points, as they are
+        # written.
+        positions = node_positions(base_layout.dot_layout)
+        nodes_attr = dict((v, dict(attrs))
+                          for v, attrs in spec['nodes_attr'].iteritems())
+        for v in spec['shown_nodes']:
+            if v in positions:
+                nodes_attr.setdefault(v, {})['pos'] = '"%g,%g!"' % positions[v]
+        kwargs = dict(spec)
+        kwargs['nodes_attr'] = nodes_attr
+        kwargs['program_options'] = '-s %s' % spec['program_options']
+        return layout_class(program=neato_executable, **kwargs)
+
+    def get_layout(self, spec, neato_executable='neato',
+                   layout_engine=DEFAULT_LAYOUT_ENGINE):
+        """
+        Return (layout_id, layout) for a layout specification, computing and
+        storing the layout if it is not already present.
+        """
+
+        layout_id = layout_digest(spec, layout_engine)
+        with file_lock(self._lock_path(layout_id)):
+            if self.has_layout(layout_id):
+                layout = restore_object(self.store_path, layout_id)
+            else:
+                layout = self._compute_layout(spec, neato_executable,
+                                              layout_engine)
+                save_object(layout, self.store_path, layout_id)
+
+        size = os.path.getsize(self.layout_path(layout_id))
+        with file_lock(self._lock_path(_INDEX_NAME)):
+            index = self._read_index()
+            index[layout_id] = {'nodes': frozenset(layout.shown_nodes),
+                                'options': (layout_engine,
+                                            spec['program_options']),
+                                'size': size,
+                                'used': time.time(),
+                                }
+            self._evict(index)
+            self._write_index(index)
+        return layout_id, layout
+
+    def _remove_layout(self, layout_id):
+        """ Remove the files of a layout; returns their total size. """
+
+        size = 0
+        for path in (self.layout_path(layout_id),
+                     self._lock_path(layout_id)):
+            try:
+                file_size = os.path.getsize(path)
+                os.remove(path)
+                size += file_size
+            except OSError:
+                pass
+        return size
+
+    def _evict(self, index):
+        """ Remove least recently used layouts beyond max_entries """
+
+        excess = len(index) - self.max_entries
+        if excess <= 0:
+            return
+        by_use = sorted(index, key=lambda layout_id: index[layout_id]['used'])
+        for layout_id in by_use[:excess]:
+            del index[layout_id]
+            self._remove_layout(layout_id)
+
+    def expire(self, max_age):
+        """
+        Remove the layouts not used in the last max_age seconds, together
+        with those missing from the index (e.g. after a crash) that are
+        older than that. Returns the number of layouts removed and the size
+        of their files.
+        """
+
+        cutoff_time = time.time() - max_age
+        removed_count = removed_size = 0
+        with file_lock(self._lock_path(_INDEX_NAME)):
+            index = self._read_index()
+            expired = [layout_id for layout_id, entry in index.iteritems()
+                       if entry['used'] < cutoff_time]
+            for filename in os.listdir(self.store_path):
+                layout_id, ext = os.path.splitext(filename)
+                path = os.path.join(self.store_path, filename)
+                if ext == '.pkl' and layout_id not in index and \
+                   os.path.getmtime(path) < cutoff_time:
+                    expired.append(layout_id)
+            for layout_id in expired:
+                index.pop(layout_id, None)
+                removed_count += 1
+                removed_size += self._remove_layout(layout_id)
+            if removed_count:
+                self._write_index(index)
+        return removed_count, removed_size
+
+    def total_size(self):
+        """ Total size of the files in the store. """
+
+        return sum(os.path.getsize(os.path.join(self.store_path, filename))
+                   for filename in os.listdir(self.store_path))
@@ -29,9 +29,45 @@
 """Rendering of graphs using Graphviz."""
 
 
+import re
 from subprocess import Popen, PIPE
 from cStringIO import StringIO
 
+_DOT_ID = r'"(?:[^"\\]|\\.)*"|[^\s\[\]";=]+'
+_DOT_STATEMENT = re.compile(r'(%s)\s*(?:(--|->)\s*(%s)\s*)?'
+                            r'\[((?:[^\]"]|"(?:[^"\\]|\\.)*")*)\]\s*;?'
+                            % (_DOT_ID, _DOT_ID))
+_DOT_ATTR = re.compile(r'(\w+)\s*=\s*("(?:[^"\\]|\\.)*"|[^,\s\]]+)')
+
+
+def _dot_unquote(token):
+    if token.startswith('"'):
+        return token[1:-1].replace('\\"', '"')
+    return token
+
+
+def parse_dot_body(dot_text):
+    """
+    Parse the statements with attribute lists in the body of a dot file
+    (such as the output of neato -Tdot). Yields triples (kind, names,
+    attrs), where kind is 'graph', 'node', 'edge' (defaults), 'N' (a node)
+    or 'E' (an edge), names is a tuple of node names and attrs a dictionary
+    of unquoted attribute values.
+    """
+
+    # Graphviz breaks long lines with a backslash-newline
+    dot_text = dot_text.replace('\\\n', '')
+    for match in _DOT_STATEMENT.finditer(dot_text):
+        first, edge_op, second, attr_text = match.groups()
+        attrs = dict((key, _dot_unquote(val))
+                     for key, val in _DOT_ATTR.findall(attr_text))
+        if edge_op is not None:
+            yield 'E', (_dot_unquote(first), _dot_unquote(second)), attrs
+        elif first in ('graph', 'node', 'edge'):
+            yield first, (), attrs
+        else:
+            yield 'N', (_dot_unquote(first),), attrs
+
 
 class GraphvizLayout(object):
     """Routines for producing and rendering Graphviz layouts."""
@@ -159,6 +195,13 @@ class NeatoLayout(GraphvizLayout):
         super(NeatoLayout, self).__init__(shown_nodes, shown_edges,
                                           nodes_attr, default_attr, edges_attr,
                                           program, program_options, directed)
+        self.dot_layout = self.make_dot_layout(program_options)
+
+    def make_dot_layout(self, program_options):
+        """
+        Run neato on the graph and return the body of its dot output
+        (without the enclosing graph statement).
+        """
 
         layout_out = StringIO()
         full_options = '-Tdot %s' % program_options
@@ -172,7 +215,7 @@ class NeatoLayout(GraphvizLayout):
             if line.strip() != '}':
                 layout_out.write(line)
         neato_out.close()
-        self.dot_layout = layout_out.getvalue()
+        return layout_out.getvalue()
 
 
     def write_colored_dot(self, fp, nodes_attr=None, default_attr=None):
@@ -0,0 +1,411 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+In-process graph layout by stress majorization.
+
+StressLayout is a drop-in replacement for NeatoLayout that computes node
+positions and straight edge routes with numpy instead of running neato.
+The result is stored as dot text in the same form as neato -Tdot output, so
+that colored rendering and saving work unchanged.
+"""
+
+import re
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import shortest_path
+from scipy.sparse.csgraph import connected_components
+from .render import NeatoLayout
+
+POINTS_PER_INCH = 72.0
+DEFAULT_EDGE_LEN = 1.0        # inches, as in neato
+ARROW_LENGTH = 10.0           # points, arrowsize=1
+NODE_GAP = 6.0                # points between node boundaries
+COMPONENT_GAP = 16.0          # points between packed components
+MARGIN = 4.0                  # points around the drawing
+
+_START_SEED = re.compile(r'-Gstart=(\d+)')
+_SCALE_FLAG = re.compile(r'(^|\s)-s(\s|$)')
+
+
+def _attr_float(attr_map, key, default):
+    val = attr_map.get(key, default)
+    return float(str(val).strip('"'))
+
+
+def stress_majorization(dist, X0, pinned=None, max_iter=300, tol=1e-4):
+    """
+    Minimize the weighted stress sum_{i<j} d_ij^-2 (|x_i - x_j| - d_ij)^2
+    over the positions of a connected set of nodes, starting from X0.
+
+    :param `dist`: n x n array of target distances (all finite);
+    :param `X0`: n x 2 array of initial positions;
+    :param `pinned`: boolean array of length n marking nodes whose
+                     positions in X0 must not change.
+    """
+
+    n = dist.shape[0]
+    X = np.array(X0, dtype='d')
+    if n == 1:
+        return X
+
+    D = dist + np.eye(n)
+    W = 1.0 / (D * D)
+    np.fill_diagonal(W, 0.0)
+    Lw = -W
+    np.fill_diagonal(Lw, W.sum(1))
+    WD = W * dist
+
+    if pinned is None or not pinned.any():
+        free = np.arange(n)
+        fixed = np.zeros(0, dtype='int')
+        # Lw is singular (translations). Since the columns of Lz X sum to
+        # zero, adding 1/n to every entry gives an invertible matrix that
+        # acts as the pseudoinverse of Lw on them.
+        Lw_inv = np.linalg.inv(Lw + 1.0 / n)
+    else:
+        free = np.flatnonzero(~pinned)
+        fixed = np.flatnonzero(pinned)
+        if len(free) == 0:
+            return X
+        Lw_inv = np.linalg.inv(Lw[np.ix_(free, free)])
+        Lw_fixed = np.dot(Lw[np.ix_(free, fixed)], X[fixed])
+
+    def _distances(Y):
+        sq = (Y * Y).sum(1)
+        R2 = sq[:, None] + sq[None, :] - 2 * np.dot(Y, Y.T)
+        return np.sqrt(np.maximum(R2, 1e-18))
+
+    old_stress = None
+    for _ in xrange(max_iter):
+        R = _distances(X)
+        stress = (W * (R - dist) ** 2).sum()
+        if old_stress is not None and old_stress - stress < tol * old_stress:
+            break
+        old_stress = stress
+        Lz = -WD / R
+        np.fill_diagonal(Lz, 0.0)
+        np.fill_diagonal(Lz, -Lz.sum(1))
+        B = np.dot(Lz, X)
+        if len(fixed):
+            X[free] = np.dot(Lw_inv, B[free] - Lw_fixed)
+        else:
+            X = np.dot(Lw_inv, B)
+    return X
+
+
+def classical_mds(dist, rng):
+    """
+    Initial positions from classical multidimensional scaling, randomly
+    rotated and reflected (using rng) so that different seeds give
+    different layouts.
+    """
+
+    n = dist.shape[0]
+    if n < 3:
+        return rng.uniform(-1.0, 1.0, (n, 2)) * dist.max()
+    D2 = dist * dist
+    J = np.eye(n) - 1.0 / n
+    B = -0.5 * np.dot(np.dot(J, D2), J)
+    vals, vecs = np.linalg.eigh(B)
+    vals = np.maximum(vals[-2:], 1e-9)
+    X = vecs[:, -2:] * np.sqrt(vals)
+    angle = rng.uniform(0, 2 * np.pi)
+    rot = np.array([[np.cos(angle), -np.sin(angle)],
+                    [np.sin(angle), np.cos(angle)]])
+    if rng.randint(2):
+        rot[:, 0] *= -1
+    # Small jitter breaks exact symmetries of the embedding
+    return np.dot(X, rot) + rng.normal(0, 1e-3 * dist.max(), X.shape)
+
+
+def remove_overlaps(X, half_sizes, movable, max_iter=50):
+    """
+    Push apart nodes whose bounding boxes (plus NODE_GAP) overlap, moving
+    only the nodes marked movable.
+    """
+
+    n = X.shape[0]
+    if n < 2 or not movable.any():
+        return X
+    X = X.copy()
+    ex = half_sizes[:, 0] + NODE_GAP / 2
+    ey = half_sizes[:, 1] + NODE_GAP / 2
+    need_x = ex[:, None] + ex[None, :]
+    need_y = ey[:, None] + ey[None, :]
+    upper = np.triu(np.ones((n, n), dtype=bool), 1)
+    weight = movable.astype('d')
+    for _ in xrange(max_iter):
+        dx = X[:, 0, None] - X[None, :, 0]
+        dy = X[:, 1, None] - X[None, :, 1]
+        ovl_x = need_x - np.abs(dx)
+        ovl_y = need_y - np.abs(dy)
+        I, J = np.nonzero((ovl_x > 0) & (ovl_y > 0) & upper)
+        if len(I) == 0:
+            break
+        # Separate each clashing pair along the axis of smaller overlap,
+        # the whole distance going to the movable node if only one is.
+        ox = ovl_x[I, J]
+        oy = ovl_y[I, J]
+        along_x = ox <= oy
+        amount = np.where(along_x, ox, oy) / 2 + 0.01
+        sign = np.sign(np.where(along_x, dx[I, J], dy[I, J]))
+        sign[sign == 0] = 1.0
+        push = sign * amount * np.where(weight[I] * weight[J] > 0, 1.0, 2.0)
+        axis = np.where(along_x, 0, 1)
+        shift = np.zeros((n, 2), dtype='d')
+        np.add.at(shift, (I, axis), push * weight[I])
+        np.add.at(shift, (J, axis), -push * weight[J])
+        X += shift
+    return X
+
+
+def _pack_components(boxes, max_width):
+    """
+    Shelf-pack rectangles given as (width, height) pairs into rows at most
+    max_width wide. Returns a list of lower-left corner offsets.
+    """
+
+    order = sorted(xrange(len(boxes)), key=lambda k: -boxes[k][1])
+    offsets = [None] * len(boxes)
+    x = y = row_height = 0.0
+    for k in order:
+        w, h = boxes[k]
+        if x > 0 and x + w > max_width:
+            y -= row_height + COMPONENT_GAP
+            x = row_height = 0.0
+        # Rows grow downwards; the row top is at y
+        offsets[k] = (x, y - h)
+        x += w + COMPONENT_GAP
+        row_height = max(row_height, h)
+    return offsets
+
+
+def _boundary_offset(u, half_w, half_h, shape):
+    """
+    Distance from the node center to its boundary in the unit direction u.
+    """
+
+    ux, uy = abs(u[0]), abs(u[1])
+    if shape == 'box':
+        tx = half_w / ux if ux > 1e-9 else np.inf
+        ty = half_h / uy if uy > 1e-9 else np.inf
+        return min(tx, ty)
+    return 1.0 / np.sqrt((ux / half_w) ** 2 + (uy / half_h) ** 2)
+
+
+class StressLayout(NeatoLayout):
+    """
+    Layout with the same interface as NeatoLayout, computed in process by
+    stress majorization. Node sizes from the width and height attributes
+    enter the target edge lengths; nodes with a pos attribute ending in '!'
+    are kept fixed. Neato is still used for colored rendering.
+    """
+
+    def make_dot_layout(self, program_options):
+
+        X, sizes, shapes = self.compute_positions(program_options)
+        return self._dot_body(X, sizes, shapes)
+
+    def _node_geometry(self):
+        """ Node sizes (in points) and shapes """
+
+        node_default = self.default_attr.get('node', {})
+        default_w = _attr_float(node_default, 'width', 0.75)
+        default_h = _attr_float(node_default, 'height', 0.5)
+        default_shape = str(node_default.get('shape', 'ellipse')).strip('"')
+
+        n = len(self.shown_nodes)
+        sizes = np.zeros((n, 2), dtype='d')
+        shapes = []
+        for i, v in enumerate(self.shown_nodes):
+            attrs = self.nodes_attr.get(v, {})
+            sizes[i, 0] = _attr_float(attrs, 'width', default_w)
+            sizes[i, 1] = _attr_float(attrs, 'height', default_h)
+            shapes.append(str(attrs.get('shape', default_shape)).strip('"'))
+        return sizes * POINTS_PER_INCH, shapes
+
+    def _pinned_positions(self, program_options):
+
+        scale = 1.0 if _SCALE_FLAG.search(program_options) \
+                else POINTS_PER_INCH
+        n = len(self.shown_nodes)
+        pinned = np.zeros(n, dtype=bool)
+        pos = np.zeros((n, 2), dtype='d')
+        for i, v in enumerate(self.shown_nodes):
+            val = str(self.nodes_attr.get(v, {}).get('pos', '')).strip('"')
+            if val.endswith('!'):
+                x, y = val.rstrip('!').split(',')[:2]
+                pos[i] = float(x) * scale, float(y) * scale
+                pinned[i] = True
+        return pinned, pos
+
+    def compute_positions(self, program_options):
+        """
+        Returns node positions, sizes (both in points) and shapes.
+        """
+
+        seed_match = _START_SEED.search(program_options)
+        seed = int(seed_match.group(1)) if seed_match else None
+        rng = np.random.RandomState(seed)
+
+        n = len(self.shown_nodes)
+        sizes, shapes = self._node_geometry()
+        half_sizes = sizes / 2
+        radii = np.sqrt((half_sizes ** 2).sum(1))
+        pinned, pin_pos = self._pinned_positions(program_options)
+
+        edge_default = self.default_attr.get('edge', {})
+        edge_len = _attr_float(edge_default, 'len', DEFAULT_EDGE_LEN) * \
+                   POINTS_PER_INCH
+
+        # Target edge lengths allow for the sizes of both end nodes
+        node2index = dict((v, i) for i, v in enumerate(self.shown_nodes))
+        rows = []
+        cols = []
+        for v1, v2 in self.shown_edges:
+            if v1 in node2index and v2 in node2index and v1 != v2:
+                rows.append(node2index[v1])
+                cols.append(node2index[v2])
+        rows = np.array(rows, dtype='int')
+        cols = np.array(cols, dtype='int')
+        lengths = np.maximum(edge_len, radii[rows] + radii[cols] + NODE_GAP)
+        A = coo_matrix((lengths, (rows, cols)), shape=(n, n)).tocsr()
+        dist = shortest_path(A, directed=False)
+        num_comps, labels = connected_components(A, directed=False)
+
+        X = np.zeros((n, 2), dtype='d')
+        free_comps = []
+        for c in xrange(num_comps):
+            ixs = np.flatnonzero(labels == c)
+            comp_pinned = pinned[ixs]
+            comp_dist = dist[np.ix_(ixs, ixs)]
+            if comp_pinned.any():
+                # Start new nodes next to the nearest pinned node
+                fixed = ixs[comp_pinned]
+                X0 = rng.uniform(-1.0, 1.0, (len(ixs), 2)) * edge_len
+                X0[comp_pinned] = pin_pos[fixed]
+                for k in np.flatnonzero(~comp_pinned):
+                    nearest = fixed[np.argmin(dist[ixs[k], fixed])]
+                    X0[k] += pin_pos[nearest]
+            else:
+                X0 = classical_mds(comp_dist, rng)
+            Xc = stress_majorization(comp_dist, X0, comp_pinned)
+            Xc = remove_overlaps(Xc, half_sizes[ixs], ~comp_pinned)
+            X[ixs] = Xc
+            if not comp_pinned.any():
+                free_comps.append(ixs)
+
+        # Pack the components without pinned nodes, to the right of those
+        # that have them
+        if free_comps:
+            boxes = []
+            for ixs in free_comps:
+                lo = (X[ixs] - half_sizes[ixs]).min(0)
+                hi = (X[ixs] + half_sizes[ixs]).max(0)
+                X[ixs] -= lo
+                boxes.append(tuple(hi - lo))
+            total_area = sum(w * h for w, h in boxes)
+            max_width = max(max(w for w, h in boxes),
+                            1.5 * np.sqrt(total_area))
+            offsets = _pack_components(boxes, max_width)
+            x0 = y0 = 0.0
+            if pinned.any():
+                has_pins = np.zeros(n, dtype=bool)
+                for c in np.unique(labels[pinned]):
+                    has_pins |= labels == c
+                x0 = (X[has_pins] + half_sizes[has_pins]).max(0)[0] + \
+                     COMPONENT_GAP
+                y0 = (X[has_pins] + half_sizes[has_pins]).max(0)[1]
+            for ixs, (dx, dy) in zip(free_comps, offsets):
+                X[ixs] += (x0 + dx, y0 + dy)
+
+        if n:
+            X -= (X - half_sizes).min(0) - MARGIN
+        return X, sizes, shapes
+
+    def _edge_route(self, p, q, size_p, size_q, shape_p, shape_q, directed):
+
+        d = q - p
+        length = np.sqrt((d * d).sum())
+        if length < 1e-9:
+            return None
+        u = d / length
+        start = p + u * _boundary_offset(u, size_p[0] / 2, size_p[1] / 2,
+                                         shape_p)
+        tip = q - u * _boundary_offset(u, size_q[0] / 2, size_q[1] / 2,
+                                       shape_q)
+        end = tip - u * ARROW_LENGTH if directed else tip
+        points = [start, start + (end - start) / 3,
+                  start + 2 * (end - start) / 3, end]
+        route = ' '.join('%.2f,%.2f' % tuple(pt) for pt in points)
+        if directed:
+            route = 'e,%.2f,%.2f %s' % (tip[0], tip[1], route)
+        return route
+
+    def _dot_body(self, X, sizes, shapes):
+        """ Dot text in the form of the body of neato -Tdot output """
+
+        lines = []
+        bb = (X + sizes / 2).max(0) + MARGIN if len(X) else (0.0, 0.0)
+        graph_attr = dict(self.default_attr.get('graph', {}))
+        graph_attr['bb'] = '"0,0,%.2f,%.2f"' % tuple(bb)
+        node_attr = dict(self.default_attr.get('node', {}))
+        node_attr.setdefault('label', '"\\N"')
+        for kw, attr_map in [('graph', graph_attr),
+                             ('node', node_attr),
+                             ('edge', self.default_attr.get('edge', {}))]:
+            items = ', '.join('%s=%s' % item for item in attr_map.iteritems())
+            lines.append('\t%s [%s];' % (kw, items))
+
+        node2index = {}
+        for i, v in enumerate(self.shown_nodes):
+            node2index[v] = i
+            attrs = dict(self.nodes_attr.get(v, {}))
+            attrs['pos'] = '"%.2f,%.2f"' % tuple(X[i])
+            attrs['width'] = '%.4g' % (sizes[i, 0] / POINTS_PER_INCH)
+            attrs['height'] = '%.4g' % (sizes[i, 1] / POINTS_PER_INCH)
+            items = ', '.join('%s=%s' % item for item in attrs.iteritems())
+            lines.append('\t"%s"\t[%s];' % (v, items))
+
+        for e in self.shown_edges:
+            v1, v2 = e
+            attrs = dict(self.edges_attr.get(e, {}))
+            i = node2index.get(v1)
+            j = node2index.get(v2)
+            if i is not None and j is not None and i != j:
+                directed = attrs.get('dir') == 'forward'
+                route = self._edge_route(X[i], X[j], sizes[i], sizes[j],
+                                         shapes[i], shapes[j], directed)
+                if route is not None:
+                    attrs['pos'] = '"%s"' % route
+            items = ', '.join('%s=%s' % item for item in attrs.iteritems())
+            lines.append('\t"%s" %s "%s"\t[%s];' % (v1, self.edge_type, v2,
+                                                     items))
+        return '\n'.join(lines) + '\n'
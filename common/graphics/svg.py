@@ -0,0 +1,288 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+Direct SVG rendering of stored layouts.
+
+Writes colored images from the node positions, sizes and edge routes in the
+dot text of a layout, producing the same drawing as rendering the layout
+with neato -n -Tsvg but without running Graphviz.
+"""
+
+from xml.sax.saxutils import escape
+from xml.sax.saxutils import quoteattr
+from .colormaps import BrewerColors
+from .render import parse_dot_body
+
+PAD = 4.0                       # points around the drawing, as Graphviz
+ARROW_LENGTH = 10.0             # points, arrowsize=1
+ARROW_HALF_WIDTH = 3.5
+DEFAULT_COLOR = '#000000'
+DEFAULT_FILL = '#d3d3d3'        # Graphviz lightgrey
+
+_SVG_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+_SVG_NS = 'xmlns="http://www.w3.org/2000/svg" ' \
+          'xmlns:xlink="http://www.w3.org/1999/xlink"'
+
+
+def _parse_points(pos):
+    """ Parse a Graphviz spline into (points, start, end) """
+
+    start = end = None
+    points = []
+    for token in pos.split():
+        fields = token.split(',')
+        if fields[0] == 'e':
+            end = (float(fields[1]), float(fields[2]))
+        elif fields[0] == 's':
+            start = (float(fields[1]), float(fields[2]))
+        else:
+            points.append((float(fields[0]), float(fields[1])))
+    return points, start, end
+
+
+def layout_geometry(dot_layout):
+    """
+    Extract the drawing geometry from the body of a dot layout. Returns a
+    dictionary with the bounding box ('bb'), node default attributes
+    ('node_defaults'), the list of nodes ('nodes') as (name, attrs) pairs
+    and the list of edges ('edges') as (name1, name2, attrs) triples.
+    """
+
+    geometry = {'bb': (0.0, 0.0, 0.0, 0.0),
+                'graph_attrs': {},
+                'node_defaults': {},
+                'edge_defaults': {},
+                'nodes': [],
+                'edges': [],
+                }
+    for kind, names, attrs in parse_dot_body(dot_layout):
+        if kind == 'N':
+            geometry['nodes'].append((names[0], attrs))
+        elif kind == 'E':
+            geometry['edges'].append((names[0], names[1], attrs))
+        elif kind == 'graph':
+            geometry['graph_attrs'].update(attrs)
+            if 'bb' in attrs:
+                geometry['bb'] = tuple(map(float, attrs['bb'].split(',')))
+        elif kind == 'node':
+            geometry['node_defaults'].update(attrs)
+        else:
+            geometry['edge_defaults'].update(attrs)
+    return geometry
+
+
+def _unquote(val):
+    return str(val).strip('"')
+
+
+def _color(attrs, key, default):
+    """ Resolve a Graphviz color attribute into an SVG color """
+
+    val = _unquote(attrs.get(key, default))
+    if val == 'transparent':
+        return 'none'
+    if val.isdigit() and 'colorscheme' in attrs:
+        scheme = _unquote(attrs['colorscheme'])
+        colors = BrewerColors.get(scheme)
+        if colors is not None and 0 < int(val) <= len(colors):
+            return '#%.2x%.2x%.2x' % colors[int(val) - 1]
+    return val
+
+
+def _fmt_points(points):
+    return ' '.join('%.2f,%.2f' % (x, -y) for x, y in points)
+
+
+def _node_shape(shape, x, y, w, h):
+    """ SVG element name and geometry attributes of a node shape """
+
+    if shape in ('ellipse', 'oval', 'circle'):
+        return 'ellipse', 'cx="%.2f" cy="%.2f" rx="%.2f" ry="%.2f"' % \
+               (x, -y, w / 2, h / 2)
+    if shape == 'hexagon':
+        corners = [(w / 2, 0.0), (w / 4, h / 2), (-w / 4, h / 2),
+                   (-w / 2, 0.0), (-w / 4, -h / 2), (w / 4, -h / 2)]
+    elif shape == 'octagon':
+        a = 0.2071
+        corners = [(w / 2, a * h), (a * w, h / 2), (-a * w, h / 2),
+                   (-w / 2, a * h), (-w / 2, -a * h), (-a * w, -h / 2),
+                   (a * w, -h / 2), (w / 2, -a * h)]
+    else:
+        corners = [(w / 2, h / 2), (-w / 2, h / 2), (-w / 2, -h / 2),
+                   (w / 2, -h / 2)]
+    points = [(x + dx, y + dy) for dx, dy in corners]
+    points.append(points[0])
+    return 'polygon', 'points="%s"' % _fmt_points(points)
+
+
+def _write_edge(fp, v1, v2, attrs, edge_op):
+
+    if 'pos' not in attrs:
+        return
+    points, start, end = _parse_points(attrs['pos'])
+    if not points:
+        return
+    stroke = _color(attrs, 'color', DEFAULT_COLOR)
+    arrowsize = float(_unquote(attrs.get('arrowsize', 1.0)))
+
+    fp.write('<g class="edge"><title>%s</title>\n' %
+             escape('%s%s%s' % (v1, edge_op, v2)))
+    path = 'M%.2f,%.2f' % (points[0][0], -points[0][1])
+    if len(points) > 1:
+        path += 'C%s' % ' '.join('%.2f,%.2f' % (x, -y) for x, y in points[1:])
+
+    if end is not None:
+        # The route leaves room for an arrow of arrowsize 1; extend it to
+        # the base of the actual arrowhead
+        last = points[-1]
+        dx = end[0] - last[0]
+        dy = end[1] - last[1]
+        norm = (dx * dx + dy * dy) ** 0.5 or 1.0
+        ux, uy = dx / norm, dy / norm
+        length = ARROW_LENGTH * arrowsize
+        base = (end[0] - ux * length, end[1] - uy * length)
+        half_width = ARROW_HALF_WIDTH * arrowsize
+        if norm > length:
+            path += 'L%.2f,%.2f' % (base[0], -base[1])
+        fp.write('<path fill="none" stroke=%s d="%s"/>\n' %
+                 (quoteattr(stroke), path))
+        arrow = [end,
+                 (base[0] - uy * half_width, base[1] + ux * half_width),
+                 (base[0] + uy * half_width, base[1] - ux * half_width),
+                 end]
+        fp.write('<polygon fill=%s stroke=%s points="%s"/>\n' %
+                 (quoteattr(stroke), quoteattr(stroke), _fmt_points(arrow)))
+    else:
+        fp.write('<path fill="none" stroke=%s d="%s"/>\n' %
+                 (quoteattr(stroke), path))
+    fp.write('</g>\n')
+
+
+def _write_node(fp, name, attrs, with_text):
+
+    if 'pos' not in attrs:
+        return
+    x, y = map(float, attrs['pos'].rstrip('!').split(',')[:2])
+    w = float(_unquote(attrs.get('width', 0.75))) * 72
+    h = float(_unquote(attrs.get('height', 0.5))) * 72
+    shape = _unquote(attrs.get('shape', 'ellipse'))
+    stroke = _color(attrs, 'color', DEFAULT_COLOR)
+    if 'filled' in _unquote(attrs.get('style', '')):
+        fill = _color(attrs, 'fillcolor', attrs.get('color', DEFAULT_FILL))
+    else:
+        fill = 'none'
+
+    fp.write('<g class="node"><title>%s</title>\n' % escape(name))
+    element, geometry = _node_shape(shape, x, y, w, h)
+    fp.write('<%s fill=%s stroke=%s %s/>\n' %
+             (element, quoteattr(fill), quoteattr(stroke), geometry))
+    if with_text:
+        label = _unquote(attrs.get('label', '\\N')).replace('\\N', name)
+        font_size = float(_unquote(attrs.get('fontsize', 14.0)))
+        font_name = _unquote(attrs.get('fontname', 'Times-Roman'))
+        font_color = _color(attrs, 'fontcolor', DEFAULT_COLOR)
+        fp.write('<text text-anchor="middle" x="%.2f" y="%.2f" '
+                 'font-family=%s font-size="%.2fpx" fill=%s>%s</text>\n' %
+                 (x, -y + 0.3 * font_size, quoteattr(font_name + ',sans-Serif'),
+                  font_size, quoteattr(font_color), escape(label)))
+    fp.write('</g>\n')
+
+
+def image_size(geometry):
+    """ Width and height (in points) of the unscaled image """
+
+    x0, y0, x1, y1 = geometry['bb']
+    return x1 - x0 + 2 * PAD, y1 - y0 + 2 * PAD
+
+
+def write_svg(fp, geometry, nodes_attr=None, default_attr=None,
+              directed=False, stroke_width=0.3, scale=1.0, view_box=True,
+              with_text=True, xml_header=True):
+    """
+    Write the layout geometry (from layout_geometry) as SVG into fp.
+
+    :param `nodes_attr`: rendering attributes for nodes (e.g. colors);
+    :param `default_attr`: default rendering attributes for 'graph', 'node'
+                           and 'edge', as for NeatoLayout.render_colored;
+    :param `stroke_width`: width of node frames and edges;
+    :param `scale`: scaling factor for the image;
+    :param `view_box`: write the viewBox attribute of the root element;
+    :param `with_text`: write node labels;
+    :param `xml_header`: write the XML declaration.
+    """
+
+    nodes_attr = nodes_attr if nodes_attr is not None else {}
+    default_attr = default_attr if default_attr is not None else {}
+    edge_op = '->' if directed else '--'
+    width, height = image_size(geometry)
+    x0, y0 = geometry['bb'][:2]
+
+    if xml_header:
+        fp.write(_SVG_HEADER)
+    fp.write('<svg width="%.2fpt" height="%.2fpt"' %
+             (width * scale, height * scale))
+    if view_box:
+        fp.write(' viewBox="0.00 0.00 %.2f %.2f"' % (width, height))
+    fp.write(' %s>\n' % _SVG_NS)
+    fp.write('<g id="graph0" class="graph" transform="scale(%.5f %.5f) '
+             'translate(%.2f %.2f)"' % (scale, scale, PAD - x0,
+                                        height - PAD + y0))
+    if stroke_width is not None:
+        fp.write(' style="stroke-width:%.3fpx;"' % stroke_width)
+    fp.write('>\n')
+
+    graph_attrs = dict(geometry['graph_attrs'])
+    graph_attrs.update(default_attr.get('graph', {}))
+    bgcolor = _color(graph_attrs, 'bgcolor', 'white')
+    if bgcolor != 'none':
+        fp.write('<polygon fill=%s stroke="none" points="%s"/>\n' %
+                 (quoteattr(bgcolor),
+                  _fmt_points([(x0 - PAD, y0 - PAD),
+                               (x0 - PAD, y0 + height - PAD),
+                               (x0 + width - PAD, y0 + height - PAD),
+                               (x0 + width - PAD, y0 - PAD),
+                               (x0 - PAD, y0 - PAD)])))
+
+    edge_defaults = dict(geometry['edge_defaults'])
+    edge_defaults.update(default_attr.get('edge', {}))
+    for v1, v2, attrs in geometry['edges']:
+        edge_attrs = dict(edge_defaults)
+        edge_attrs.update(attrs)
+        _write_edge(fp, v1, v2, edge_attrs, edge_op)
+
+    node_defaults = dict(geometry['node_defaults'])
+    node_defaults.update(default_attr.get('node', {}))
+    for name, attrs in geometry['nodes']:
+        node_attrs = dict(node_defaults)
+        node_attrs.update(attrs)
+        node_attrs.update(nodes_attr.get(name, {}))
+        _write_node(fp, name, node_attrs, with_text)
+
+    fp.write('</g>\n</svg>\n')
@@ -2,6 +2,8 @@
 Routines for storing and retrieving data objects from JSON files.
 """
 
+import re
+import numpy as np
 try:
     import json
 except ImportError:
@@ -102,3 +104,201 @@ def restore_data_object(obj_file):
         with open(obj_file, 'rb') as fp:
             obj = decoder.decode(fp.read())
     return obj
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER = re.compile(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?')
+_NUMBER_LIST = re.compile(r'[-+0-9.eE, \t\n\r]*')
+_CONSTANTS = [('true', True), ('false', False), ('null', None),
+              ('NaN', float('nan')), ('Infinity', float('inf')),
+              ('-Infinity', float('-inf'))]
+
+
+class _StreamDecoder(object):
+    """
+    JSON decoder reading its input from a file in chunks. The numeric
+    arrays stored under array_keys are converted into numpy arrays a chunk
+    at a time, without building intermediate lists of Python numbers.
+    """
+
+    def __init__(self, fp, array_keys=(), chunk_size=1 << 16):
+
+        self.fp = fp
+        self.array_keys = frozenset(array_keys)
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+
+    def _fill(self):
+        """ Append a chunk of input to the buffer; False at the end. """
+
+        data = self.fp.read(self.chunk_size)
+        if not data:
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _error(self, msg):
+        return ValueError('%s (%d characters before the end of the buffer)' %
+                          (msg, len(self.buf) - self.pos))
+
+    def _peek(self):
+        """ Skip the whitespace and return the next character. """
+
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise self._error('Unexpected end of JSON data')
+
+    def _next(self):
+        c = self._peek()
+        self.pos += 1
+        return c
+
+    def decode(self, key=None):
+        """ Decode the next value (stored under key in its object). """
+
+        c = self._peek()
+        if c == '{':
+            return self._object()
+        elif c == '[':
+            if key in self.array_keys:
+                return self._numeric_array()
+            return self._array()
+        elif c == '"':
+            return self._string()
+        return self._scalar()
+
+    def decode_all(self):
+        """ Decode the only value in the input. """
+
+        obj = self.decode()
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                raise self._error('Extra data')
+            if not self._fill():
+                return obj
+
+    def _object(self):
+
+        self.pos += 1
+        obj = {}
+        if self._peek() == '}':
+            self.pos += 1
+            return obj
+        while True:
+            if self._peek() != '"':
+                raise self._error('Expecting property name')
+            key = self._string()
+            if self._next() != ':':
+                raise self._error('Expecting : delimiter')
+            obj[key] = self.decode(key)
+            c = self._next()
+            if c == '}':
+                return obj
+            elif c != ',':
+                raise self._error('Expecting , delimiter')
+
+    def _array(self):
+
+        self.pos += 1
+        lst = []
+        if self._peek() == ']':
+            self.pos += 1
+            return lst
+        while True:
+            lst.append(self.decode())
+            c = self._next()
+            if c == ']':
+                return lst
+            elif c != ',':
+                raise self._error('Expecting , delimiter')
+
+    def _string(self):
+
+        # Strings are short, so an unterminated one is simply retried with
+        # more input
+        while True:
+            try:
+                s, self.pos = json.decoder.scanstring(self.buf, self.pos + 1,
+                                                      'ascii', True)
+                return s
+            except ValueError:
+                if not self._fill():
+                    raise
+
+    def _scalar(self):
+
+        # Make sure that the whole token is in the buffer
+        while len(self.buf) - self.pos < 16 and self._fill():
+            pass
+        m = _NUMBER.match(self.buf, self.pos)
+        while m is not None and m.end() == len(self.buf) and self._fill():
+            m = _NUMBER.match(self.buf, self.pos)
+
+        for name, value in _CONSTANTS:
+            if self.buf.startswith(name, self.pos):
+                self.pos += len(name)
+                return value
+        if m is None:
+            raise self._error('No JSON object could be decoded')
+        self.pos = m.end()
+        integer, frac, exp = m.groups()
+        if frac or exp:
+            return float(integer + (frac or '') + (exp or ''))
+        return int(integer)
+
+    def _numeric_array(self):
+
+        self.pos += 1
+        parts = []
+        while True:
+            end = _NUMBER_LIST.match(self.buf, self.pos).end()
+            if end < len(self.buf):
+                break
+            # Convert all complete numbers and read more
+            cut = self.buf.rfind(',', self.pos, end)
+            if cut >= 0:
+                parts.append(_number_array(self.buf[self.pos:cut]))
+                self.pos = cut + 1
+            if not self._fill():
+                raise self._error('Unexpected end of JSON data')
+        if self.buf[end] != ']':
+            raise self._error('Expecting a numeric array')
+        if self.buf[self.pos:end].strip():
+            parts.append(_number_array(self.buf[self.pos:end]))
+        self.pos = end + 1
+        if not parts:
+            return np.zeros(0)
+        return np.concatenate(parts)
+
+
+def _number_array(text):
+    """ Convert comma-separated numbers into an integer or float array. """
+
+    dtype = float if any(c in text for c in '.eE') else np.int64
+    arr = np.fromstring(text, dtype=dtype, sep=',')
+    # fromstring stops at the first malformed number
+    if len(arr) != text.count(',') + 1:
+        raise ValueError('Malformed numeric array')
+    return arr
+
+
+def restore_data_object_stream(obj_file, array_keys=()):
+    """Retrieve object from JSON file, reading it incrementally.
+
+    As restore_data_object(), but the numeric arrays stored under any of
+    array_keys are returned as numpy arrays. Suitable for large inputs
+    (e.g. graphs), which are never held in memory as a whole.
+    """
+
+    if hasattr(obj_file, 'read'):
+        obj = _StreamDecoder(obj_file, array_keys).decode_all()
+    else:
+        with open(obj_file, 'rb') as fp:
+            obj = _StreamDecoder(fp, array_keys).decode_all()
+    return obj
@@ -4,7 +4,9 @@ import sys
 import os
 import os.path
 import errno
+import fcntl
 import shutil
+from contextlib import contextmanager
 from fnmatch import fnmatch
 import numpy as np
 
@@ -74,6 +76,21 @@ def check_file_exists(full_path):
     return False
 
 
+@contextmanager
+def file_lock(lock_path):
+    """
+    Holds an exclusive lock on the file lock_path (created if necessary)
+    within the with-block. Blocks until the lock is obtained.
+    """
+
+    with open(lock_path, 'a') as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
 def import_module(module_name):
     """Dynamically import module."""
 
@@ -91,9 +108,9 @@ def import_module(module_name):
 def write_string_list(fp, str_lst, write_list_length=True):
     """Write list of strings into binary file."""
     if write_list_length:
-        fp.write(np.array([len(str_lst)], dtype='<u4'))
+        fp.write(np.array([len(str_lst)], dtype='<u4').tostring())
     buf = "%s\0" % '\0'.join(str_lst)
-    fp.write(np.array([len(buf)], dtype='<u4'))
+    fp.write(np.array([len(buf)], dtype='<u4').tostring())
     fp.write(buf)
 
 def read_string_list(fp, read_list_length=True):
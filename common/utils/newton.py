@@ -1,28 +1,179 @@
-""" Newton's method function. """
+""" Root finding functions for damping factor searches. """
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
 import numpy as np
 
-def rootfind_newton(func, x0, a, b, maxiter=50, tol=1.0e-11):
-    """ Find root using bracketed Newton's method """
+def rootfind_illinois(func, x0, a, b, maxiter=50, tol=1.0e-11, step=0.05):
+    """
+    Find root of an increasing function using bracketed secant method. If a
+    secant step leaves the bracket and the root is bracketed by evaluated
+    points, the Illinois variant of regula falsi is used instead (otherwise
+    bisection). The function func(x) returns the pair (fval, args) - no
+    derivative is required. The first step is taken at distance step from
+    x0.
+
+    Returns the last evaluated point, so args always correspond to x.
+    """
+
+    fa = fb = None
+    x_prev = f_prev = None
+    side = 0 # which end of the bracket was replaced last (-1: a, 1: b)
+    x = x0
 
     for iter in xrange(maxiter):
 
-        fval, fpval, args = func(x0)
-        # print "x0=%.4f fval=%.2e fpval=%.2e [%.4f, %.4f]" % (x0, fval, fpval, a, b)
+        fval, args = func(x)
+        if np.abs(fval) < tol:
+            break
 
         if fval < 0:
-            a = x0
+            a, fa = x, fval
+            if side == -1 and fb is not None:
+                # The same end was retained twice - Illinois modification
+                fb *= 0.5
+            side = -1
         else:
-            b = x0
+            b, fb = x, fval
+            if side == 1 and fa is not None:
+                fa *= 0.5
+            side = 1
 
-        x = x0 - fval/fpval
-        if not (a < x < b):
-            # Once we have bracketed the root, we don't allow the
-            # iterations to leave the bracket.
-            x = 0.5*(a+b)
+        if x_prev is not None and fval != f_prev:
+            x_new = x - fval * (x - x_prev) / (fval - f_prev)
+        else:
+            x_new = x - step if fval > 0 else x + step
+        if not (a < x_new < b) and fa is not None and fb is not None:
+            # Secant step left the bracket - use regula falsi instead
+            x_new = (a * fb - b * fa) / (fb - fa)
 
-        if np.abs(x-x0) < tol or np.abs(fval) < tol:
+        if not (a < x_new < b):
+            x_new = 0.5*(a+b)
+
+        if np.abs(x_new-x) < tol:
             break
 
-        x0 = x
+        x_prev, f_prev = x, fval
+        x = x_new
 
     return x, fval, iter, args
+
+
+class RootHistory(object):
+    """
+    Stores the roots found for families of related problems, so that a new
+    search can be started close to the answer. A family is identified by a
+    hashable key and its members by a scalar target. The estimate for a new
+    target is interpolated from the roots for the nearest stored targets,
+    assuming that the root is monotone in the target.
+
+    The estimate is only used as a starting point, so a stale or colliding
+    key can slow down the search but cannot change its result. The history
+    can be shared between threads.
+    """
+
+    def __init__(self, max_keys=200, max_targets=20):
+
+        self.max_keys = max_keys
+        self.max_targets = max_targets
+        self._roots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _roots_for_key(self, key):
+        """ List of (target, root) pairs stored under key (None if none). """
+
+        with self._lock:
+            if key not in self._roots:
+                return None
+            return self._roots[key].items()
+
+    def estimate(self, key, target, default=None):
+        """
+        Returns the estimated root for the given key and target or default
+        if nothing is stored under the key.
+        """
+
+        pts = self._roots_for_key(key)
+        if not pts:
+            return default
+        pts.sort()
+        targets = [t for t, _ in pts]
+        roots = [x for _, x in pts]
+        return float(np.interp(target, targets, roots))
+
+    def record(self, key, target, root):
+        """Store the root found for the given key and target."""
+
+        with self._lock:
+            roots = self._roots.pop(key, None)
+            if roots is None:
+                roots = OrderedDict()
+                if len(self._roots) >= self.max_keys:
+                    self._roots.popitem(last=False)
+            self._roots[key] = roots
+
+            roots.pop(target, None)
+            roots[target] = root
+            if len(roots) > self.max_targets:
+                roots.popitem(last=False)
+
+
+class SQLiteRootHistory(RootHistory):
+    """
+    RootHistory kept in the SQLite database at path, so that it is shared
+    by all processes using it (e.g. CGI requests and job runners) and
+    survives them. Keys are stored by their repr(). A connection is opened
+    for each access, so instances can be passed to other processes. The
+    history only provides starting points, so errors accessing the database
+    (e.g. timeouts) are ignored.
+    """
+
+    def __init__(self, path, max_keys=200, max_targets=20, timeout=5.0):
+
+        RootHistory.__init__(self, max_keys, max_targets)
+        self.path = path
+        self.timeout = timeout
+        self._execute('CREATE TABLE IF NOT EXISTS roots ('
+                      'key TEXT, target REAL, root REAL, stamp REAL, '
+                      'PRIMARY KEY (key, target))')
+
+    def _execute(self, *statements):
+        """
+        Execute the pairs (sql, args) in a single transaction and return the
+        rows produced by the last one (None on errors).
+        """
+
+        try:
+            conn = sqlite3.connect(self.path, self.timeout)
+            try:
+                with conn:
+                    for stmt in statements:
+                        if isinstance(stmt, basestring):
+                            stmt = (stmt, ())
+                        rows = conn.execute(*stmt).fetchall()
+                return rows
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+
+    def _roots_for_key(self, key):
+
+        return self._execute(('SELECT target, root FROM roots WHERE key = ?',
+                              (repr(key), )))
+
+    def record(self, key, target, root):
+        """Store the root found for the given key and target."""
+
+        key = repr(key)
+        self._execute(('INSERT OR REPLACE INTO roots VALUES (?, ?, ?, ?)',
+                       (key, target, root, time.time())),
+                      ('DELETE FROM roots WHERE key = ? AND target NOT IN '
+                       '(SELECT target FROM roots WHERE key = ? '
+                       'ORDER BY stamp DESC LIMIT ?)',
+                       (key, key, self.max_targets)),
+                      ('DELETE FROM roots WHERE key NOT IN '
+                       '(SELECT key FROM roots GROUP BY key '
+                       'ORDER BY MAX(stamp) DESC LIMIT ?)',
+                       (self.max_keys, )))
@@ -0,0 +1,170 @@
+""" Thread-level parallelism for the linear solvers. """
+import os
+import time
+import ctypes
+import threading
+from multiprocessing.pool import ThreadPool
+import numpy as np
+
+# Environment variables read by the common BLAS implementations at load time
+_blas_env_vars = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                  'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS']
+
+# Functions setting the number of threads of already loaded BLAS libraries
+_blas_setters = [('openblas', 'openblas_set_num_threads'),
+                 ('mkl_rt', 'MKL_Set_Num_Threads'),
+                 ('gomp', 'omp_set_num_threads'),
+                 ('iomp', 'omp_set_num_threads'),
+                 ]
+
+_num_threads = 1
+_pool = None
+_lock = threading.Lock()
+
+# Timing of the parallel solves, see solver_stats(). Updated by all threads
+# calling solve_columns().
+_stats = {'calls': 0, 'columns': 0, 'wall_time': 0.0, 'busy_time': 0.0}
+_stats_lock = threading.Lock()
+
+
+def _loaded_libraries():
+    try:
+        with open('/proc/self/maps') as fp:
+            return set(line.split()[-1] for line in fp
+                       if line.rstrip().endswith('.so') or '.so.' in line)
+    except IOError:
+        return set()
+
+
+def set_blas_threads(num_threads):
+    """
+    Limit the number of threads used by BLAS. The environment variables are
+    set for the libraries loaded later (and child processes), while the
+    libraries already loaded are reconfigured where possible. Returns the
+    list of reconfigured libraries.
+    """
+
+    for var in _blas_env_vars:
+        os.environ[var] = str(num_threads)
+
+    reconfigured = []
+    for path in _loaded_libraries():
+        for lib_name, func_name in _blas_setters:
+            if lib_name not in os.path.basename(path):
+                continue
+            try:
+                func = getattr(ctypes.CDLL(path), func_name)
+            except (OSError, AttributeError):
+                continue
+            func(ctypes.c_int(num_threads))
+            reconfigured.append(path)
+    return reconfigured
+
+
+def set_num_threads(num_threads, blas_threads=1):
+    """
+    Set the number of threads used for solving blocks of right hand sides.
+    BLAS is limited to blas_threads threads (one by default) so that the two
+    levels of parallelism, as well as several worker processes, do not
+    oversubscribe the processors.
+    """
+
+    global _num_threads, _pool
+    num_threads = max(1, int(num_threads))
+    with _lock:
+        if num_threads != _num_threads and _pool is not None:
+            _pool.close()
+            _pool = None
+        _num_threads = num_threads
+    set_blas_threads(blas_threads)
+
+
+def get_num_threads():
+    return _num_threads
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPool(_num_threads)
+        return _pool
+
+
+def solve_columns(solve, rhs):
+    """
+    Apply solve to the columns of the 2D array rhs and return the solutions
+    as columns of an array of the same shape. The solver is called with 2D
+    blocks of columns, so that it can process several right hand sides in
+    one pass. With more than one thread, the columns are split into
+    contiguous blocks solved in parallel by the thread pool. The solver must
+    release the GIL (as SuperLU does) for this to be effective.
+
+    With several threads, the first column is solved in the calling thread
+    so that any lazy factorization happens before the solver is shared
+    between threads.
+
+    The solutions are stored in the precision of rhs if it is a floating
+    point array (so that a single precision rhs gives single precision
+    solutions), otherwise in double precision.
+    """
+
+    rhs = np.asarray(rhs)
+    if rhs.dtype.kind == 'f':
+        X = np.empty(rhs.shape, rhs.dtype)
+    else:
+        X = np.empty(rhs.shape, 'd')
+    num_cols = rhs.shape[1]
+    if num_cols == 0:
+        return X
+
+    def _solve_block(cols):
+        t = time.time()
+        X[:, cols] = solve(rhs[:, cols])
+        return time.time() - t
+
+    start_time = time.time()
+    num_blocks = min(_num_threads, num_cols - 1)
+    if num_blocks > 1:
+        busy_time = _solve_block(slice(0, 1))
+        blocks = [slice(b[0], b[-1] + 1) for b in
+                  np.array_split(np.arange(1, num_cols), num_blocks)]
+        busy_time += sum(_get_pool().map(_solve_block, blocks))
+    else:
+        busy_time = _solve_block(slice(0, num_cols))
+
+    wall_time = time.time() - start_time
+    with _stats_lock:
+        _stats['calls'] += 1
+        _stats['columns'] += num_cols
+        _stats['wall_time'] += wall_time
+        _stats['busy_time'] += busy_time
+    return X
+
+
+def solver_stats(reset=False, since=None):
+    """
+    Returns a dictionary with the number of parallel solves, the number of
+    columns solved, the total wall clock and busy (summed over threads) time
+    and the concurrency (busy time over wall time, i.e. the average number
+    of threads solving at once). The concurrency is not a measured speedup:
+    with BLAS or memory bandwidth contention, the threads may be busy for
+    longer than a single thread would take.
+
+    If since is a dictionary previously returned by solver_stats(), the
+    counts and times are given relative to it.
+    """
+
+    with _stats_lock:
+        stats = dict(_stats)
+        if reset:
+            _stats.update(calls=0, columns=0, wall_time=0.0, busy_time=0.0)
+    if since is not None:
+        for key in _stats:
+            stats[key] -= since[key]
+    stats['threads'] = _num_threads
+    if stats['wall_time'] > 0.0:
+        stats['concurrency'] = stats['busy_time'] / stats['wall_time']
+    else:
+        stats['concurrency'] = 1.0
+    return stats
@@ -57,6 +57,7 @@ PACKAGES = [
 SCRIPTS = ['scripts/qmbpmn-datasets',
            'scripts/qmbpmn-deploy',
            'scripts/qmbpmn-server',
+           'scripts/qmbpmn-bench',
            'scripts/qmbpmn-clean-temp',
            'scripts/itmprobe',
            ]
@@ -32,6 +32,7 @@ from ...common.utils.pickling import check_object
 from ...common.utils.pickling import restore_object
 from .. import validators as vld
 from .. import exceptions as exc
+from ..storage import StorageManager
 from ..SaddleSum.runs import process_cgi_query
 from ...ITMProbe import commands
 
@@ -79,12 +80,15 @@ def form_input_options(www_model, query_id, conf):
 
 def enrich_query(cgi_map, conf):
 
-    storage_path = os.path.join(conf.data_root, conf.ITMProbe_storage_dir)
+    storage = StorageManager(os.path.join(conf.data_root,
+                                          conf.ITMProbe_storage_dir))
     cgi_args = {'exclude_warning_types': '0|1'}
     query_id = vld.hash_validator('query_id', cgi_map['query_id'])
+    query_path = storage.query_path(query_id, False)
 
-    if check_object(storage_path, '%s' % query_id):
-        www_model = restore_object(storage_path, query_id)
+    if check_object(query_path, '%s' % query_id):
+        www_model = restore_object(query_path, query_id)
+        storage.touch(query_id)
     else:
         raise exc.MissingStoredResults()
 
@@ -108,5 +112,8 @@ def enrich_query(cgi_map, conf):
         if k in cgi_map:
             cgi_args[k] = cgi_map[k]
 
-    conf.error_template = 'enrich/error.html'
-    return process_cgi_query(cgi_args, conf)
+    try:
+        return process_cgi_query(cgi_args, conf)
+    except exc.WebException, e:
+        e.error_template = 'enrich/error.html'
+        raise
@@ -0,0 +1,110 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+Evaluation of the same query on several networks (e.g. for several species).
+"""
+
+import os
+import multiprocessing
+from .. import exceptions as exc
+from ...common.utils.parallel import set_blas_threads
+from ...ITMProbe import commands
+from ...ITMProbe.core.bundle import save_bundle
+from .network import open_network
+
+
+def _run_network(args):
+    """
+    Evaluates the query on one network (in a worker process). The
+    identifiers are mapped through the gene index of the network, ignoring
+    those not found. Returns a triple (label, itm_path, messages), where
+    itm_path is None if the query could not be evaluated.
+    """
+
+    www_model_class, cgi_map, network_file, itm_path, extra_input_params = args
+
+    net = open_network(network_file)
+    net.ignore_unknown = True
+    try:
+        mdata = www_model_class()
+        model_kwargs = mdata.validate_model_args(dict(cgi_map), net)
+        net.G.name = net.network_name
+        model_kwargs['G'] = net.G
+        model_kwargs['extra_input_params'] = list(extra_input_params)
+
+        model_class = commands.model_classes[mdata.solution_class]
+        model_solution = model_class(**model_kwargs)
+        model_solution.save(itm_path)
+    except (exc.WebException, RuntimeError), e:
+        return net.network_name, None, net.warning_messages + [str(e)]
+    return net.network_name, itm_path, net.warning_messages
+
+
+def fanout_run(www_model_class, cgi_map, network_files, bundle_path,
+               num_processes=None, extra_input_params=None):
+    """
+    Evaluates the query given by cgi_map using www_model_class on each of
+    network_files. The networks are processed concurrently by a pool of
+    num_processes worker processes (by default, one per network, up to the
+    number of processors), each with single-threaded BLAS. The results are
+    saved into a multi-network bundle at bundle_path.
+
+    Worker processes must not be forked from a web server, so the web
+    interface calls this from the job queue runner, or with num_processes
+    set to 1.
+
+    Returns the list of pairs (label, messages) for each network.
+    """
+
+    if extra_input_params is None:
+        extra_input_params = []
+    tasks = [(www_model_class, cgi_map, network_file,
+              '%s.%d.tmp' % (bundle_path, i), extra_input_params)
+             for i, network_file in enumerate(network_files)]
+
+    if num_processes is None:
+        num_processes = min(len(tasks), multiprocessing.cpu_count())
+    if num_processes > 1:
+        pool = multiprocessing.Pool(num_processes, set_blas_threads, (1, ))
+        try:
+            results = pool.map(_run_network, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_run_network, tasks)
+
+    try:
+        save_bundle(bundle_path, results)
+    finally:
+        for _, itm_path, _ in results:
+            if itm_path is not None and os.path.exists(itm_path):
+                os.remove(itm_path)
+    return [(label, messages) for label, _, messages in results]
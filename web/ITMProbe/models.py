@@ -26,15 +26,25 @@
 # Code author:  Aleksandar Stojmirovic
 #
 
+import os
 import os.path
 import time
+import json
+import hashlib
 import urllib
 import numpy as np
 from .. import validators as vld
 from .. import exceptions as exc
 from ...common.utils.pickling import save_object
+from ...common.utils.pickling import check_object
+from ...common.utils.pickling import restore_object
+from ...common.utils.filesys import file_lock
+from ...common.utils.filesys import makedirs2
+from ... import version
 from .display_opts import DisplayOpts
-from .network import ITMProbeNetwork
+from .network import open_network
+from .fanout import fanout_run
+from ...ITMProbe.core import report_progress
 from ...ITMProbe import commands
 
 class InfoPropModel(object):
@@ -79,8 +89,28 @@ class InfoPropModel(object):
         hash_val = long(np.uint32(hash(time.time())))
         return '%X' % hash_val
 
-    def run_model(self, cgi_map, network_files, storage_path, saddlesum_path):
-        """ Main model running routine """
+    def get_content_query_id(self, network, model_kwargs):
+        """
+        Create a query identifier from the query contents: the checksum
+        of the network files, the model class, the validated model
+        arguments (including the excluded nodes) and the code version.
+        Identical queries therefore share an identifier and results.
+        """
+
+        content = [network.checksum(), self.solution_class,
+                   version.CURRENT_VERSION, model_kwargs]
+        canonical = json.dumps(content, sort_keys=True, separators=(',', ':'),
+                               default=repr)
+        return hashlib.sha1(canonical).hexdigest()[:20].upper()
+
+    def run_model(self, cgi_map, network_files, storage, saddlesum_path,
+                  stored_only=False):
+        """
+        Main model running routine; the results are kept in storage (a
+        StorageManager). If stored_only is True, only the stored results of
+        an identical query are looked up and None is returned when there
+        are none.
+        """
 
         # Concatenate antisinks from uploaded file to antisinks from text area
         cgi_map['antisink_map'] += cgi_map.pop('antisink_map2')
@@ -93,35 +123,110 @@ class InfoPropModel(object):
         else:
             raise exc.InsufficientArgsError('graph')
         self.network_file = network_files[graph_id]
-        net = ITMProbeNetwork(self.network_file, True)
+        report_progress('Loading network')
+        net = open_network(self.network_file)
 
         # Get input arguments
         model_kwargs = self.validate_model_args(cgi_map, net)
-        net.G.name = net.network_name
-        model_kwargs['G'] = net.G
 
         # Set stored variables
-        self.query_id = self.get_query_id()
-        model_kwargs['extra_input_params'] = [('Query ID', self.query_id)]
+        self.query_id = self.get_content_query_id(net, model_kwargs)
         self.warning_msgs = net.warning_messages
         self.enrich_termdb_names = net.get_enrich_termdb_names(saddlesum_path)
         self.enrich_files = net.enrich_files
-        self.itm_path = os.path.join(storage_path, '%s.itm' % self.query_id)
+        # Looking up stored results does not create the query directory
+        query_path = storage.query_path(self.query_id, not stored_only)
+        self.itm_path = os.path.join(query_path, '%s.itm' % self.query_id)
+        if stored_only and not os.path.isdir(query_path):
+            return None
+
+        # Holding the lock, identical queries submitted concurrently are
+        # computed only once; the others reuse the stored results.
+        lock_path = os.path.join(query_path, '%s.lock' % self.query_id)
+        try:
+            with file_lock(lock_path):
+                if check_object(query_path, self.query_id) and \
+                        os.path.exists(self.itm_path):
+                    self._reuse_results(query_path)
+                    storage.touch(self.query_id)
+                elif stored_only:
+                    return None
+                else:
+                    self._compute_results(net, model_kwargs, query_path)
+                    storage.register(self.query_id)
+        except:
+            # The files of a failed computation are not registered, so they
+            # would never be removed by cleaning
+            storage.discard(self.query_id)
+            raise
+
+        # Return the link to the 'true' results page
+        url_map = self.display_options.get_layout_url_map(cgi_map,
+                                                          self.query_id)
+        rendering_url = 'ITMProbe.cgi?view=1&%s' % urllib.urlencode(url_map)
+        return rendering_url
+
+    def _reuse_results(self, query_path):
+        """
+        Take display settings from the stored results of an identical query.
+        """
+
+        report_progress('Loading stored results')
+        stored = restore_object(query_path, self.query_id)
+        self.display_options = stored.display_options
+
+    def _compute_results(self, net, model_kwargs, query_path):
+        """ Run the model and store its results """
+
+        # The directory may have been discarded after a failed computation
+        # of the same query
+        makedirs2(query_path)
+        net.G.name = net.network_name
+        model_kwargs['G'] = net.G
+        model_kwargs['extra_input_params'] = [('Query ID', self.query_id)]
 
         # Main run
+        report_progress('Solving')
         model_class = commands.model_classes[self.solution_class]
         model_solution = model_class(**model_kwargs)
         self.set_display_settings(model_solution)
 
         # Save solution plus settings
+        report_progress('Saving results')
         model_solution.save(self.itm_path)
-        save_object(self, storage_path, self.query_id)
+        save_object(self, query_path, self.query_id)
 
-        # Return the link to the 'true' results page
-        url_map = self.display_options.get_layout_url_map(cgi_map,
-                                                          self.query_id)
-        rendering_url = 'ITMProbe.cgi?view=1&%s' % urllib.urlencode(url_map)
-        return rendering_url
+    def run_fanout(self, cgi_map, network_files, storage,
+                   num_processes=None):
+        """
+        Run the model for the same query on several networks, given as a
+        list of identifiers in cgi_map['graphs']. Returns the path to the
+        bundle with the results.
+        """
+
+        cgi_map['antisink_map'] += cgi_map.pop('antisink_map2')
+
+        if 'graphs' not in cgi_map:
+            raise exc.InsufficientArgsError('graphs')
+        fanout_files = vld.network_list_validator('graphs', cgi_map['graphs'],
+                                                  network_files)
+
+        self.query_id = self.get_query_id()
+        query_path = storage.query_path(self.query_id)
+        self.itm_path = os.path.join(query_path, '%s.itm' % self.query_id)
+        extra_input_params = [('Query ID', self.query_id)]
+        try:
+            messages = fanout_run(self.__class__, cgi_map, fanout_files,
+                                  self.itm_path, num_processes,
+                                  extra_input_params)
+        except:
+            storage.discard(self.query_id)
+            raise
+        storage.register(self.query_id)
+        self.warning_msgs = ['%s: %s' % (label, msg)
+                             for label, network_msgs in messages
+                             for msg in network_msgs]
+        return self.itm_path
 
     def validate_model_args(self, cgi_map, network):
         """ Validate model options """
@@ -147,8 +252,7 @@ class InfoPropModel(object):
 
     def _process_node_table(self, header, body):
 
-        network = ITMProbeNetwork(self.network_file, False)
-        network.open_genes()
+        network = open_network(self.network_file, False)
 
         # Add links
         header.append('Links')
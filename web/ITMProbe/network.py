@@ -29,7 +29,8 @@
 
 import sys
 import os.path
-from collections import defaultdict
+import hashlib
+import numpy as np
 from ...common.graph.csrgraph import CSRDirectedGraph
 from ...common.db_parsers.ncbi_gene import NCBIGenes_from_index
 from ...common.utils.dataobj import restore_data_object
@@ -37,6 +38,26 @@ from .. import exceptions as exc
 from ..SaddleSum import get_etd_info
 
 
+# Networks loaded in advance by long-running servers, keyed by network file
+_preloaded_networks = {}
+
+# Checksums of files, keyed by (path, size, modification time)
+_file_checksums = {}
+
+
+def _file_checksum(path):
+
+    file_stat = os.stat(path)
+    key = (path, file_stat.st_size, file_stat.st_mtime)
+    if key not in _file_checksums:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as fp:
+            for block in iter(lambda: fp.read(1 << 20), ''):
+                sha1.update(block)
+        _file_checksums[key] = sha1.hexdigest()
+    return _file_checksums[key]
+
+
 class ITMProbeNetwork(object):
 
     WARNING_FMTS = ['%(field)s: Specified network does not contain entity'
@@ -50,6 +71,10 @@ class ITMProbeNetwork(object):
                       ' %(aliases)s (additional instance IGNORED).',
                     ]
 
+    # If true, unknown identifiers are always ignored with a warning (used
+    # when the same query is evaluated on several networks).
+    ignore_unknown = False
+
     def __init__(self, network_file, init_data=True):
 
         self.network_file = network_file
@@ -89,6 +114,29 @@ class ITMProbeNetwork(object):
         self.warning_messages = []
         self.open_genes()
 
+    def clone(self):
+        """
+        Returns a copy sharing the graph and the gene index but keeping
+        separate warning messages.
+        """
+
+        net = object.__new__(self.__class__)
+        net.__dict__.update(self.__dict__)
+        net.warning_messages = []
+        return net
+
+    def checksum(self):
+        """
+        Checksum of the network configuration, graph and gene index files.
+        """
+
+        sha1 = hashlib.sha1()
+        for path in (self.network_file,
+                     os.path.join(self.graph_dir, self.graph_file),
+                     os.path.join(self.gene_dir, self.gene_info_index)):
+            sha1.update(_file_checksum(path))
+        return sha1.hexdigest()
+
     def open_genes(self):
 
         gene_ix_path = os.path.join(self.gene_dir, self.gene_info_index)
@@ -110,6 +158,7 @@ class ITMProbeNetwork(object):
 
     def validate_symbols(self, symbols, field, ignore_unknown=False):
 
+        ignore_unknown = ignore_unknown or self.ignore_unknown
         mapped_symb, _ = self.genes.map_symbols(symbols)
         valid_ids = []
         warnings = []
@@ -157,29 +206,49 @@ class ITMProbeNetwork(object):
         else:
             return None
 
-    def to_sif_file(self, fp=sys.stdout):
+    def to_sif_file(self, fp=None):
         """
         Write network in Cytoscape SIF format.
         """
+
+        if fp is None:
+            fp = sys.stdout
         gn = self.genes
         nodes = self.G.nodes
-        A = self.G.weighted_adjacency_matrix().adjacency_matrix
         geneids = [gn.gene_ids[gn.alias2index[str(node)]] for node in nodes]
-        counts = defaultdict(int)
-
-        for i, node in enumerate(nodes):
-            for k in xrange(A.indptr[i], A.indptr[i+1]):
-                if A.data[k] > 0:
-                    j = A.indices[k]
-                    if i < j:
-                        counts[(i,j)] += 1
-                    else:
-                        counts[(j,i)] += 1
-
-        for pair, c in counts.iteritems():
-            geneid1 = geneids[pair[0]]
-            geneid2 = geneids[pair[1]]
-            if c == 1:
-                fp.write('%d\td\t%d\n' % (geneid1, geneid2))
-            else:
-                fp.write('%d\tu\t%d\n' % (geneid1, geneid2))
+        rows, cols, _, symmetric = self.G.subgraph(np.arange(len(nodes)))
+
+        # Undirected edges are written only once. Self-loops are written as
+        # directed edges, as before.
+        for i, j, is_symmetric in zip(rows, cols, symmetric):
+            if not is_symmetric or i == j:
+                fp.write('%d\td\t%d\n' % (geneids[i], geneids[j]))
+            elif i <= j:
+                fp.write('%d\tu\t%d\n' % (geneids[i], geneids[j]))
+
+
+def preload_networks(network_files):
+    """
+    Loads the networks (graphs and gene indexes) in advance, so that
+    open_network() does not need to read them for each query.
+    """
+
+    for network_file in network_files:
+        if network_file not in _preloaded_networks:
+            _preloaded_networks[network_file] = \
+                ITMProbeNetwork(network_file, True)
+
+
+def open_network(network_file, init_data=True):
+    """
+    Returns the network for network_file, using a copy of the preloaded
+    network if available. Otherwise, the network is read from disk; if
+    init_data is False, only its gene index is loaded.
+    """
+
+    if network_file in _preloaded_networks:
+        return _preloaded_networks[network_file].clone()
+    net = ITMProbeNetwork(network_file, init_data)
+    if not init_data:
+        net.open_genes()
+    return net
@@ -29,20 +29,30 @@
 
 import sys
 import os
+import time
 import gzip
 from cStringIO import StringIO
-import numpy as np
 from .. import exceptions as exc
 from .. import validators as vld
 from ..response import html_response
-from ...common.utils.filesys import makedirs2
+from ..response import make_etag
+from ..response import cached_response
+from ..jobs import JobQueue
+from ..storage import StorageManager
+from ...common.utils.filesys import check_file_exists
 from ...common.utils.pickling import check_object, restore_object
 from ...common.utils.jinjaenv import get_jinja_env
 from ...common.graphics import image_processors as imp
+from ...common.graphics.layout_store import LayoutStore
+from ...common.graph.csrgraph import read_binary_graph
 
 from .cvterm_analysis import form_input_options
 from .cvterm_analysis import enrich_query
+from .network import preload_networks
+from .network import open_network
 from ...ITMProbe import commands
+from ...ITMProbe import core
+from ...common.utils.newton import SQLiteRootHistory
 
 
 OUTPUT_FORMATS = ['html', 'txt', 'csv']
@@ -65,55 +75,213 @@ def _get_networks(conf):
     return networks
 
 
-def _get_layout_id(layout_args):
+def preload_data(conf):
     """
-    Get a hash value to represent a unique layout id per run.
+    Load all networks in advance (for long-running servers).
     """
-    # Extremely simple, fast; uses builtin hash
-    keys = sorted(layout_args.keys())
-    i = hash(tuple([layout_args[key] for key in keys]))
-    hash_val = long(np.uint32(i))
-    return '%X' % hash_val
 
+    preload_networks(sorted(_get_networks(conf).values()))
 
-def _get_storage_path(conf):
-    storage_path = os.path.join(conf.data_root, conf.ITMProbe_storage_dir)
-    makedirs2(storage_path)
-    return storage_path
 
+def _get_storage(conf):
+    return StorageManager(os.path.join(conf.data_root,
+                                       conf.ITMProbe_storage_dir))
 
-def run_www_model(cgi_map, conf):
 
-    www_model_class, _ = vld.find_input_option(cgi_map, 'model_type',\
-      dict( (M.html_value, M) for M in conf.ITMProbe_imported_models ))
+def _get_layout_store(conf):
+    store_path = os.path.join(conf.data_root, conf.ITMProbe_storage_dir,
+                              'layouts')
+    return LayoutStore(store_path,
+                       conf.ITMProbe_layout_store_entries,
+                       conf.ITMProbe_layout_store_max_delta)
+
+
+def _get_job_queue(conf):
+    spool_path = os.path.join(conf.data_root, conf.ITMProbe_storage_dir,
+                              'jobs')
+    return JobQueue(spool_path,
+                    conf.ITMProbe_job_workers,
+                    conf.ITMProbe_job_max_queued,
+                    conf.ITMProbe_job_max_per_user,
+                    conf.ITMProbe_job_state_max_age)
+
+
+def _use_df_history(conf):
+    """
+    Keep the history of damping factor searches on disk, so that it is
+    shared by all requests and jobs.
+    """
+
+    if conf.ITMProbe_df_history is None:
+        return
+    path = os.path.join(conf.data_root, conf.ITMProbe_df_history)
+    if getattr(core.df_history, 'path', None) != path:
+        core.set_df_history(SQLiteRootHistory(path))
 
-    storage_path = _get_storage_path(conf)
-    networks = _get_networks(conf)
+
+def _run_model_job(www_model_class, cgi_map, networks, storage,
+                   saddlesum_path, stored_only=False):
+    """
+    Run the model and return the data for the page linking to the results.
+    With stored_only, returns None unless an identical query has already
+    been computed.
+    """
 
     mdata = www_model_class()
 
-    rendering_url = mdata.run_model(cgi_map, networks, storage_path,
-                                    conf.saddlesum_path)
+    rendering_url = mdata.run_model(cgi_map, networks, storage,
+                                    saddlesum_path, stored_only)
+    if rendering_url is None:
+        return None
     _, output_tag = vld.find_input_option(cgi_map, 'output', \
                       dict(zip(OUTPUT_FORMATS, OUTPUT_FORMATS)), \
                       ('html', 'html'))
     rendering_url += '&output=%s' % output_tag
 
+    return {'rendering_url': rendering_url,
+            'query_id': mdata.query_id,
+            'warning_msgs': mdata.warning_msgs,
+            }
+
+
+def _results_response(result, conf):
+
     jinja_env = get_jinja_env(conf)
     tmpl = jinja_env.get_template('ITMProbe/results1.html')
 
-    res = tmpl.render(rendering_url=rendering_url,
-                      query_id = mdata.query_id,
-                      warning_msgs=mdata.warning_msgs)
+    res = tmpl.render(**result)
     html_response(res)
 
 
+def run_www_model(cgi_map, conf):
+
+    _use_df_history(conf)
+    www_model_class, _ = vld.find_input_option(cgi_map, 'model_type',\
+      dict( (M.html_value, M) for M in conf.ITMProbe_imported_models ))
+
+    storage = _get_storage(conf)
+    networks = _get_networks(conf)
+    args = (www_model_class, cgi_map, networks, storage,
+            conf.saddlesum_path)
+
+    # Long-running queries are submitted to the job queue and the client
+    # polls for the results. Queries already computed are answered at once.
+    if conf.ITMProbe_job_queue:
+        result = _run_model_job(www_model_class, dict(cgi_map), networks,
+                                storage, conf.saddlesum_path, True)
+        if result is not None:
+            _results_response(result, conf)
+            return
+        job_queue = _get_job_queue(conf)
+        job_id = job_queue.submit(_run_model_job, args,
+                                  os.environ.get('REMOTE_ADDR', ''))
+        _job_status_response(job_id, job_queue.status(job_id), conf)
+    else:
+        _results_response(_run_model_job(*args), conf)
+
+
+def _job_status_response(job_id, state, conf):
+
+    if state['state'] == 'done':
+        _results_response(state['result'], conf)
+    elif state['state'] == 'failed':
+        raise exc.JobFailed(state['error'])
+    else:
+        jinja_env = get_jinja_env(conf)
+        tmpl = jinja_env.get_template('ITMProbe/job_status.html')
+        status_url = 'ITMProbe.cgi?view=7&job_id=%s' % job_id
+        elapsed = time.time() - state.get('started', state['submitted'])
+        res = tmpl.render(status_url=status_url,
+                          job_id=job_id,
+                          job=state,
+                          elapsed=elapsed)
+        html_response(res)
+
+
+def job_status(cgi_map, conf):
+
+    job_id = vld.hash_validator('job_id', cgi_map.get('job_id', ''))
+    state = _get_job_queue(conf).status(job_id)
+    if state is None:
+        raise exc.MissingStoredResults()
+    _job_status_response(job_id, state, conf)
+
+
+def _run_fanout_job(www_model_class, cgi_map, networks, storage,
+                    num_processes, output_format):
+    """
+    Run the model on several networks and return the data for the page
+    linking to the report on the resulting bundle.
+    """
+
+    mdata = www_model_class()
+    mdata.run_fanout(cgi_map, networks, storage, num_processes)
+    rendering_url = 'ITMProbe.cgi?view=6&query_id=%s&output=%s' % \
+                    (mdata.query_id, output_format)
+    return {'rendering_url': rendering_url,
+            'query_id': mdata.query_id,
+            'warning_msgs': mdata.warning_msgs,
+            }
+
+
+def _fanout_report(bundle_path, output_format):
+
+    if output_format == 'txt':
+        sys.stdout.write("Content-Type: text/plain\n\n")
+        commands.report(bundle_path, 'txt')
+    else:
+        sys.stdout.write("Content-Type: text/csv\n")
+        sys.stdout.write("Content-Disposition: attachment; filename=itm_probe_results.csv\n\n")
+        commands.report(bundle_path, 'csv', max_rows=-1,
+                        use_participation_ratio=False)
+
+
+def fanout_www_model(cgi_map, conf):
+
+    _use_df_history(conf)
+    storage = _get_storage(conf)
+    output_format, _ = vld.find_input_option(cgi_map, 'output', \
+                      dict(txt='txt', csv='csv'), ('txt', 'txt'))
+
+    # Report on a bundle computed earlier (by a job)
+    if 'query_id' in cgi_map:
+        query_id = vld.hash_validator('query_id', cgi_map['query_id'])
+        bundle_path = os.path.join(storage.query_path(query_id, False),
+                                   '%s.itm' % query_id)
+        if not check_file_exists(bundle_path):
+            raise exc.MissingStoredResults()
+        storage.touch(query_id)
+        _fanout_report(bundle_path, output_format)
+        return
+
+    www_model_class, _ = vld.find_input_option(cgi_map, 'model_type',\
+      dict( (M.html_value, M) for M in conf.ITMProbe_imported_models ))
+    networks = _get_networks(conf)
+
+    # The networks are evaluated concurrently only by the job runner, which
+    # is a separate process. Within a request, they are evaluated one at a
+    # time rather than by a pool of processes forked from the server.
+    if conf.ITMProbe_job_queue:
+        args = (www_model_class, cgi_map, networks, storage,
+                conf.ITMProbe_fanout_processes, output_format)
+        job_queue = _get_job_queue(conf)
+        job_id = job_queue.submit(_run_fanout_job, args,
+                                  os.environ.get('REMOTE_ADDR', ''))
+        _job_status_response(job_id, job_queue.status(job_id), conf)
+    else:
+        mdata = www_model_class()
+        bundle_path = mdata.run_fanout(cgi_map, networks, storage, 1)
+        _fanout_report(bundle_path, output_format)
+
+
 def layout_www_model(cgi_map, conf):
 
-    storage_path = _get_storage_path(conf)
+    storage = _get_storage(conf)
     query_id = vld.hash_validator('query_id', cgi_map['query_id'])
-    if check_object(storage_path, '%s' % query_id):
-        mdata = restore_object(storage_path, query_id)
+    query_path = storage.query_path(query_id, False)
+    if check_object(query_path, '%s' % query_id):
+        mdata = restore_object(query_path, query_id)
+        storage.touch(query_id)
     else:
         raise exc.MissingStoredResults()
 
@@ -124,34 +292,47 @@ def layout_www_model(cgi_map, conf):
     if output_format == 'txt':
 
         layout_args = mdata.display_options.validate_display_args(cgi_map)
-        sys.stdout.write("Content-Type: text/plain\n\n")
-        commands.report(mdata.itm_path, 'txt',
-                        max_rows= layout_args['max_rows'],
-                        order_by= layout_args['order_by'],
-                        use_participation_ratio=layout_args['use_participation_ratio'],
-                        cutoff_value=layout_args['cutoff_value']
-                        )
+
+        def _write_report(fp):
+            commands.report(mdata.itm_path, 'txt',
+                            max_rows= layout_args['max_rows'],
+                            order_by= layout_args['order_by'],
+                            use_participation_ratio=layout_args['use_participation_ratio'],
+                            cutoff_value=layout_args['cutoff_value'],
+                            fp=fp)
+
+        etag = make_etag('report', query_id, output_format,
+                         sorted(layout_args.items()))
+        cached_response([('Content-Type', 'text/plain')], etag, _write_report,
+                        compress=True)
 
     elif output_format == 'csv':
 
-        sys.stdout.write("Content-Type: text/csv\n")
-        sys.stdout.write("Content-Disposition: attachment; filename=itm_probe_results.csv\n\n")
-        commands.report(mdata.itm_path, 'csv', max_rows=-1,
-                        use_participation_ratio=False)
+        def _write_report(fp):
+            commands.report(mdata.itm_path, 'csv', max_rows=-1,
+                            use_participation_ratio=False, fp=fp)
+
+        etag = make_etag('report', query_id, output_format)
+        cached_response([('Content-Type', 'text/csv'),
+                         ('Content-Disposition',
+                          'attachment; filename=itm_probe_results.csv')],
+                        etag, _write_report, compress=True)
 
     elif output_format == 'html':
 
         layout_args = mdata.display_options.validate_display_args(cgi_map)
-        layout_id = _get_layout_id(layout_args)
-        layout_filename = '%s_%s' % (query_id, layout_id)
-
-        if not check_object(storage_path, layout_filename):
-            layout_path = os.path.join(storage_path, layout_filename + '.pkl')
-            commands.layout(layout_path,
-                            [mdata.itm_path],
-                            os.path.join(conf.graphviz_path, 'neato'),
-                            **layout_args)
-
+        # Single-network results are laid out on the (preloaded) network
+        # graph rather than on a copy reloaded from disk
+        G = None
+        if getattr(mdata, 'network_file', None) is not None:
+            G = open_network(mdata.network_file).G
+        layout_id = commands.layout(None,
+                                    [mdata.itm_path],
+                                    os.path.join(conf.graphviz_path, 'neato'),
+                                    layout_store=_get_layout_store(conf),
+                                    layout_engine=conf.ITMProbe_layout_engine,
+                                    G=G,
+                                    **layout_args)
 
         tables = mdata.report_tables(layout_args)
         img_spec = mdata.display_options.image_spec(cgi_map, query_id, layout_id)
@@ -173,39 +354,81 @@ def layout_www_model(cgi_map, conf):
 
 def render_image(cgi_map, conf):
 
-    storage_path = _get_storage_path(conf)
+    storage = _get_storage(conf)
     query_id = vld.hash_validator('query_id', cgi_map['query_id'])
+    query_path = storage.query_path(query_id, False)
     layout_id = vld.hash_validator('layout_id', cgi_map['layout_id'])
-    layout_file = '%s_%s.pkl' % (query_id, layout_id)
-    layout_path = os.path.join(storage_path, layout_file)
+    layout_store = _get_layout_store(conf)
+    if not layout_store.has_layout(layout_id):
+        raise exc.MissingStoredResults()
+    layout_path = layout_store.layout_path(layout_id)
 
-    mdata = restore_object(storage_path, query_id)
+    if not check_object(query_path, '%s' % query_id):
+        raise exc.MissingStoredResults()
+    mdata = restore_object(query_path, query_id)
     kwargs =  mdata.display_options.validate_display_args(cgi_map)
     kwargs.update(mdata.display_options.validate_rendering_args(cgi_map))
     kwargs.pop('neato_seed')
     kwargs.pop('neato_options')
-    kwargs['out_format'] = cgi_map['image_format']
-    kwargs['write_http_header'] = True
+    img_proc, image_format = vld.find_input_option(cgi_map, 'image_format',
+                                                   imp.IMG_PROC_MAP)
+    kwargs['out_format'] = image_format
+
+    # Images are determined by the query, layout and rendering options, so
+    # they are cached both by clients (ETag) and on the server, together
+    # with the results of the query
+    etag = make_etag('image', query_id, layout_id, sorted(kwargs.items()))
+    cache_path = os.path.join(query_path, 'img_%s.%s' % (etag.strip('"'),
+                                                         image_format))
+    cached = check_file_exists(cache_path)
+    def _write_image(fp):
+        commands.image(fp, layout_path, [mdata.itm_path], **kwargs)
+
+    cached_response(img_proc.http_headers, etag, _write_image, cache_path,
+                    img_proc.compressible)
+    if cached:
+        storage.touch(query_id)
+    else:
+        storage.register(query_id)
+
 
-    commands.image('-', layout_path, [mdata.itm_path], **kwargs)
+def _gzip_upload(upload):
+
+    if isinstance(upload, basestring):
+        upload = StringIO(upload)
+    return gzip.GzipFile(mode='rb', fileobj=upload)
 
 
 def standalone_run(cgi_map, conf):
 
+    # The uploaded input is decompressed and parsed as it is read. The graph
+    # can be uploaded separately (graph_data) in the binary graph format. The
+    # results are compressed and written out table by table.
+    _use_df_history(conf)
     try:
-        json_gz_file = StringIO(cgi_map['input_data'])
-        results_gz_file = StringIO()
-        input_fp = gzip.GzipFile(fileobj=json_gz_file)
-        output_fp = gzip.GzipFile(fileobj=results_gz_file, mode='wb')
-        commands.standalone_run(input_fp, output_fp)
-        input_fp.close()
-        output_fp.close()
-        sys.stdout.write("Content-Type: application/x-gzip\n\n")
-        sys.stdout.write(results_gz_file.getvalue())
-
+        G = None
+        if 'graph_data' in cgi_map:
+            with _gzip_upload(cgi_map['graph_data']) as graph_fp:
+                G = read_binary_graph(graph_fp)
+        with _gzip_upload(cgi_map['input_data']) as input_fp:
+            conn = commands.standalone_model(input_fp, G=G)
     except:
         sys.stdout.write("Content-Type: text/plain\n\n")
         sys.stdout.write('UNRECOVERABLE ERROR\n')
+        return
+
+    sys.stdout.write("Content-Type: application/x-gzip\n\n")
+    output_fp = gzip.GzipFile(filename='', mode='wb', fileobj=sys.stdout)
+    try:
+        commands.standalone_report(conn, output_fp)
+    except:
+        # The headers have been sent. Without the gzip trailer, the client
+        # sees that the results are incomplete, so the output is detached
+        # before closing.
+        output_fp.fileobj = None
+    finally:
+        conn.close()
+        output_fp.close()
 
 
 VIEWS = {'0': run_www_model,
@@ -213,6 +436,8 @@ VIEWS = {'0': run_www_model,
          '2': render_image,
          '4': enrich_query,
          '5': standalone_run,
+         '6': fanout_www_model,
+         '7': job_status,
          }
 
 
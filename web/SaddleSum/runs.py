@@ -28,12 +28,14 @@
 
 import sys
 import os.path
-from ...common.utils.filesys import makedirs2
 from ...common.utils.filesys import check_file_exists
 from .. import validators as vld
 from .. import exceptions as exc
 from ..response import html_response
 from ..response import plain_response
+from ..response import make_etag
+from ..response import cached_response
+from ..storage import StorageManager
 from .validate import validate_program_args
 from .validate import validate_output_args
 from .validate import validate_term_scores_args
@@ -48,10 +50,9 @@ from .svgoutput import create_and_save_image
 from .etdinfo import get_etd_info
 
 
-def _get_storage_path(conf):
-    storage_path = os.path.join(conf.data_root, conf.enrich_storage_dir)
-    makedirs2(storage_path)
-    return storage_path
+def _get_storage(conf):
+    return StorageManager(os.path.join(conf.data_root,
+                                       conf.enrich_storage_dir))
 
 
 def process_cgi_query(cgi_map, conf):
@@ -59,10 +60,11 @@ def process_cgi_query(cgi_map, conf):
     opts, raw_weights, termdb_file = validate_program_args(cgi_map, conf)
     out_fmt, query_id, img_format, colormap = validate_output_args(cgi_map)
 
-    storage_path = _get_storage_path(conf)
-    graphics_file = os.path.join(storage_path, '%s.svg' % query_id)
-    weights_file = os.path.join(storage_path, '%s.dat' % query_id)
-    command_file = os.path.join(storage_path, '%s.cmd' % query_id)
+    storage = _get_storage(conf)
+    query_path = storage.query_path(query_id)
+    graphics_file = os.path.join(query_path, '%s.svg' % query_id)
+    weights_file = os.path.join(query_path, '%s.dat' % query_id)
+    command_file = os.path.join(query_path, '%s.cmd' % query_id)
 
     if out_fmt == 'txt':
         output, full_args = get_saddlesum_results(opts, raw_weights,
@@ -87,19 +89,31 @@ def process_cgi_query(cgi_map, conf):
         html_response(res)
 
     save_query_data(raw_weights, full_args, weights_file, command_file)
+    storage.register(query_id)
 
 
 def get_svg_image(cgi_map, conf):
 
     query_id = vld.hash_validator('query_id', cgi_map['query_id'])
     image_filename = '%s.svg' % query_id
-    storage_path = _get_storage_path(conf)
-    image_path = os.path.join(storage_path, image_filename)
-
-    sys.stdout.write("Content-Type: image/svg+xml\n\n")
-    if check_file_exists(image_path):
-        with open(image_path, 'rb') as fp:
-            sys.stdout.write(fp.read())
+    storage = _get_storage(conf)
+    image_path = os.path.join(storage.query_path(query_id, False),
+                              image_filename)
+
+    if not check_file_exists(image_path):
+        sys.stdout.write("Content-Type: image/svg+xml\n\n")
+        return
+    storage.touch(query_id)
+
+    def _write_image(fp):
+        with open(image_path, 'rb') as image_fp:
+            fp.write(image_fp.read())
+
+    image_stat = os.stat(image_path)
+    etag = make_etag('enrich-image', query_id, image_stat.st_size,
+                     image_stat.st_mtime)
+    cached_response([('Content-Type', 'image/svg+xml')], etag, _write_image,
+                    compress=True)
 
 
 def get_term_scores(cgi_map, conf):
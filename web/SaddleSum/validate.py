@@ -29,6 +29,7 @@ import os
 import time
 from .. import validators as vld
 from .. import exceptions as exc
+from ..storage import StorageManager
 from ...common.utils.filesys import check_file_exists
 
 _NUM_COLORS = 8
@@ -159,9 +160,11 @@ def validate_output_args(cgi_map):
 def validate_term_scores_args(cgi_map, conf):
 
     query_id = vld.hash_validator('query_id', cgi_map['query_id'])
-    storage_path = os.path.join(conf.data_root, conf.enrich_storage_dir)
-    weights_file = os.path.join(storage_path, '%s.dat' % query_id)
-    command_file = os.path.join(storage_path, '%s.cmd' % query_id)
+    storage = StorageManager(os.path.join(conf.data_root,
+                                          conf.enrich_storage_dir))
+    query_path = storage.query_path(query_id, False)
+    weights_file = os.path.join(query_path, '%s.dat' % query_id)
+    command_file = os.path.join(query_path, '%s.cmd' % query_id)
 
     # NOTE: this is safe against shell injection because we will be using
     # subprocess.popen, which does ever call shell
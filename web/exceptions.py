@@ -156,3 +156,25 @@ class CutoffError(WebException):
 
     def __str__(self):
         return "A cutoff must be specified when using Fisher's Exact Test."
+
+class ServerBusy(WebException):
+
+    def __str__(self):
+        return "The server is too busy at the moment. Please try again later."
+
+class TooManyJobs(WebException):
+    def __init__(self, max_jobs):
+        WebException.__init__(self)
+        self.max_jobs = max_jobs
+
+    def __str__(self):
+        return "Too many queries submitted (at most %d may run at once). " \
+               "Please wait for the previous queries to finish." % self.max_jobs
+
+class JobFailed(WebException):
+    def __init__(self, msg):
+        WebException.__init__(self)
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
@@ -0,0 +1,347 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+A local queue for running models outside of HTTP requests.
+
+Jobs are kept in a spool directory: the pickled request of each waiting job
+is in queued/, and it is moved into running/ (atomically, by rename) by the
+process that runs it. The state of each job (including the progress
+reported by the model) is stored as a small JSON file, which is read by the
+polling views.
+
+There is no separate daemon. Submitting a job starts a detached runner
+process, which takes one of max_workers worker slots (lock files) and
+runs queued jobs until there are none left. If all slots are taken, the
+runner exits immediately and the job is picked up by a running one.
+
+Submissions are serialized by a lock file, so that the limits on the number
+of jobs hold for concurrent requests. The state files of finished jobs are
+removed once they are older than state_max_age.
+"""
+
+import os
+import sys
+import time
+import fcntl
+import traceback
+import numpy as np
+from . import exceptions as exc
+from ..common.utils.filesys import makedirs2
+from ..common.utils.filesys import file_lock
+from ..common.utils.pickling import save_object
+from ..common.utils.pickling import restore_object
+from ..common.utils.dataobj import save_data_object
+from ..common.utils.dataobj import restore_data_object
+from ..ITMProbe.core import set_progress_callback
+
+
+class JobQueue(object):
+    """
+    Job queue in the directory spool_path. At most max_workers jobs run at
+    once and at most max_queued jobs may be waiting or running; each user
+    (identified by a string, e.g. the client address) may have at most
+    max_per_user such jobs. The state of finished jobs is kept for
+    state_max_age seconds.
+    """
+
+    # Minimum interval between writes of progress to the state file
+    progress_interval = 0.5
+
+    def __init__(self, spool_path, max_workers=2, max_queued=20,
+                 max_per_user=2, state_max_age=86400.0):
+
+        self.spool_path = spool_path
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.state_max_age = state_max_age
+
+        self.queued_path = os.path.join(spool_path, 'queued')
+        self.running_path = os.path.join(spool_path, 'running')
+        for path in (self.queued_path, self.running_path):
+            makedirs2(path)
+        self._last_progress = (None, 0.0)
+
+    @staticmethod
+    def new_job_id():
+        """
+        Create a unique job identifier (in the same format as query ids).
+        """
+        hash_val = long(np.uint32(hash((time.time(), os.getpid()))))
+        return '%X' % hash_val
+
+    def _state_file(self, job_id):
+        return os.path.join(self.spool_path, '%s.json' % job_id)
+
+    def _active_jobs(self, path):
+        """ Job ids and users of the jobs with requests in path. """
+
+        jobs = []
+        for filename in os.listdir(path):
+            job_id, ext = os.path.splitext(filename)
+            if ext != '.pkl':
+                continue
+            state = self.status(job_id)
+            if state is not None:
+                jobs.append((job_id, state['user']))
+        return jobs
+
+    def submit(self, func, args, user=''):
+        """
+        Queue the evaluation of func(*args) and return the job id. The
+        function and its arguments must be picklable. Raises ServerBusy or
+        TooManyJobs if the job is not admitted.
+        """
+
+        with file_lock(os.path.join(self.spool_path, 'submit.lock')):
+            self.expire(self.state_max_age)
+            active = self._active_jobs(self.queued_path) + \
+                     self._active_jobs(self.running_path)
+            if len(active) >= self.max_queued:
+                raise exc.ServerBusy()
+            if sum(1 for _, u in active if u == user) >= self.max_per_user:
+                raise exc.TooManyJobs(self.max_per_user)
+
+            job_id = self.new_job_id()
+            while os.path.exists(self._state_file(job_id)):
+                job_id = self.new_job_id()
+
+            self._write_state(job_id, {'job_id': job_id,
+                                       'user': user,
+                                       'state': 'queued',
+                                       'stage': 'Waiting in queue',
+                                       'submitted': time.time(),
+                                       })
+            # Write under a temporary name so that runners never see a
+            # partial request
+            tmp_name = '%s.tmp' % job_id
+            save_object((func, args), self.queued_path, tmp_name, '')
+            os.rename(os.path.join(self.queued_path, tmp_name),
+                      os.path.join(self.queued_path, '%s.pkl' % job_id))
+
+            # The runner closes its copy of the lock before running jobs
+            self._spawn_runner()
+        return job_id
+
+    def expire(self, max_age):
+        """
+        Remove the state files of the jobs that finished more than max_age
+        seconds ago, as well as those of the jobs whose requests are gone
+        (e.g. after a crash) and that were not updated for max_age seconds.
+        Returns the number of files removed and their size.
+        """
+
+        cutoff_time = time.time() - max_age
+        active = set(job_id for job_id, _ in \
+                     self._active_jobs(self.queued_path) + \
+                     self._active_jobs(self.running_path))
+        removed_count = removed_size = 0
+        for filename in os.listdir(self.spool_path):
+            job_id, ext = os.path.splitext(filename)
+            if ext != '.json' or job_id in active:
+                continue
+            path = os.path.join(self.spool_path, filename)
+            state = self.status(job_id)
+            try:
+                file_stat = os.stat(path)
+                if state is not None and 'finished' in state:
+                    last_time = state['finished']
+                else:
+                    last_time = file_stat.st_mtime
+                if last_time < cutoff_time:
+                    os.remove(path)
+                    removed_count += 1
+                    removed_size += file_stat.st_size
+            except OSError:
+                # Removed concurrently
+                continue
+        return removed_count, removed_size
+
+    def total_size(self):
+        """ Total size of the files in the spool directory. """
+
+        size = 0
+        for path in (self.spool_path, self.queued_path, self.running_path):
+            for filename in os.listdir(path):
+                file_path = os.path.join(path, filename)
+                if os.path.isfile(file_path):
+                    size += os.path.getsize(file_path)
+        return size
+
+    def status(self, job_id):
+        """
+        Returns the state dictionary of the job (None if there is no such
+        job). The 'state' entry is one of 'queued', 'running', 'done' and
+        'failed'; 'stage' and 'progress' (a dictionary) describe the
+        progress, while 'result' and 'error' are set for finished and failed
+        jobs, respectively.
+        """
+
+        try:
+            return restore_data_object(self._state_file(job_id))
+        except (IOError, ValueError):
+            return None
+
+    def _write_state(self, job_id, state):
+
+        tmp_file = self._state_file(job_id) + '.tmp%d' % os.getpid()
+        save_data_object(state, tmp_file)
+        os.rename(tmp_file, self._state_file(job_id))
+
+    def update(self, job_id, **kwargs):
+        """ Update the state of a job. """
+
+        state = self.status(job_id)
+        if state is None:
+            return
+        state.update(kwargs)
+        self._write_state(job_id, state)
+
+    def _spawn_runner(self):
+        """
+        Start a detached runner process (double fork, so that it is not
+        left as a zombie of the submitting process).
+        """
+
+        pid = os.fork()
+        if pid > 0:
+            os.waitpid(pid, 0)
+            return
+
+        try:
+            os.setsid()
+            if os.fork() > 0:
+                os._exit(0)
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            os.closerange(3, 1024)
+            self.run_pending()
+        finally:
+            os._exit(0)
+
+    def _acquire_slot(self):
+        """ Lock one of the worker slots; returns the locked file or None. """
+
+        for i in xrange(self.max_workers):
+            fp = open(os.path.join(self.spool_path, 'worker%d.lock' % i), 'a')
+            try:
+                fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fp
+            except IOError:
+                fp.close()
+        return None
+
+    def _claim_job(self):
+        """
+        Move the oldest queued job whose user has fewer than max_per_user
+        running jobs into running/. Returns its job id or None.
+        """
+
+        running_users = [u for _, u in self._active_jobs(self.running_path)]
+        queued = []
+        for filename in os.listdir(self.queued_path):
+            job_id, ext = os.path.splitext(filename)
+            if ext != '.pkl':
+                continue
+            state = self.status(job_id)
+            if state is not None:
+                queued.append((state['submitted'], job_id, state['user']))
+        queued.sort()
+
+        for _, job_id, user in queued:
+            if running_users.count(user) >= self.max_per_user:
+                continue
+            try:
+                os.rename(os.path.join(self.queued_path, '%s.pkl' % job_id),
+                          os.path.join(self.running_path, '%s.pkl' % job_id))
+                return job_id
+            except OSError:
+                # Claimed by another runner
+                continue
+        return None
+
+    def run_pending(self):
+        """ Run queued jobs while a worker slot is available. """
+
+        while True:
+            slot = self._acquire_slot()
+            if slot is None:
+                return
+            num_run = 0
+            try:
+                job_id = self._claim_job()
+                while job_id is not None:
+                    self._run_job(job_id)
+                    num_run += 1
+                    job_id = self._claim_job()
+            finally:
+                slot.close()
+            # A job submitted while the slot was held may have found no free
+            # slot for its own runner. The jobs that could not be claimed
+            # (due to per-user limits) are left to the runners of the
+            # running jobs.
+            if num_run == 0 or not any(f.endswith('.pkl') for f in
+                                       os.listdir(self.queued_path)):
+                return
+
+    def _report_progress(self, job_id, stage, **info):
+
+        # Changes of stage are always written, while the updates within a
+        # stage are throttled.
+        now = time.time()
+        last_stage, last_time = self._last_progress
+        if stage == last_stage and now - last_time < self.progress_interval:
+            return
+        self._last_progress = (stage, now)
+        self.update(job_id, stage=stage, progress=info)
+
+    def _run_job(self, job_id):
+
+        request_file = os.path.join(self.running_path, '%s.pkl' % job_id)
+        self.update(job_id, state='running', stage='Starting', progress={},
+                    started=time.time())
+        set_progress_callback(lambda stage, **info: \
+                              self._report_progress(job_id, stage, **info))
+        try:
+            func, args = restore_object(self.running_path, job_id)
+            result = func(*args)
+            self.update(job_id, state='done', stage='Finished',
+                        finished=time.time(), result=result)
+        except exc.WebException, e:
+            self.update(job_id, state='failed', finished=time.time(),
+                        error=str(e))
+        except Exception:
+            sys.stderr.write(traceback.format_exc())
+            self.update(job_id, state='failed', finished=time.time(),
+                        error=str(exc.WebException()))
+        finally:
+            set_progress_callback(None)
+            os.remove(request_file)
@@ -26,14 +26,126 @@
 # Code author:  Aleksandar Stojmirovic
 #
 import sys
+import os
+import gzip
+import hashlib
+from cStringIO import StringIO
+from .. import version
 
+# Clients may keep responses with ETags this many seconds without asking
+CACHE_MAX_AGE = 3600
 
-def html_response(data, fp=sys.stdout):
 
+def make_etag(*parts):
+    """
+    Strong entity tag derived from the identifiers (query, layout,
+    rendering options...) that fully determine a response body. The
+    software version is always included, since the body may change with
+    it.
+    """
+
+    sha1 = hashlib.sha1()
+    for part in parts + (version.CURRENT_VERSION, ):
+        sha1.update(repr(part))
+    return '"%s"' % sha1.hexdigest()[:24]
+
+
+def _request_matches(etag):
+    """ Checks the If-None-Match header of the current request """
+
+    header = os.environ.get('HTTP_IF_NONE_MATCH', '')
+    tags = [tag.strip() for tag in header.split(',')]
+    return etag in tags or '*' in tags
+
+
+def _accepts_gzip():
+
+    header = os.environ.get('HTTP_ACCEPT_ENCODING', '')
+    for coding in header.split(','):
+        fields = coding.strip().split(';')
+        if fields[0].strip() in ('gzip', 'x-gzip'):
+            q = fields[1].strip() if len(fields) > 1 else 'q=1'
+            return q not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def cached_response(headers, etag, write_body, cache_path=None,
+                    compress=False, fp=None):
+    """
+    Write a response whose body is fully determined by etag.
+
+    Answers with 304 Not Modified if the client already has the body.
+    Otherwise the body is produced by write_body(file_object) and
+    streamed after the headers, gzip-encoded when compress is True and
+    the client accepts it. If cache_path is given, the body is read from
+    there when present and saved there otherwise.
+    The encoded body is a different representation, so its entity tag
+    gets the suffix -gz. headers is a list of (name, value) pairs,
+    including Content-Type.
+    """
+
+    if fp is None:
+        fp = sys.stdout
+    use_gzip = compress and _accepts_gzip()
+    if use_gzip:
+        etag = '%s-gz"' % etag[:-1]
+    cache_headers = [('ETag', etag),
+                     ('Cache-Control', 'private, max-age=%d' % CACHE_MAX_AGE)]
+    if compress:
+        cache_headers.append(('Vary', 'Accept-Encoding'))
+
+    if _request_matches(etag):
+        fp.write('Status: 304 Not Modified\n')
+        for item in cache_headers:
+            fp.write('%s: %s\n' % item)
+        fp.write('\n')
+        return
+
+    if cache_path is not None:
+        # Cached bodies are kept identity-encoded, so they are buffered in
+        # full rather than streamed
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as cache_fp:
+                data = cache_fp.read()
+        else:
+            buf = StringIO()
+            write_body(buf)
+            data = buf.getvalue()
+            # Write under a temporary name so that concurrent readers never
+            # see a partial file
+            tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+            with open(tmp_path, 'wb') as cache_fp:
+                cache_fp.write(data)
+            os.rename(tmp_path, cache_path)
+        write_body = lambda body_fp: body_fp.write(data)
+
+    if use_gzip:
+        cache_headers.append(('Content-Encoding', 'gzip'))
+    for item in list(headers) + cache_headers:
+        fp.write('%s: %s\n' % item)
+    fp.write('\n')
+
+    # The body is streamed after the headers, compressed on the way if
+    # needed. Closing the gzip stream writes its trailer but leaves fp open.
+    if use_gzip:
+        gz_fp = gzip.GzipFile(filename='', mode='wb', compresslevel=6,
+                              fileobj=fp, mtime=0)
+        write_body(gz_fp)
+        gz_fp.close()
+    else:
+        write_body(fp)
+
+
+def html_response(data, fp=None):
+
+    if fp is None:
+        fp = sys.stdout
     fp.write("Content-Type: text/html\n\n")
     fp.write(data)
 
-def plain_response(data, fp=sys.stdout):
+def plain_response(data, fp=None):
 
+    if fp is None:
+        fp = sys.stdout
     fp.write("Content-Type: text/plain\n\n")
     fp.write(data)
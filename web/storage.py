@@ -0,0 +1,331 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+
+"""
+Storage of query results.
+
+All files belonging to a query (e.g. the .itm and .pkl files of an ITM Probe
+query, or the .svg, .dat and .cmd files of a SaddleSum query) are kept in
+the directory <shard>/<query_id> below the top storage directory, where the
+shard consists of the first characters of the query id. This keeps all
+directories small.
+
+A SQLite index in the top directory records the size and the time of last
+access of each stored file together with its query. Old queries are removed
+and the disk quota is enforced (least recently used queries first) from the
+index, without scanning the storage directory. Queries are always removed
+as a whole.
+
+The storage directory may also hold the job queue spool (jobs/) and the
+layout store (layouts/). These keep their own indexes, so they are not
+included in the storage index, but they are expired in the same pass and
+their size counts toward the quota.
+"""
+
+import os
+import time
+import errno
+import fcntl
+import sqlite3
+from contextlib import contextmanager
+from ..common.utils.filesys import makedirs2
+from ..common.graphics.layout_store import LayoutStore
+from .jobs import JobQueue
+
+
+INDEX_FILE = 'storage.db'
+SHARD_LENGTH = 2
+
+# Subdirectories with their own indexes and expiry
+STORES = {'jobs': JobQueue,
+          'layouts': LayoutStore,
+          }
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    query_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    atime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_query ON artifacts (query_id);
+"""
+
+
+def _remove_file(path):
+    """ Removes a file; returns its size (0 if it did not exist). """
+
+    try:
+        size = os.stat(path).st_size
+        os.remove(path)
+        return size
+    except OSError, excpt:
+        if excpt.errno != errno.ENOENT:
+            raise
+    return 0
+
+
+class StorageManager(object):
+    """
+    Manager of the query storage under top_dir. Instances hold no open
+    files or connections, so they can be passed to jobs.
+    """
+
+    # Number of queries removed in a single index transaction
+    batch_size = 500
+
+    def __init__(self, top_dir, timeout=30.0):
+
+        self.top_dir = top_dir
+        self.timeout = timeout
+        self.index_path = os.path.join(top_dir, INDEX_FILE)
+        makedirs2(top_dir)
+        with self._index() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _index(self):
+        """ Connection to the index, committed at the end of the block. """
+
+        conn = sqlite3.connect(self.index_path, self.timeout)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def query_path(self, query_id, create=True):
+        """
+        Directory holding the files of query_id, created unless create is
+        False.
+        """
+
+        if not query_id or os.sep in query_id or query_id.startswith('.'):
+            raise ValueError('Invalid query id %r' % query_id)
+        path = os.path.join(self.top_dir, query_id[:SHARD_LENGTH], query_id)
+        if create:
+            makedirs2(path)
+        return path
+
+    def register(self, query_id):
+        """
+        Index all files of query_id, marking them as accessed now. Should be
+        called whenever files are added to the query directory.
+        """
+
+        query_path = self.query_path(query_id, False)
+        now = time.time()
+        rows = []
+        for filename in os.listdir(query_path):
+            if os.path.splitext(filename)[1] == '.lock':
+                continue
+            path = os.path.join(query_path, filename)
+            rows.append((os.path.relpath(path, self.top_dir), query_id,
+                         os.stat(path).st_size, now))
+        with self._index() as conn:
+            conn.execute('DELETE FROM artifacts WHERE query_id = ?',
+                         (query_id,))
+            conn.executemany('INSERT OR REPLACE INTO artifacts '
+                             'VALUES (?, ?, ?, ?)', rows)
+
+    def touch(self, query_id):
+        """ Mark the files of query_id as accessed now. """
+
+        with self._index() as conn:
+            conn.execute('UPDATE artifacts SET atime = ? WHERE query_id = ?',
+                         (time.time(), query_id))
+
+    def total_size(self):
+        """ Total size of all indexed files. """
+
+        with self._index() as conn:
+            size, = conn.execute('SELECT SUM(size) FROM artifacts').fetchone()
+        return size or 0
+
+    def _least_recent_queries(self):
+        """ Query ids with their size and last access, oldest first. """
+
+        with self._index() as conn:
+            return conn.execute('SELECT query_id, SUM(size), MAX(atime) '
+                                'FROM artifacts GROUP BY query_id '
+                                'ORDER BY MAX(atime)').fetchall()
+
+    def _remove_query(self, query_id, paths):
+        """
+        Remove the indexed files (paths) of query_id together with its
+        directory. Queries locked by a running model are left alone and
+        False is returned.
+        """
+
+        query_path = self.query_path(query_id, False)
+        lock_path = os.path.join(query_path, '%s.lock' % query_id)
+        try:
+            lock_fp = open(lock_path, 'r')
+        except IOError:
+            lock_fp = None
+        try:
+            if lock_fp is not None:
+                try:
+                    fcntl.flock(lock_fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError:
+                    return False
+            for path in paths:
+                _remove_file(os.path.join(self.top_dir, path))
+            if os.path.isdir(query_path):
+                for filename in os.listdir(query_path):
+                    _remove_file(os.path.join(query_path, filename))
+                os.rmdir(query_path)
+        finally:
+            if lock_fp is not None:
+                lock_fp.close()
+        return True
+
+    def discard(self, query_id):
+        """
+        Remove the files of query_id if it was never registered (e.g. after
+        a failed computation), since cleaning works only from the index.
+        Queries that are indexed or locked by a running model are left
+        alone. Returns True if the query was removed.
+        """
+
+        with self._index() as conn:
+            num_files, = conn.execute('SELECT count(*) FROM artifacts '
+                                      'WHERE query_id = ?',
+                                      (query_id,)).fetchone()
+        if num_files or not os.path.isdir(self.query_path(query_id, False)):
+            return False
+        return self._remove_query(query_id, [])
+
+    def remove_queries(self, query_ids):
+        """
+        Remove all files of query_ids, batch_size queries per index
+        transaction. Returns the number of files removed and their size.
+        """
+
+        removed_count = removed_size = 0
+        for i in xrange(0, len(query_ids), self.batch_size):
+            batch = query_ids[i:i+self.batch_size]
+            marks = ','.join('?' * len(batch))
+            with self._index() as conn:
+                rows = conn.execute('SELECT query_id, path, size '
+                                    'FROM artifacts WHERE query_id IN (%s)'
+                                    % marks, batch).fetchall()
+            query_paths = dict((query_id, []) for query_id in batch)
+            query_sizes = dict((query_id, 0) for query_id in batch)
+            for query_id, path, size in rows:
+                query_paths[query_id].append(path)
+                query_sizes[query_id] += size
+
+            removed = [query_id for query_id in batch \
+                       if self._remove_query(query_id, query_paths[query_id])]
+            with self._index() as conn:
+                conn.executemany('DELETE FROM artifacts WHERE query_id = ?',
+                                 ((query_id,) for query_id in removed))
+            removed_count += sum(len(query_paths[q]) for q in removed)
+            removed_size += sum(query_sizes[q] for q in removed)
+        return removed_count, removed_size
+
+    def _stores(self):
+        """ The job queue and layout store present in the top directory. """
+
+        stores = []
+        for name in sorted(STORES):
+            path = os.path.join(self.top_dir, name)
+            if os.path.isdir(path):
+                stores.append(STORES[name](path))
+        return stores
+
+    def clean(self, max_age=None, quota=None):
+        """
+        Remove the queries not accessed in the last max_age seconds and then,
+        if the stored files take more than quota bytes, the least recently
+        used queries until they fit. Old jobs and layouts are expired in the
+        same pass, and the remaining ones count toward the quota. Returns
+        the number of files removed and their size.
+        """
+
+        stores = self._stores()
+        removed_count = removed_size = 0
+        if max_age is not None:
+            for store in stores:
+                count, size = store.expire(max_age)
+                removed_count += count
+                removed_size += size
+
+        queries = self._least_recent_queries()
+        total_size = sum(size for _, size, _ in queries) + \
+                     sum(store.total_size() for store in stores)
+        cutoff_time = None if max_age is None else time.time() - max_age
+
+        expired = []
+        for query_id, size, atime in queries:
+            if (cutoff_time is None or atime >= cutoff_time) and \
+               (quota is None or total_size <= quota):
+                break
+            expired.append(query_id)
+            total_size -= size
+        count, size = self.remove_queries(expired)
+        return removed_count + count, removed_size + size
+
+    def rebuild(self):
+        """
+        Re-create the index from the files in the storage directory, with
+        their actual access times. Files left in the top directory by
+        earlier versions (not sharded) are indexed under the query id given
+        by their name, so that they are eventually removed. The job queue
+        and layout store are not indexed (see clean()).
+        """
+
+        rows = []
+        for name in os.listdir(self.top_dir):
+            path = os.path.join(self.top_dir, name)
+            if name.startswith('.') or name in STORES:
+                continue
+            elif os.path.isfile(path):
+                if not name.startswith(INDEX_FILE):
+                    query_id = name.split('.', 1)[0]
+                    rows.append((name, query_id, os.stat(path)))
+            elif len(name) == SHARD_LENGTH and os.path.isdir(path):
+                for query_id in os.listdir(path):
+                    query_path = os.path.join(path, query_id)
+                    if not os.path.isdir(query_path):
+                        continue
+                    for filename in os.listdir(query_path):
+                        if os.path.splitext(filename)[1] == '.lock':
+                            continue
+                        file_path = os.path.join(query_path, filename)
+                        rows.append((os.path.relpath(file_path, self.top_dir),
+                                     query_id, os.stat(file_path)))
+
+        with self._index() as conn:
+            conn.execute('DELETE FROM artifacts')
+            conn.executemany('INSERT INTO artifacts VALUES (?, ?, ?, ?)',
+                             ((path, query_id, st.st_size, st.st_atime) \
+                              for path, query_id, st in rows))
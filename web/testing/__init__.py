@@ -0,0 +1,60 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+"""
+Tests of the web interface that do not need networks or a web server.
+
+The tests (test_*.py) are plain unittest modules, run together with those of
+ITM Probe (see qmbpmn.ITMProbe.testing).
+"""
+
+import os
+from ..conf import QMBPMNSiteConf
+from ...common.utils.dataobj import restore_data_object
+from ...common.utils.dataobj import save_data_object
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                          'config')
+
+
+def make_test_conf(data_root, debug=False):
+    """
+    Site configuration with default options, storing all data under
+    data_root (which gets an empty network directory).
+    """
+
+    conf_dict = restore_data_object(os.path.join(CONFIG_DIR, 'default.json'))
+    conf_dict.update(data_root=data_root,
+                     site_root=os.path.join(data_root, 'site'),
+                     debug=debug)
+    for path in (os.path.join(data_root, conf_dict['ITMProbe_network_dir']),
+                 conf_dict['site_root']):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    conf_file = os.path.join(data_root, 'conf.json')
+    save_data_object(conf_dict, conf_file)
+    return conf_file, QMBPMNSiteConf(conf_file, True)
@@ -0,0 +1,132 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+"""Tests of the local job queue."""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from qmbpmn.web import exceptions as exc
+from qmbpmn.web.jobs import JobQueue
+
+
+def _add(x, y):
+    return {'sum': x + y}
+
+
+def _fail():
+    raise exc.ValidationError('x', 'y')
+
+
+def _submit(args):
+    spool_path, user, start_time = args
+    time.sleep(max(start_time - time.time(), 0.0))
+    try:
+        JobQueue(spool_path, 0, 3, 10).submit(_add, (1, 2), user)
+        return True
+    except exc.ServerBusy:
+        return False
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def wait(self, queue, job_id, timeout=30.0):
+        end_time = time.time() + timeout
+        while time.time() < end_time:
+            state = queue.status(job_id)
+            if state['state'] in ('done', 'failed'):
+                return state
+            time.sleep(0.05)
+        self.fail('Job %s did not finish' % job_id)
+
+    def test_run(self):
+        queue = JobQueue(self.tmp_dir)
+        job_id = queue.submit(_add, (2, 3), 'a')
+        state = self.wait(queue, job_id)
+        self.assertEqual(state['state'], 'done')
+        self.assertEqual(state['result'], {'sum': 5})
+        self.assertEqual(state['user'], 'a')
+
+        # The request is removed once the job has finished
+        end_time = time.time() + 5.0
+        while os.listdir(queue.running_path) and time.time() < end_time:
+            time.sleep(0.05)
+        self.assertEqual(os.listdir(queue.running_path), [])
+
+        job_id = queue.submit(_fail, (), 'a')
+        state = self.wait(queue, job_id)
+        self.assertEqual(state['state'], 'failed')
+        self.assertEqual(state['error'], str(exc.ValidationError('x', 'y')))
+
+    def test_limits(self):
+        # Without worker slots, the jobs stay queued
+        queue = JobQueue(self.tmp_dir, 0, 3, 2)
+        job_ids = [queue.submit(_add, (1, 2), 'a') for i in xrange(2)]
+        self.assertEqual(queue.status(job_ids[0])['state'], 'queued')
+        self.assertRaises(exc.TooManyJobs, queue.submit, _add, (1, 2), 'a')
+        queue.submit(_add, (1, 2), 'b')
+        self.assertRaises(exc.ServerBusy, queue.submit, _add, (1, 2), 'c')
+
+    def test_concurrent_submit(self):
+        # All processes submit at the same time
+        pool = multiprocessing.Pool(8)
+        start_time = time.time() + 0.5
+        try:
+            admitted = pool.map(_submit, [(self.tmp_dir, 'u%d' % i, start_time)
+                                          for i in xrange(16)], 1)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(sum(admitted), 3)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp_dir,
+                                                     'queued'))), 3)
+
+    def test_expire(self):
+        queue = JobQueue(self.tmp_dir, 0)
+        queued_id = queue.submit(_add, (1, 2), 'a')
+        job_id = queue.submit(_add, (1, 2), 'b')
+        os.remove(os.path.join(queue.queued_path, '%s.pkl' % job_id))
+        queue.update(job_id, state='done', finished=time.time() - 100.0)
+
+        self.assertEqual(queue.expire(200.0)[0], 0)
+        self.assertEqual(queue.expire(50.0)[0], 1)
+        self.assertTrue(queue.status(job_id) is None)
+        self.assertEqual(queue.expire(0.0)[0], 0)
+        self.assertEqual(queue.status(queued_id)['state'], 'queued')
+
+
+if __name__ == '__main__':
+    unittest.main()
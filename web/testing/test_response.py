@@ -0,0 +1,176 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+"""Tests of conditional and compressed responses."""
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+from qmbpmn import version
+from qmbpmn.web.response import make_etag
+from qmbpmn.web.response import cached_response
+
+HEADERS = ('HTTP_IF_NONE_MATCH', 'HTTP_ACCEPT_ENCODING')
+
+
+def _parse_response(output):
+    head, body = output.split('\n\n', 1)
+    headers = dict(line.split(': ', 1) for line in head.split('\n'))
+    return headers, body
+
+
+class CachedResponseTest(unittest.TestCase):
+
+    body = 'Some report\n' * 100
+
+    def setUp(self):
+        self.saved_environ = dict((key, os.environ.get(key))
+                                  for key in HEADERS)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.etag = make_etag('report', 'ABCD', 'txt')
+        self.num_writes = 0
+
+    def tearDown(self):
+        for key, value in self.saved_environ.iteritems():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_body(self, fp):
+        self.num_writes += 1
+        fp.write(self.body)
+
+    def request(self, if_none_match='', accept_encoding='', **kwargs):
+        os.environ['HTTP_IF_NONE_MATCH'] = if_none_match
+        os.environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        fp = StringIO()
+        cached_response([('Content-Type', 'text/plain')], self.etag,
+                        self._write_body, fp=fp, **kwargs)
+        return _parse_response(fp.getvalue())
+
+    def test_make_etag(self):
+        self.assertEqual(self.etag, make_etag('report', 'ABCD', 'txt'))
+        self.assertNotEqual(self.etag, make_etag('report', 'ABCD', 'csv'))
+        current_version = version.CURRENT_VERSION
+        try:
+            version.CURRENT_VERSION = current_version + '.1'
+            self.assertNotEqual(self.etag, make_etag('report', 'ABCD', 'txt'))
+        finally:
+            version.CURRENT_VERSION = current_version
+
+    def test_identity(self):
+        headers, body = self.request(compress=True)
+        self.assertEqual(headers['ETag'], self.etag)
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertFalse('Content-Encoding' in headers)
+        self.assertEqual(body, self.body)
+
+        headers, body = self.request(self.etag, compress=True)
+        self.assertEqual(headers['Status'], '304 Not Modified')
+        self.assertEqual(headers['ETag'], self.etag)
+        self.assertEqual(body, '')
+        self.assertEqual(self.num_writes, 1)
+
+    def test_gzip(self):
+        headers, body = self.request('', 'gzip, deflate', compress=True)
+        gz_etag = headers['ETag']
+        self.assertEqual(gz_etag, self.etag[:-1] + '-gz"')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(body)).read(),
+                         self.body)
+
+        headers, body = self.request(gz_etag, 'gzip', compress=True)
+        self.assertEqual(headers['Status'], '304 Not Modified')
+        self.assertEqual(headers['ETag'], gz_etag)
+
+        # The tag of one coding does not validate the other
+        headers, body = self.request(self.etag, 'gzip', compress=True)
+        self.assertFalse('Status' in headers)
+        self.assertEqual(headers['ETag'], gz_etag)
+        headers, body = self.request(gz_etag, 'gzip;q=0', compress=True)
+        self.assertFalse('Status' in headers)
+        self.assertEqual(headers['ETag'], self.etag)
+        self.assertEqual(body, self.body)
+
+        headers, body = self.request('"other", *', 'gzip', compress=True)
+        self.assertEqual(headers['Status'], '304 Not Modified')
+
+    def test_uncompressible(self):
+        headers, body = self.request('', 'gzip')
+        self.assertEqual(headers['ETag'], self.etag)
+        self.assertFalse('Content-Encoding' in headers)
+        self.assertFalse('Vary' in headers)
+        self.assertEqual(body, self.body)
+
+    def test_cache_path(self):
+        cache_path = os.path.join(self.tmp_dir, 'report.txt')
+        for i in xrange(2):
+            headers, body = self.request(cache_path=cache_path)
+            self.assertEqual(body, self.body)
+        self.assertEqual(self.num_writes, 1)
+        with open(cache_path, 'rb') as fp:
+            self.assertEqual(fp.read(), self.body)
+
+        # Cached bodies are compressed on the way out as well
+        headers, body = self.request('', 'gzip', cache_path=cache_path,
+                                     compress=True)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(body)).read(),
+                         self.body)
+        self.assertEqual(self.num_writes, 1)
+
+    def test_streaming(self):
+        fp = StringIO()
+        heads = []
+        def _write_body(body_fp):
+            heads.append(fp.getvalue())
+            for i in xrange(10):
+                body_fp.write(self.body)
+
+        os.environ['HTTP_IF_NONE_MATCH'] = ''
+        for coding in ('', 'gzip'):
+            os.environ['HTTP_ACCEPT_ENCODING'] = coding
+            fp.reset()
+            fp.truncate()
+            cached_response([('Content-Type', 'text/plain')], self.etag,
+                            _write_body, compress=True, fp=fp)
+            headers, body = _parse_response(fp.getvalue())
+            # The body is written after the complete headers
+            self.assertEqual(_parse_response(heads[-1])[0], headers)
+            if coding:
+                self.assertEqual(headers['Content-Encoding'], 'gzip')
+                body = gzip.GzipFile(fileobj=StringIO(body)).read()
+            self.assertEqual(body, self.body * 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
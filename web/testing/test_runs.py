@@ -0,0 +1,190 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+"""Tests of the ITM Probe views that do not need networks."""
+
+import os
+import sys
+import json
+import gzip
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from cStringIO import StringIO
+from qmbpmn.ITMProbe import commands
+from qmbpmn.ITMProbe import core
+from qmbpmn.ITMProbe.core.emitting import EmittingAnalysis
+from qmbpmn.ITMProbe.core.bundle import save_bundle
+from qmbpmn.ITMProbe.testing import load_test_graph
+from qmbpmn.ITMProbe.testing import load_test_input
+from qmbpmn.web import exceptions as exc
+from qmbpmn.web.ITMProbe import runs
+from qmbpmn.web.testing import make_test_conf
+
+
+def _gzip_data(data):
+    buf = StringIO()
+    gz_fp = gzip.GzipFile(mode='wb', fileobj=buf)
+    gz_fp.write(data)
+    gz_fp.close()
+    return buf.getvalue()
+
+
+def _report(conn):
+    fp = StringIO()
+    commands.standalone_report(conn, fp)
+    return fp.getvalue()
+
+
+class StandaloneRunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        _, self.conf = make_test_conf(self.tmp_dir)
+        self.saved_history = core.df_history
+        kwargs = load_test_input('emitting_test')
+        kwargs.pop('graph_path')
+        self.input_data = json.dumps(kwargs)
+        graph_fp = StringIO()
+        load_test_graph().tobinary(graph_fp)
+        self.graph_data = graph_fp.getvalue()
+
+        # Record the uploads opened by the view
+        self.uploads = []
+        self.saved = (runs._gzip_upload, commands.standalone_report)
+        def _gzip_upload(upload):
+            fp = self.saved[0](upload)
+            self.uploads.append(fp)
+            return fp
+        runs._gzip_upload = _gzip_upload
+
+    def tearDown(self):
+        runs._gzip_upload, commands.standalone_report = self.saved
+        core.set_df_history(self.saved_history)
+        shutil.rmtree(self.tmp_dir)
+
+    def run_view(self, cgi_map):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            runs.standalone_run(cgi_map, self.conf)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertTrue(len(self.uploads) > 0)
+        self.assertTrue(all(fp.closed for fp in self.uploads))
+        return output.split('\n\n', 1)
+
+    def test_run(self):
+        header, body = self.run_view({'input_data':
+                                      _gzip_data(self.input_data),
+                                      'graph_data':
+                                      StringIO(_gzip_data(self.graph_data))})
+        self.assertEqual(header, 'Content-Type: application/x-gzip')
+        report = gzip.GzipFile(fileobj=StringIO(body)).read()
+
+        conn = commands.standalone_model(StringIO(self.input_data),
+                                         G=load_test_graph())
+        self.assertEqual(report, _report(conn))
+        conn.close()
+
+    def test_bad_input(self):
+        header, body = self.run_view({'input_data': _gzip_data('{"model":'),
+                                      'graph_data':
+                                      _gzip_data(self.graph_data)})
+        self.assertEqual(header, 'Content-Type: text/plain')
+        self.assertEqual(body, 'UNRECOVERABLE ERROR\n')
+
+    def test_failed_report(self):
+        conns = []
+        def _failing_report(conn, out_fp):
+            conns.append(conn)
+            out_fp.write('Partial report\n')
+            raise RuntimeError('Report failed')
+        commands.standalone_report = _failing_report
+
+        header, body = self.run_view({'input_data':
+                                      _gzip_data(self.input_data),
+                                      'graph_data':
+                                      _gzip_data(self.graph_data)})
+        self.assertEqual(header, 'Content-Type: application/x-gzip')
+        # No gzip trailer, so the client sees that the output is incomplete
+        self.assertRaises((IOError, EOFError), gzip.GzipFile(
+            fileobj=StringIO(body)).read)
+        self.assertRaises(sqlite3.ProgrammingError, conns[0].execute,
+                          'SELECT 1')
+
+
+class FanoutReportTest(unittest.TestCase):
+
+    query_id = 'ABCD1234'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        _, self.conf = make_test_conf(self.tmp_dir)
+
+        # A bundle stored by a fanout job
+        storage = runs._get_storage(self.conf)
+        query_path = storage.query_path(self.query_id)
+        itm_path = os.path.join(self.tmp_dir, 'net0.itm')
+        EmittingAnalysis(load_test_graph(), df=0.85,
+                         source_nodes=['CDC42']).save(itm_path)
+        self.bundle_path = os.path.join(query_path, '%s.itm' % self.query_id)
+        save_bundle(self.bundle_path, [('net0', itm_path, []),
+                                       ('net1', None, ['Not evaluated.'])])
+        storage.register(self.query_id)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_view(self, cgi_map):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            runs.fanout_www_model(cgi_map, self.conf)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_stored_report(self):
+        for output_format, content_type in (('txt', 'text/plain'),
+                                            ('csv', 'text/csv')):
+            output = self.run_view({'query_id': self.query_id,
+                                    'output': output_format})
+            header, body = output.split('\n\n', 1)
+            self.assertTrue(header.startswith('Content-Type: %s' % \
+                                              content_type))
+            self.assertTrue('CDC42' in body)
+
+    def test_missing_report(self):
+        self.assertRaises(exc.MissingStoredResults, self.run_view,
+                          {'query_id': 'ABCD0000', 'output': 'txt'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+"""Tests of the storage of query results, jobs and layouts."""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from qmbpmn.web.storage import StorageManager
+from qmbpmn.web.jobs import JobQueue
+from qmbpmn.common.graphics.layout_store import LayoutStore
+from qmbpmn.common.utils.pickling import save_object
+from qmbpmn.common.utils.filesys import file_lock
+
+
+def _add(x, y):
+    return x + y
+
+
+class StorageManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.storage = StorageManager(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def add_query(self, query_id, size, age=0.0):
+        query_path = self.storage.query_path(query_id)
+        for ext in ('itm', 'pkl'):
+            with open(os.path.join(query_path, '%s.%s' % (query_id, ext)),
+                      'wb') as fp:
+                fp.write('x' * size)
+        self.storage.register(query_id)
+        with self.storage._index() as conn:
+            conn.execute('UPDATE artifacts SET atime = ? WHERE query_id = ?',
+                         (time.time() - age, query_id))
+
+    def has_query(self, query_id):
+        return os.path.isdir(self.storage.query_path(query_id, False))
+
+    def add_layouts(self, ages, size=1000):
+        store = LayoutStore(os.path.join(self.tmp_dir, 'layouts'))
+        index = {}
+        for i, age in enumerate(ages):
+            layout_id = 'L%d' % i
+            save_object('x' * size, store.store_path, layout_id)
+            index[layout_id] = {'nodes': frozenset(),
+                                'options': None,
+                                'size': size,
+                                'used': time.time() - age,
+                                }
+        store._write_index(index)
+        return store
+
+    def test_clean_age(self):
+        self.add_query('AA01', 100)
+        self.add_query('AB02', 100, 7200.0)
+        self.assertEqual(self.storage.total_size(), 400)
+        self.assertEqual(self.storage.clean(3600.0), (2, 200))
+        self.assertTrue(self.has_query('AA01'))
+        self.assertFalse(self.has_query('AB02'))
+        self.assertEqual(self.storage.total_size(), 200)
+
+    def test_clean_quota(self):
+        for i, query_id in enumerate(['AA01', 'AB02', 'AC03']):
+            self.add_query(query_id, 100, 100.0 * (3 - i))
+        self.assertEqual(self.storage.clean(quota=350), (4, 400))
+        self.assertEqual([self.has_query(q) for q in ('AA01', 'AB02', 'AC03')],
+                         [False, False, True])
+
+    def test_clean_stores(self):
+        self.add_query('AA01', 100)
+        store = self.add_layouts([0.0, 7200.0])
+        queue = JobQueue(os.path.join(self.tmp_dir, 'jobs'), 0)
+        job_id = queue.submit(_add, (1, 2))
+        os.remove(os.path.join(queue.queued_path, '%s.pkl' % job_id))
+        queue.update(job_id, state='done', finished=time.time() - 7200.0)
+
+        removed_count, removed_size = self.storage.clean(3600.0)
+        self.assertEqual(removed_count, 2)
+        self.assertTrue(removed_size > 1000)
+        self.assertTrue(store.has_layout('L0'))
+        self.assertFalse(store.has_layout('L1'))
+        self.assertEqual(store._read_index().keys(), ['L0'])
+        self.assertTrue(queue.status(job_id) is None)
+        self.assertTrue(self.has_query('AA01'))
+
+    def test_stores_quota(self):
+        # The layouts count toward the quota, so the older query is removed
+        self.add_query('AA01', 100, 200.0)
+        self.add_query('AB02', 100, 100.0)
+        store = self.add_layouts([0.0, 0.0])
+        quota = 400 + store.total_size() - 1
+        self.assertEqual(self.storage.clean(quota=quota), (2, 200))
+        self.assertFalse(self.has_query('AA01'))
+        self.assertTrue(self.has_query('AB02'))
+        self.assertTrue(store.has_layout('L1'))
+
+    def test_discard(self):
+        # A query that failed before it was registered
+        query_path = self.storage.query_path('AA01')
+        with open(os.path.join(query_path, 'AA01.itm'), 'wb') as fp:
+            fp.write('partial')
+        self.assertTrue(self.storage.discard('AA01'))
+        self.assertFalse(self.has_query('AA01'))
+        self.assertFalse(self.storage.discard('AA01'))
+
+        # Registered queries and those being computed are kept
+        self.add_query('AB02', 100)
+        self.assertFalse(self.storage.discard('AB02'))
+        self.assertTrue(self.has_query('AB02'))
+        query_path = self.storage.query_path('AC03')
+        with file_lock(os.path.join(query_path, 'AC03.lock')):
+            self.assertFalse(self.storage.discard('AC03'))
+        self.assertTrue(self.has_query('AC03'))
+
+    def test_rebuild(self):
+        self.add_query('AA01', 100)
+        self.add_layouts([0.0])
+        JobQueue(os.path.join(self.tmp_dir, 'jobs'), 0).submit(_add, (1, 2))
+        self.storage.rebuild()
+        self.assertEqual(self.storage.total_size(), 200)
+        with self.storage._index() as conn:
+            query_ids = [row[0] for row in
+                         conn.execute('SELECT DISTINCT query_id FROM artifacts')]
+        self.assertEqual(query_ids, ['AA01'])
+
+
+if __name__ == '__main__':
+    unittest.main()
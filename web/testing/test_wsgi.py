@@ -0,0 +1,150 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+"""Tests of the WSGI application with views writing CGI output."""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+from cStringIO import StringIO
+from qmbpmn.web import exceptions as exc
+from qmbpmn.web.wsgi import QMBPMNApplication
+from qmbpmn.web.wsgi import STREAM_THRESHOLD
+from qmbpmn.web.testing import make_test_conf
+
+
+def _text_view(cgi_map, conf):
+    sys.stdout.write('Content-Type: text/plain\n\n%s' % cgi_map['text'])
+
+
+def _large_view(cgi_map, conf):
+    sys.stdout.write('Content-Type: text/plain\n\n')
+    for i in xrange(4):
+        sys.stdout.write('x' * STREAM_THRESHOLD)
+
+
+def _environ_view(cgi_map, conf):
+    sys.stdout.write('Content-Type: text/plain\n\n%s' % \
+                     os.environ['REMOTE_ADDR'])
+
+
+def _failing_view(cgi_map, conf):
+    raise exc.ValidationError('text', 'failing')
+
+
+def _enrich_failing_view(cgi_map, conf):
+    e = exc.ValidationError('weights', 'failing')
+    e.error_template = 'enrich/error.html'
+    raise e
+
+
+TEST_VIEWS = {'0': _text_view,
+              '1': _large_view,
+              '2': _environ_view,
+              '3': _failing_view,
+              '4': _enrich_failing_view,
+              }
+
+
+class WSGIApplicationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        conf_file, _ = make_test_conf(self.tmp_dir)
+        self.app = QMBPMNApplication(conf_file)
+        self.app.scripts['test.cgi'] = (TEST_VIEWS, 'ITMProbe/error.html')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def request(self, query, **environ):
+        environ.update({'PATH_INFO': '/test.cgi',
+                        'QUERY_STRING': query,
+                        'REQUEST_METHOD': 'GET',
+                        'wsgi.input': StringIO(),
+                        'wsgi.errors': StringIO(),
+                        })
+        response = {}
+        written = []
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+            return written.append
+        body = self.app(environ, start_response)
+        response['body'] = ''.join(written) + ''.join(body)
+        response['streamed'] = len(written) > 0
+        return response
+
+    def test_response(self):
+        stdout = sys.stdout
+        response = self.request('view=0&text=hello')
+        self.assertTrue(sys.stdout is stdout)
+        self.assertEqual(response['status'], '200 OK')
+        self.assertEqual(response['headers']['Content-Type'], 'text/plain')
+        self.assertEqual(response['headers']['Content-Length'], '5')
+        self.assertEqual(response['body'], 'hello')
+        self.assertFalse(response['streamed'])
+
+    def test_streaming(self):
+        response = self.request('view=1')
+        self.assertTrue(response['streamed'])
+        self.assertEqual(response['body'], 'x' * (4 * STREAM_THRESHOLD))
+        self.assertFalse('Content-Length' in response['headers'])
+
+    def test_environ(self):
+        response = self.request('view=2', REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response['body'], '10.1.2.3')
+
+    def test_error_template(self):
+        response = self.request('view=3')
+        self.assertEqual(response['status'], '200 OK')
+        self.assertTrue('ITM Probe Error' in response['body'])
+        self.assertTrue('is not a valid value' in response['body'])
+
+        response = self.request('view=4')
+        self.assertTrue('SaddleSum Error' in response['body'])
+        self.assertFalse(hasattr(self.app.conf, 'error_template'))
+
+    def test_concurrent_requests(self):
+        results = {}
+        def run(i):
+            results[i] = self.request('view=0&text=%s' % ('%d' % i * 1000))
+        threads = [threading.Thread(target=run, args=(i, ))
+                   for i in xrange(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for i in xrange(8):
+            self.assertEqual(results[i]['body'], '%d' % i * 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -132,6 +132,22 @@ def protein_list_validator(field, val, network, **kwargs):
     protein_list = tokenize_protein_list(val)
     return network.validate_symbols(protein_list, field, ignore_unknown=False)
 
+def network_list_validator(field, val, networks, **kwargs):
+    """
+    Validates a list of network identifiers. Returns the list of the
+    corresponding network files.
+    """
+
+    network_files = []
+    for graph_id in tokenize_protein_list(val):
+        if graph_id not in networks:
+            raise exc.ValidationError(field, graph_id)
+        if networks[graph_id] not in network_files:
+            network_files.append(networks[graph_id])
+    if len(network_files) == 0:
+        raise exc.InsufficientArgsError(field)
+    return network_files
+
 def antisink_map_validator(field, val, network, **kwargs):
     """
     Validates a list of excluded nodes.
@@ -35,17 +35,35 @@ from . import validators as vld
 
 # *** Must import conf into the global jinja_env before doing anything else ***
 
+# Uploads that are passed to views as (seekable) files rather than strings
+FILE_FIELDS = frozenset(['input_data', 'graph_data'])
+
+def _field_value(cgi_field, key):
+
+    if key in FILE_FIELDS:
+        item = cgi_field[key]
+        if isinstance(item, list):
+            item = item[0]
+        if getattr(item, 'file', None) is not None:
+            item.file.seek(0)
+            return item.file
+    return cgi_field.getfirst(key)
+
 def map_cgi_field(cgi_field):
 
     if cgi_field == None:
         raise exc.TooLargeFile()
-    cgi_map = dict( (k, cgi_field.getfirst(k)) for k in cgi_field.keys() )
+    cgi_map = dict( (k, _field_value(cgi_field, k)) for k in cgi_field.keys() )
     return cgi_map
 
 
-def error_view(jinja_env, conf, e):
+def error_view(jinja_env, conf, e, error_template=None):
 
-    tmpl = jinja_env.get_template(conf.error_template)
+    if error_template is None:
+        error_template = conf.error_template
+    # Views may report errors on the pages of another service
+    error_template = getattr(e, 'error_template', error_template)
+    tmpl = jinja_env.get_template(error_template)
     data = tmpl.render(error_msg=e.__str__())
     html_response(data)
 
@@ -55,20 +73,20 @@ def view_dispatcher(cgi_map, conf, views_map):
     view_func(cgi_map, conf)
 
 
-def cgi_response_web_debug(views_map, cgi_field, conf):
+def cgi_response_web_debug(views_map, cgi_field, conf, error_template=None):
 
     jinja_env = get_jinja_env(conf)
     cgi_map = map_cgi_field(cgi_field)
     view_dispatcher(cgi_map, conf, views_map)
 
-def cgi_response_production(views_map, cgi_field, conf):
+def cgi_response_production(views_map, cgi_field, conf, error_template=None):
 
     jinja_env = get_jinja_env(conf)
     try:
         cgi_map = map_cgi_field(cgi_field)
         view_dispatcher(cgi_map, conf, views_map)
     except exc.WebException, e:
-        error_view(jinja_env, conf, e)
+        error_view(jinja_env, conf, e, error_template)
     except:
         e = exc.WebException()
-        error_view(jinja_env, conf, e)
+        error_view(jinja_env, conf, e, error_template)
@@ -0,0 +1,231 @@
+#
+# ===========================================================================
+#
+#                            PUBLIC DOMAIN NOTICE
+#               National Center for Biotechnology Information
+#
+#  This software/database is a "United States Government Work" under the
+#  terms of the United States Copyright Act.  It was written as part of
+#  the author's official duties as a United States Government employee and
+#  thus cannot be copyrighted.  This software/database is freely available
+#  to the public for use. The National Library of Medicine and the U.S.
+#  Government have not placed any restriction on its use or reproduction.
+#
+#  Although all reasonable efforts have been taken to ensure the accuracy
+#  and reliability of the software and data, the NLM and the U.S.
+#  Government do not and cannot warrant the performance or results that
+#  may be obtained by using this software or data. The NLM and the U.S.
+#  Government disclaim all warranties, express or implied, including
+#  warranties of performance, merchantability or fitness for any particular
+#  purpose.
+#
+#  Please cite the author in any work or product based on this material.
+#
+# ===========================================================================
+#
+# Code author:  Aleksandar Stojmirovic
+#
+
+
+"""
+WSGI application running the ITM Probe and SaddleSum views in-process.
+
+The views are written as CGI scripts, printing the headers and the response
+to standard output. Here, the output of each request is captured and
+converted into a WSGI response, so that the networks, gene indexes and
+templates are loaded only once for all requests. Large responses are passed
+on to the server while they are written rather than collected first.
+
+Since the views write to sys.stdout and read the request headers from
+os.environ, a process runs one view at a time. For concurrent requests,
+run the application in several processes (e.g. mod_wsgi daemon processes).
+"""
+
+import os
+import sys
+import cgi
+import mimetypes
+import posixpath
+import threading
+import traceback
+from cStringIO import StringIO
+from .conf import QMBPMNSiteConf
+from .view_wrappers import cgi_response_web_debug
+from .view_wrappers import cgi_response_production
+from ..common.utils.jinjaenv import get_jinja_env
+from .ITMProbe import runs as ITMProbe_runs
+from .SaddleSum import runs as SaddleSum_runs
+
+# Same limit on the size of uploaded data as in CGI scripts
+cgi.maxlen = 1 << 21
+
+# Size of view output after which the response is streamed
+STREAM_THRESHOLD = 1 << 16
+
+
+class ViewOutput(object):
+    """
+    Collects the output of a view. Once it exceeds stream_threshold (and
+    the headers are complete), the response is started and the rest of
+    the output is passed to the server as it is written.
+    """
+
+    def __init__(self, start_response, stream_threshold=STREAM_THRESHOLD):
+
+        self.start_response = start_response
+        self.stream_threshold = stream_threshold
+        self._buffer = StringIO()
+        self._size = 0
+        self._write = None
+
+    @property
+    def streaming(self):
+        return self._write is not None
+
+    def write(self, data):
+
+        if self._write is not None:
+            if data:
+                self._write(data)
+            return
+        self._buffer.write(data)
+        self._size += len(data)
+        if self._size > self.stream_threshold:
+            output = self._buffer.getvalue()
+            if output.find('\n\n') < 0:
+                # No headers yet - the response is not streamed
+                self.stream_threshold = float('inf')
+                return
+            status, headers, body = _parse_cgi_output(output)
+            self._buffer = None
+            self._write = self.start_response(status, headers)
+            self._write(body)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return self._buffer.getvalue()
+
+
+def _parse_cgi_output(output):
+    """
+    Splits the output of a CGI view into status, headers and body.
+    """
+
+    header_end = output.find('\n\n')
+    if header_end < 0:
+        return '500 Internal Server Error', \
+               [('Content-Type', 'text/plain')], 'Malformed response\n'
+
+    status = '200 OK'
+    headers = []
+    for line in output[:header_end].split('\n'):
+        name, value = line.rstrip('\r').split(':', 1)
+        if name.lower() == 'status':
+            status = value.strip()
+        else:
+            headers.append((name, value.strip()))
+    return status, headers, output[header_end+2:]
+
+
+class QMBPMNApplication(object):
+    """
+    Dispatches requests for ITMProbe.cgi and enrich.cgi to the respective
+    views and serves all other paths as static files from the site root.
+    All networks and templates are loaded on construction.
+    """
+
+    def __init__(self, conf_file_json, site_root=None):
+
+        self.conf = QMBPMNSiteConf(conf_file_json, True)
+        if site_root is None:
+            site_root = self.conf.site_root
+        self.site_root = os.path.abspath(site_root)
+
+        if self.conf.debug:
+            self.response = cgi_response_web_debug
+        else:
+            self.response = cgi_response_production
+        self.scripts = {'ITMProbe.cgi': (ITMProbe_runs.VIEWS,
+                                         'ITMProbe/error.html'),
+                        'enrich.cgi': (SaddleSum_runs.VIEWS,
+                                       'enrich/error.html'),
+                        }
+
+        self._view_lock = threading.Lock()
+        jinja_env = get_jinja_env(self.conf)
+        for name in jinja_env.list_templates(extensions=['html']):
+            jinja_env.get_template(name)
+        ITMProbe_runs.preload_data(self.conf)
+
+    def __call__(self, environ, start_response):
+
+        path = environ.get('PATH_INFO', '/')
+        script = posixpath.basename(path)
+        if script in self.scripts:
+            return self._run_view(environ, start_response, script)
+        return self._serve_file(environ, start_response, path)
+
+    def _run_view(self, environ, start_response, script):
+
+        views_map, error_template = self.scripts[script]
+
+        try:
+            cgi_field = cgi.FieldStorage(fp=environ['wsgi.input'],
+                                         environ=environ)
+        except ValueError:
+            cgi_field = None
+
+        output = ViewOutput(start_response)
+        with self._view_lock:
+            # Client address and caching headers, as seen by CGI scripts
+            # (used by the job queue and for conditional and compressed
+            # responses)
+            for key in ('REMOTE_ADDR', 'HTTP_IF_NONE_MATCH',
+                        'HTTP_ACCEPT_ENCODING'):
+                os.environ[key] = environ.get(key, '')
+            saved_stdout = sys.stdout
+            sys.stdout = output
+            try:
+                self.response(views_map, cgi_field, self.conf, error_template)
+            except Exception:
+                environ['wsgi.errors'].write(traceback.format_exc())
+                if output.streaming:
+                    return []
+                start_response('500 Internal Server Error',
+                               [('Content-Type', 'text/plain')])
+                return ['Internal Server Error\n']
+            finally:
+                sys.stdout = saved_stdout
+        if output.streaming:
+            return []
+        status, headers, body = _parse_cgi_output(output.getvalue())
+
+        headers.append(('Content-Length', str(len(body))))
+        start_response(status, headers)
+        return [body]
+
+    def _serve_file(self, environ, start_response, path):
+
+        full_path = os.path.normpath(os.path.join(self.site_root,
+                                                  path.lstrip('/')))
+        if os.path.isdir(full_path):
+            full_path = os.path.join(full_path, 'index.html')
+        if not full_path.startswith(self.site_root + os.sep) or \
+               not os.path.isfile(full_path):
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return ['Not Found\n']
+
+        content_type = mimetypes.guess_type(full_path)[0]
+        if content_type is None:
+            content_type = 'application/octet-stream'
+        with open(full_path, 'rb') as fp:
+            data = fp.read()
+        start_response('200 OK', [('Content-Type', content_type),
+                                  ('Content-Length', str(len(data)))])
+        return [data]